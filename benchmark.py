@@ -0,0 +1,951 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks de desempenho do sistema da loja.
+
+Cada benchmark grava seus dados em um banco temporário, descartado ao final, e
+imprime os resultados no terminal. Uso:
+
+    python benchmark.py wal --segundos 5 --leitores 4
+    python benchmark.py planos
+    python benchmark.py busca --produtos 200000
+    python benchmark.py digitacao --produtos 200000
+    python benchmark.py codigo_barras --produtos 200000
+    python benchmark.py venda_grande --linhas 300
+    python benchmark.py resumos --anos 3 --vendas-dia 500
+    python benchmark.py streaming --movimentacoes 300000
+    python benchmark.py excel --movimentacoes 1000000
+    python benchmark.py pdf --linhas 50000 --processos 4
+    python benchmark.py recibos --vendas 5000 --processos 4
+    python benchmark.py detalhado --vendas 20000
+    python benchmark.py estoque_data --anos 3 --movimentacoes-dia 2000
+    python benchmark.py grupo --produtores 16 --segundos 5
+    python benchmark.py servidor --terminais 1 4 16 --segundos 5
+    python benchmark.py diario --vendas 300 --bloqueio-ms 200 --importar 5000
+    python benchmark.py importacao --produtos 150000
+    python benchmark.py reajuste --produtos 250000
+"""
+import argparse
+import csv
+import datetime
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import openpyxl
+
+import cliente
+import diario
+import database as db
+import importacao
+import recibo
+import relatorio
+
+try:
+    import resource # Só em sistemas Unix: pico de memória do processo
+except ImportError:
+    resource = None
+
+# --- Utilitários ---
+
+def preparar_banco(diretorio, nome_arquivo='bench.db', produtos=1000, movimentacoes=0, modo_wal=False):
+    """Cria um banco de benchmark com produtos (e opcionalmente movimentações) sintéticos."""
+    caminho = os.path.join(diretorio, nome_arquivo)
+    db.configurar_banco(caminho, modo_wal=modo_wal)
+    db.criar_tabelas()
+    with db.transacao_escrita() as conn:
+        conn.executemany('''INSERT INTO produtos (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         ((f"789{i:010d}", f"Produto {i}", 1.0, 2.5, 10**9, f"Fornecedor {i % 50}", 5)
+                          for i in range(1, produtos + 1)))
+        conn.executemany('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, motivo, usuario_id)
+                         VALUES (?, 'entrada', ?, 'Carga benchmark', 1)''',
+                         ((random.randint(1, produtos), random.randint(1, 50)) for _ in range(movimentacoes)))
+    return caminho
+
+def itens_aleatorios(produtos, linhas=3):
+    """Monta um carrinho com produtos aleatórios no formato usado por registrar_venda."""
+    return [{"produto_id": pid, "nome": f"Produto {pid}", "quantidade": 1, "preco": 2.5}
+            for pid in random.sample(range(1, produtos + 1), linhas)]
+
+# --- Benchmark: WAL x journal padrão ---
+
+def bench_wal(args):
+    """Mede vendas/segundo enquanto relatórios de movimentação rodam em paralelo."""
+    resultados = {}
+    for modo_wal in (False, True):
+        diretorio = tempfile.mkdtemp(prefix="bench_wal_")
+        try:
+            preparar_banco(diretorio, produtos=args.produtos, movimentacoes=args.movimentacoes, modo_wal=modo_wal)
+            parar = threading.Event()
+            relatorios = [0] * args.leitores
+
+            def leitor(indice):
+                while not parar.is_set():
+                    db.obter_movimentacoes_estoque("2000-01-01", "2100-12-31")
+                    relatorios[indice] += 1
+
+            threads = [threading.Thread(target=leitor, args=(i,), daemon=True) for i in range(args.leitores)]
+            for t in threads:
+                t.start()
+
+            vendas = falhas = 0
+            fim = time.perf_counter() + args.segundos
+            while time.perf_counter() < fim:
+                if db.registrar_venda(1, "Dinheiro", 1, 7.5, itens_aleatorios(args.produtos)):
+                    vendas += 1
+                else:
+                    falhas += 1
+            parar.set()
+            for t in threads:
+                t.join()
+
+            nome = "WAL" if modo_wal else "journal padrão"
+            resultados[nome] = vendas / args.segundos
+            print(f"{nome:>15}: {vendas / args.segundos:8.1f} vendas/s | {sum(relatorios)} relatórios | {falhas} falhas")
+        finally:
+            db.fechar_conexoes()
+            shutil.rmtree(diretorio, ignore_errors=True)
+    return resultados
+
+# --- Benchmark: busca de produtos (LIKE x FTS5) ---
+
+PALAVRAS_PRODUTOS = ["Café", "Açúcar", "Arroz", "Feijão", "Macarrão", "Óleo", "Leite", "Pão", "Manteiga",
+                     "Sabão", "Detergente", "Biscoito", "Refrigerante", "Suco", "Água", "Farinha",
+                     "Integral", "Tradicional", "Orgânico", "Light", "Premium", "Limão", "Maçã", "Coco"]
+
+def bench_busca(args):
+    """Compara a busca antiga (LIKE '%termo%') com listar_produtos via FTS5."""
+    diretorio = tempfile.mkdtemp(prefix="bench_busca_")
+    try:
+        caminho = preparar_banco(diretorio, produtos=0)
+        with db.transacao_escrita() as conn:
+            conn.executemany('''INSERT INTO produtos (codigo_barras, nome, preco_venda, estoque) VALUES (?, ?, 2.5, 10)''',
+                             ((f"789{i:010d}", " ".join(random.sample(PALAVRAS_PRODUTOS, 3)) + f" {i % 900 + 100}g")
+                              for i in range(1, args.produtos + 1)))
+        print(f"{args.produtos} produtos em {caminho}")
+        termos = ["cafe", "acucar org", "limao", "7890000012", "feij trad"]
+        with db.conexao() as conn:
+            for termo in termos:
+                inicio = time.perf_counter()
+                antigos = conn.execute("SELECT * FROM produtos WHERE nome LIKE ? OR codigo_barras LIKE ? ORDER BY nome",
+                                       ('%' + termo + '%', '%' + termo + '%')).fetchall()
+                tempo_like = time.perf_counter() - inicio
+                inicio = time.perf_counter()
+                novos = db.listar_produtos(termo)
+                tempo_fts = time.perf_counter() - inicio
+                print(f"{termo!r:>14}: LIKE {tempo_like * 1000:8.1f} ms ({len(antigos)} linhas) | "
+                      f"FTS5 {tempo_fts * 1000:8.1f} ms ({len(novos)} linhas, limite {db.LIMITE_BUSCA})")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+def bench_digitacao(args):
+    """Tempo por tecla da busca incremental: consulta ao banco ou refinamento em memória."""
+    diretorio = tempfile.mkdtemp(prefix="bench_digitacao_")
+    try:
+        preparar_banco(diretorio, produtos=0)
+        with db.transacao_escrita() as conn:
+            conn.executemany('''INSERT INTO produtos (codigo_barras, nome, preco_venda, estoque) VALUES (?, ?, 2.5, 10)''',
+                             ((f"789{i:010d}", " ".join(random.sample(PALAVRAS_PRODUTOS, 3)) + f" {i % 900 + 100}g")
+                              for i in range(1, args.produtos + 1)))
+        print(f"{args.produtos} produtos")
+        tempos = []
+        for frase in ["cafe torrado", "acucar organico", "feijao carioca", "789000001"]:
+            anterior = None # (termo, produtos) da tecla anterior, como em tarefas.BuscaIncremental
+            for fim in range(1, len(frase) + 1):
+                termo = frase[:fim].strip()
+                inicio = time.perf_counter()
+                if anterior and termo.startswith(anterior[0]) and len(anterior[1]) < db.LIMITE_BUSCA:
+                    produtos, origem = db.filtrar_produtos(anterior[1], termo), "memória"
+                else:
+                    produtos, origem = db.listar_produtos(termo), "banco"
+                tempo = (time.perf_counter() - inicio) * 1000
+                tempos.append(tempo)
+                anterior = (termo, produtos)
+                print(f"{termo!r:>20}: {tempo:7.2f} ms ({origem}, {len(produtos)} produtos)")
+        print(f"Por tecla: média {sum(tempos) / len(tempos):.2f} ms | p95 {percentil(tempos, 0.95):.2f} ms | "
+              f"máx {max(tempos):.2f} ms")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: leitura de código de barras no caixa ---
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def bench_codigo_barras(args):
+    """Mede o tempo de buscar_produto_por_codigo_barras com o cache frio e quente."""
+    diretorio = tempfile.mkdtemp(prefix="bench_codigo_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+        codigos = [f"789{random.randint(1, args.produtos):010d}" for _ in range(args.leituras)]
+        db.invalidar_cache_produtos()
+        for rotulo in ("cache frio", "cache quente"):
+            tempos = []
+            for codigo in codigos:
+                inicio = time.perf_counter()
+                produto = db.buscar_produto_por_codigo_barras(codigo)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+                assert produto is not None
+            print(f"{rotulo:>12}: média {sum(tempos) / len(tempos):.3f} ms | p99 {percentil(tempos, 0.99):.3f} ms | "
+                  f"máx {max(tempos):.3f} ms")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: finalização de vendas com muitas linhas ---
+
+def bench_venda_grande(args):
+    """Mede o tempo de registrar_venda para pedidos de atacado com muitas linhas."""
+    diretorio = tempfile.mkdtemp(prefix="bench_venda_")
+    try:
+        preparar_banco(diretorio, produtos=max(args.produtos, args.linhas))
+        tempos = []
+        for _ in range(args.vendas):
+            itens = itens_aleatorios(max(args.produtos, args.linhas), args.linhas)
+            inicio = time.perf_counter()
+            assert db.registrar_venda(1, "Dinheiro", 1, 2.5 * args.linhas, itens)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        print(f"{args.linhas} linhas/venda: média {sum(tempos) / len(tempos):.2f} ms | máx {max(tempos):.2f} ms "
+              f"({args.vendas} vendas)")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: relatórios a partir dos resumos diários ---
+
+def bench_resumos(args):
+    """Produtos mais vendidos em vários anos: agregação das vendas x resumo diário."""
+    diretorio = tempfile.mkdtemp(prefix="bench_resumos_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+        inicio_historico = datetime.date.today() - datetime.timedelta(days=365 * args.anos)
+        dias = 365 * args.anos
+        with db.transacao_escrita() as conn:
+            for dia in range(dias):
+                data = inicio_historico + datetime.timedelta(days=dia)
+                vendas = [(f"{data} {random.randint(8, 21):02d}:{random.randint(0, 59):02d}:00",
+                           random.choice(("Dinheiro", "Débito", "Crédito"))) for _ in range(args.vendas_dia)]
+                primeiro_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM vendas").fetchone()[0]
+                conn.executemany("INSERT INTO vendas (data_hora, usuario_id, forma_pagamento, parcelas, total) VALUES (?, 1, ?, 1, 7.5)",
+                                 vendas)
+                conn.executemany("INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario) VALUES (?, ?, 1, 2.5)",
+                                 ((venda_id, random.randint(1, args.produtos))
+                                  for venda_id in range(primeiro_id, primeiro_id + len(vendas)) for _ in range(3)))
+        inicio = time.perf_counter()
+        linhas_resumo = db.reconstruir_resumos_vendas()
+        tempo_reconstrucao = time.perf_counter() - inicio
+        with db.conexao() as conn:
+            itens = conn.execute("SELECT COUNT(*) FROM itens_venda").fetchone()[0]
+        print(f"{itens} itens de venda em {dias} dias | resumo diário: {linhas_resumo} linhas "
+              f"(reconstruído em {tempo_reconstrucao:.1f} s)")
+
+        data_inicio, data_fim = str(inicio_historico), str(datetime.date.today())
+
+        def mais_vendidos_agregando():
+            with db.conexao() as conn:
+                return conn.execute('''SELECT p.nome, SUM(iv.quantidade) as total_vendido
+                                    FROM itens_venda iv
+                                    JOIN vendas v ON iv.venda_id = v.id
+                                    JOIN produtos p ON iv.produto_id = p.id
+                                    WHERE v.data_hora BETWEEN ? AND ?
+                                    GROUP BY p.id, p.nome
+                                    ORDER BY total_vendido DESC
+                                    LIMIT 10''', (data_inicio, f"{data_fim} 23:59:59")).fetchall()
+
+        def melhor_tempo(funcao, *parametros, repeticoes=3):
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                resultado = funcao(*parametros)
+                tempos.append(time.perf_counter() - inicio)
+            return resultado, min(tempos)
+
+        antigos, tempo_antigo = melhor_tempo(mais_vendidos_agregando)
+        novos, tempo_novo = melhor_tempo(db.obter_produtos_mais_vendidos, data_inicio, data_fim)
+        totais, tempo_totais = melhor_tempo(db.obter_totais_periodo, data_inicio, data_fim)
+        assert [r["total_vendido"] for r in antigos] == [r["total_vendido"] for r in novos]
+        print(f"Mais vendidos ({args.anos} anos): vendas {tempo_antigo * 1000:.1f} ms | resumo {tempo_novo * 1000:.1f} ms")
+        print(f"Totais por pagamento: {tempo_totais * 1000:.1f} ms "
+              f"({sum(t['quantidade_vendas'] for t in totais)} vendas)")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: relatórios em streaming ---
+
+def bench_streaming(args):
+    """Tempo e pico de memória para percorrer um ano de movimentações: dicts x tuplas em lotes x páginas."""
+    diretorio = tempfile.mkdtemp(prefix="bench_streaming_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos, movimentacoes=args.movimentacoes)
+        with db.transacao_escrita() as conn: # Espalha as movimentações por ~1 ano
+            passo = max(1, 365 * 86400 // args.movimentacoes)
+            conn.execute("UPDATE movimentacoes_estoque SET data_hora = datetime('now', printf('-%d seconds', id * ?))",
+                         (passo,))
+        periodo = ("2000-01-01", "2100-12-31")
+        casos = {
+            "lista de dicts (obter_*)": lambda: len(db.obter_movimentacoes_estoque(*periodo)),
+            "tuplas em lotes (iterar_*)": lambda: sum(1 for _ in db.iterar_movimentacoes_estoque(*periodo)),
+            "páginas por chave (percorrer_paginas)":
+                lambda: sum(1 for _ in db.percorrer_paginas(db.pagina_movimentacoes_estoque, *periodo)),
+        }
+        for nome, funcao in casos.items():
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            linhas = funcao()
+            tempo = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{nome}: {linhas} linhas em {tempo * 1000:.0f} ms | pico {pico / 2**20:.1f} MB")
+
+        inicio = time.perf_counter()
+        _, apos = db.pagina_movimentacoes_estoque(*periodo)
+        for _ in range(args.paginas):
+            _, apos = db.pagina_movimentacoes_estoque(*periodo, apos=apos)
+        print(f"Página seguinte (tela): {(time.perf_counter() - inicio) * 1000 / (args.paginas + 1):.2f} ms")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: exportação para Excel ---
+
+def bench_excel(args):
+    """Exporta um relatório de movimentações grande para .xlsx direto do banco (em streaming)."""
+    diretorio = tempfile.mkdtemp(prefix="bench_excel_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos, movimentacoes=args.movimentacoes)
+        memoria_antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+        colunas = ("Data/Hora", "Produto", "Tipo", "Quantidade", "Motivo", "Usuário")
+        linhas = db.percorrer_paginas(db.pagina_movimentacoes_estoque, "2000-01-01", "2100-12-31")
+        arquivo = os.path.join(diretorio, "movimentacoes.xlsx")
+        inicio = time.perf_counter()
+        if not relatorio.exportar_para_excel("Movimentações de Estoque", colunas, linhas, arquivo):
+            print("Falha ao exportar.")
+            return
+        tempo = time.perf_counter() - inicio
+        print(f"{args.movimentacoes} linhas em {tempo:.1f} s ({args.movimentacoes / tempo:.0f} linhas/s), "
+              f"arquivo de {os.path.getsize(arquivo) / 2**20:.1f} MB")
+        if resource: # ru_maxrss em KB no Linux
+            memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(f"Pico de memória do processo: {memoria / 1024:.0f} MB "
+                  f"(+{(memoria - memoria_antes) / 1024:.0f} MB durante a exportação)")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: exportação para PDF ---
+
+def bench_pdf(args):
+    """Gera o PDF de um relatório de vendas grande (tabela, truncamento e arquivo final)."""
+    diretorio = tempfile.mkdtemp(prefix="bench_pdf_")
+    try:
+        usuarios = ("Administrador", "Maria Aparecida dos Santos Oliveira", "João")
+        formas = ("Dinheiro", "Cartão de Crédito Parcelado", "PIX")
+        inicio_periodo = datetime.datetime(2024, 1, 1)
+        linhas = [(i, str(inicio_periodo + datetime.timedelta(minutes=7 * i)), random.choice(usuarios),
+                   random.choice(formas), random.randint(1, 12), random.uniform(1, 5000))
+                  for i in range(1, args.linhas + 1)]
+        colunas = ("ID Venda", "Data/Hora", "Usuário", "Pagamento", "Parcelas", "Total")
+        for processos in sorted({1, args.processos}):
+            arquivo = os.path.join(diretorio, f"vendas_{processos}.pdf")
+            inicio = time.perf_counter()
+            if not relatorio.exportar_para_pdf("Vendas por Período", colunas, linhas, arquivo, processos=processos):
+                print("Falha ao gerar o PDF.")
+                return
+            tempo = time.perf_counter() - inicio
+            print(f"{processos} processo(s): {args.linhas} linhas em {tempo:.2f} s ({args.linhas / tempo:.0f} linhas/s), "
+                  f"arquivo de {os.path.getsize(arquivo) / 2**20:.1f} MB")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: regeneração de recibos ---
+
+def bench_recibos(args):
+    """Recibos de vendas antigas: uma consulta de itens por venda x vendas e itens numa consulta, em processos."""
+    diretorio = tempfile.mkdtemp(prefix="bench_recibos_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+        inicio_periodo = datetime.datetime(2024, 1, 1)
+        with db.transacao_escrita() as conn:
+            conn.executemany("INSERT INTO vendas (data_hora, usuario_id, forma_pagamento, parcelas, total) VALUES (?, 1, ?, ?, 7.5)",
+                             ((str(inicio_periodo + datetime.timedelta(minutes=5 * i)), random.choice(("Dinheiro", "Crédito")),
+                               random.randint(1, 6)) for i in range(args.vendas)))
+            conn.execute('''INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario)
+                         SELECT v.id, (v.id * 7 + n.n) % ? + 1, 1, 2.5
+                         FROM vendas v, (SELECT 0 AS n UNION ALL SELECT 1 UNION ALL SELECT 2) n''', (args.produtos,))
+        periodo = ("2000-01-01", "2100-12-31")
+
+        pasta_antiga = os.path.join(diretorio, "uma_por_venda")
+        inicio = time.perf_counter()
+        with open(os.devnull, "w") as nulo:
+            saida, sys.stdout = sys.stdout, nulo # gerar_recibo imprime uma linha por recibo
+            try:
+                for venda in db.obter_vendas_por_periodo(*periodo):
+                    itens = [{"nome": item["nome"], "quantidade": item["quantidade"], "preco": item["preco_unitario"]}
+                             for item in db.obter_itens_venda(venda["id"])]
+                    dados_venda = {"data_hora": venda["data_hora"], "usuario_nome": venda["usuario"],
+                                   "forma_pagamento": venda["forma_pagamento"], "parcelas": venda["parcelas"]}
+                    recibo.gerar_recibo(venda["id"], dados_venda, itens, "pdf", pasta_antiga)
+            finally:
+                sys.stdout = saida
+        tempo_antigo = time.perf_counter() - inicio
+        print(f"Uma consulta de itens por venda, 1 processo: {args.vendas} recibos em {tempo_antigo:.1f} s")
+
+        pasta_nova = os.path.join(diretorio, "em_lote")
+        for rodada in ("regerar_recibos", "regerar_recibos de novo (todos existem)"):
+            inicio = time.perf_counter()
+            gerados, pulados, falhas = recibo.regerar_recibos(db.iterar_vendas_com_itens(*periodo), "pdf", pasta_nova,
+                                                              args.processos)
+            tempo = time.perf_counter() - inicio
+            print(f"{rodada}, {args.processos} processo(s): {gerados} gerados, {pulados} pulados, "
+                  f"{len(falhas)} falhas em {tempo:.1f} s")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: vendas com itens ---
+
+def bench_detalhado(args):
+    """Relatório de vendas com itens: consultas e tempo com obter_itens_venda por venda x em lote."""
+    diretorio = tempfile.mkdtemp(prefix="bench_detalhado_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+        inicio_periodo = datetime.datetime(2024, 1, 1)
+        with db.transacao_escrita() as conn:
+            conn.executemany("INSERT INTO vendas (data_hora, usuario_id, forma_pagamento, parcelas, total) VALUES (?, 1, 'Dinheiro', 1, 7.5)",
+                             ((str(inicio_periodo + datetime.timedelta(minutes=5 * i)),) for i in range(args.vendas)))
+            conn.execute('''INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario)
+                         SELECT v.id, (v.id * 7 + n.n) % ? + 1, 1, 2.5
+                         FROM vendas v, (SELECT 0 AS n UNION ALL SELECT 1 UNION ALL SELECT 2) n''', (args.produtos,))
+        periodo = ("2000-01-01", "2100-12-31")
+
+        def uma_por_venda():
+            return [(venda, db.obter_itens_venda(venda["id"])) for venda in db.obter_vendas_por_periodo(*periodo)]
+
+        casos = {
+            "obter_itens_venda por venda": uma_por_venda,
+            "obter_itens_vendas_por_periodo": lambda: db.obter_itens_vendas_por_periodo(*periodo),
+            "relatório detalhado (percorrer_paginas)":
+                lambda: list(db.percorrer_paginas(db.pagina_vendas_itens_por_periodo, *periodo)),
+            "primeira página da tela": lambda: db.pagina_vendas_itens_por_periodo(*periodo),
+        }
+        for nome, funcao in casos.items():
+            inicio = time.perf_counter()
+            consultas = len(capturar_consultas(funcao))
+            print(f"{nome}: {consultas} consultas em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: commit em grupo de vendas ---
+
+def bench_grupo(args):
+    """Vendas/s com N produtores: uma transação por venda x FilaVendas (commits em grupo)."""
+    for modo_wal in (False, True):
+        diretorio = tempfile.mkdtemp(prefix="bench_grupo_")
+        try:
+            preparar_banco(diretorio, produtos=args.produtos, modo_wal=modo_wal)
+            for em_grupo in (False, True):
+                fila = db.iniciar_fila_vendas(args.lote, args.espera_ms / 1000) if em_grupo else None
+                parar = threading.Event()
+                latencias = [[] for _ in range(args.produtores)]
+
+                def produtor(tempos):
+                    while not parar.is_set():
+                        itens = itens_aleatorios(args.produtos)
+                        inicio = time.perf_counter()
+                        if db.registrar_venda(1, "Dinheiro", 1, 7.5, itens):
+                            tempos.append(time.perf_counter() - inicio)
+
+                threads = [threading.Thread(target=produtor, args=(latencias[i],), daemon=True)
+                           for i in range(args.produtores)]
+                for t in threads:
+                    t.start()
+                time.sleep(args.segundos)
+                parar.set()
+                for t in threads:
+                    t.join()
+                db.encerrar_fila_vendas()
+                todas = [latencia for lista in latencias for latencia in lista]
+                nome = "WAL" if modo_wal else "journal padrão"
+                modo = "commit em grupo" if em_grupo else "uma transação por venda"
+                lotes = f" | {len(todas) / max(1, fila.estatisticas['lotes']):.1f} vendas/commit" if em_grupo else ""
+                print(f"{nome:>15}, {modo:>23}: {len(todas) / args.segundos:8.1f} vendas/s | "
+                      f"p50 {percentil(todas, 0.5) * 1000:6.2f} ms | p95 {percentil(todas, 0.95) * 1000:6.2f} ms{lotes}")
+        finally:
+            db.encerrar_fila_vendas()
+            db.fechar_conexoes()
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: servidor com vários caixas ---
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def bench_servidor(args):
+    """Vendas/s sustentadas pelo servidor com N caixas simulados (leitura de códigos + venda)."""
+    diretorio = tempfile.mkdtemp(prefix="bench_servidor_")
+    processo = None
+    try:
+        caminho = preparar_banco(diretorio, produtos=args.produtos)
+        db.fechar_conexoes() # O banco passa a ser do processo do servidor
+        porta = _porta_livre()
+        processo = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor.py"),
+                                     "--porta", str(porta), "--banco", caminho, "--wal",
+                                     "--trabalhadores", str(args.trabalhadores)],
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        remoto = cliente.ClienteLoja(f"127.0.0.1:{porta}")
+        for _ in range(100):
+            try:
+                remoto.saude()
+                break
+            except cliente.ErroServidor:
+                time.sleep(0.1)
+        else:
+            print("O servidor não respondeu.")
+            return
+
+        def caixa(lote, parar, latencias):
+            while not parar.is_set():
+                itens = itens_aleatorios(args.produtos)
+                codigos = [f"789{item['produto_id']:010d}" for item in itens]
+                inicio = time.perf_counter()
+                if lote:
+                    remoto.lote([("buscar_produto_por_codigo_barras", [codigo], {}) for codigo in codigos])
+                else:
+                    for codigo in codigos:
+                        remoto.buscar_produto_por_codigo_barras(codigo)
+                remoto.registrar_venda(1, "Dinheiro", 1, 7.5, itens)
+                latencias.append(time.perf_counter() - inicio)
+            remoto.fechar()
+
+        print(f"Servidor com {args.trabalhadores} trabalhadores; cada venda = 3 leituras de código de barras + registrar_venda")
+        for terminais in args.terminais:
+            for lote in (False, True):
+                parar = threading.Event()
+                latencias = [[] for _ in range(terminais)]
+                threads = [threading.Thread(target=caixa, args=(lote, parar, latencias[i]), daemon=True)
+                           for i in range(terminais)]
+                for t in threads:
+                    t.start()
+                time.sleep(args.segundos)
+                parar.set()
+                for t in threads:
+                    t.join()
+                todas = [latencia for lista in latencias for latencia in lista]
+                modo = "leituras em lote" if lote else "uma requisição por chamada"
+                print(f"{terminais:3d} caixa(s), {modo:>26}: {len(todas) / args.segundos:8.1f} vendas/s | "
+                      f"p50 {percentil(todas, 0.5) * 1000:6.2f} ms | p95 {percentil(todas, 0.95) * 1000:6.2f} ms")
+    finally:
+        if processo is not None:
+            processo.terminate()
+            saida, _ = processo.communicate(timeout=30)
+            print(saida.strip().splitlines()[-1] if saida.strip() else "")
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: diário local de vendas ---
+
+def bench_diario(args):
+    """Tempo até o caixa ficar livre com o banco ocupado, e importação em lote do diário x vendas uma a uma."""
+    diretorio = tempfile.mkdtemp(prefix="bench_diario_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+
+        # 1) Outro processo segura a escrita do banco (importação, fechamento, compartilhamento lento)
+        parar = threading.Event()
+
+        def ocupar_banco():
+            while not parar.wait(args.intervalo_ms / 1000):
+                with db.transacao_escrita():
+                    time.sleep(args.bloqueio_ms / 1000)
+
+        print(f"Banco bloqueado por {args.bloqueio_ms:.0f} ms a cada {args.intervalo_ms + args.bloqueio_ms:.0f} ms; "
+              f"{args.vendas} vendas seguidas em um caixa")
+        for com_diario in (False, True):
+            vendas = diario.DiarioVendas(os.path.join(diretorio, "caixa.jsonl"), "bench") if com_diario else None
+            sincronizador = diario.SincronizadorVendas(vendas, db, intervalo=0.2).iniciar() if com_diario else None
+            parar.clear()
+            ocupante = threading.Thread(target=ocupar_banco, daemon=True)
+            ocupante.start()
+            latencias = []
+            for _ in range(args.vendas):
+                itens = itens_aleatorios(args.produtos)
+                inicio = time.perf_counter()
+                if com_diario:
+                    vendas.registrar(1, "Dinheiro", 1, 7.5, itens)
+                    sincronizador.acordar()
+                else:
+                    db.registrar_venda(1, "Dinheiro", 1, 7.5, itens)
+                latencias.append(time.perf_counter() - inicio)
+            parar.set()
+            ocupante.join()
+            if com_diario:
+                sincronizador.encerrar()
+                vendas.fechar()
+                pendentes = f" | {vendas.pendentes} não sincronizadas ao final"
+            else:
+                pendentes = ""
+            modo = "diário local" if com_diario else "registrar_venda"
+            print(f"{modo:>16}: p50 {percentil(latencias, 0.5) * 1000:7.2f} ms | p95 {percentil(latencias, 0.95) * 1000:7.2f} ms"
+                  f" | máx {max(latencias) * 1000:7.2f} ms{pendentes}")
+
+        # 2) Vendas de um dia de caixa: uma transação por venda x importar_vendas em lotes
+        carrinhos = [itens_aleatorios(args.produtos) for _ in range(args.importar)]
+        inicio = time.perf_counter()
+        for itens in carrinhos:
+            db.registrar_venda(1, "Dinheiro", 1, 7.5, itens)
+        uma_a_uma = time.perf_counter() - inicio
+        vendas = diario.DiarioVendas(os.path.join(diretorio, "importacao.jsonl"), "bench-importacao")
+        for itens in carrinhos:
+            vendas.registrar(1, "Dinheiro", 1, 7.5, itens)
+        inicio = time.perf_counter()
+        diario.SincronizadorVendas(vendas, db).sincronizar()
+        em_lote = time.perf_counter() - inicio
+        vendas.fechar()
+        print(f"{args.importar} vendas: registrar_venda {args.importar / uma_a_uma:8.1f} vendas/s | "
+              f"importar_vendas (lotes de {diario.LOTE_SINCRONIZACAO}) {args.importar / em_lote:8.1f} vendas/s")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: importação de planilhas de produtos ---
+
+def bench_importacao(args):
+    """Catálogo de N produtos: adicionar_produto um a um (estimado pela amostra) x importar_catalogo em lotes."""
+    diretorio = tempfile.mkdtemp(prefix="bench_importacao_")
+    try:
+        linhas = [(f"789{i:010d}", f"Produto {i}", 1.0 + i % 7, 2.5 + i % 11, i % 50, f"Fornecedor {i % 50}", 5)
+                  for i in range(1, args.produtos + 1)]
+        planilhas = {".csv": os.path.join(diretorio, "catalogo.csv"), ".xlsx": os.path.join(diretorio, "catalogo.xlsx")}
+        inicio = time.perf_counter()
+        with open(planilhas[".csv"], "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f, delimiter=";")
+            escritor.writerow(db.COLUNAS_PRODUTOS)
+            escritor.writerows(linhas)
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Produtos")
+        ws.append(db.COLUNAS_PRODUTOS)
+        for linha in linhas:
+            ws.append(linha)
+        wb.save(planilhas[".xlsx"])
+        print(f"Planilhas com {args.produtos} produtos geradas em {time.perf_counter() - inicio:.1f} s")
+
+        preparar_banco(diretorio, "um_a_um.db", produtos=0)
+        inicio = time.perf_counter()
+        for linha in linhas[:args.amostra]:
+            db.adicionar_produto(*linha)
+        por_produto = (time.perf_counter() - inicio) / args.amostra
+        print(f"{'adicionar_produto um a um':>36}: {1 / por_produto:9.1f} produtos/s "
+              f"(estimado para {args.produtos}: {por_produto * args.produtos:7.1f} s)")
+        db.fechar_conexoes()
+
+        for extensao, caminho in planilhas.items():
+            preparar_banco(diretorio, f"importacao{extensao}.db", produtos=0)
+            for rodada in ("banco vazio", "reimportação"):
+                inicio = time.perf_counter()
+                resumo = importacao.importar_catalogo(caminho, lote=args.lote)
+                decorrido = time.perf_counter() - inicio
+                print(f"{f'importar_catalogo {extensao}, {rodada}':>36}: {args.produtos / decorrido:9.1f} produtos/s "
+                      f"({decorrido:5.1f} s; {resumo['novos']} novos, {resumo['inalterados']} sem alteração)")
+            with db.conexao() as conn:
+                iniciais = conn.execute("SELECT COUNT(*) FROM movimentacoes_estoque WHERE tipo = 'inicial'").fetchone()[0]
+            print(f"{'':>36}  {iniciais} movimentações 'inicial' gravadas")
+            db.fechar_conexoes()
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: reajuste de preços ---
+
+def bench_reajuste(args):
+    """Reajuste dos produtos de um fornecedor: atualizar_produto um a um (estimado pela amostra) x aplicar_reajuste."""
+    diretorio = tempfile.mkdtemp(prefix="bench_reajuste_")
+    regras = [{"tipo": "percentual_custo", "valor": 8}, {"tipo": "markup", "valor": 1.8},
+              {"tipo": "terminacao", "valor": 0.90}]
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+        db.listar_produtos() # Carrega o catálogo em memória, como no sistema aberto
+        fornecedor = "Fornecedor 1"
+        produtos = [p for p in db.listar_produtos() if p["fornecedor"] == fornecedor]
+        print(f"{len(produtos)} produtos do {fornecedor} (de {args.produtos})")
+
+        inicio = time.perf_counter()
+        for p in produtos[:args.amostra]:
+            custo = round(p["preco_custo"] * 1.08, 2)
+            db.atualizar_produto(p["id"], p["codigo_barras"], p["nome"], custo, math.ceil(custo * 1.8 - 0.9) + 0.9,
+                                 p["estoque"], p["fornecedor"], p["estoque_minimo"])
+        por_produto = (time.perf_counter() - inicio) / args.amostra
+        print(f"{'atualizar_produto um a um':>32}: {por_produto * 1000:8.2f} ms/produto "
+              f"(estimado para {len(produtos)}: {por_produto * len(produtos):6.2f} s)")
+
+        inicio = time.perf_counter()
+        previa = db.simular_reajuste(regras, fornecedor)
+        print(f"{'simular_reajuste':>32}: {time.perf_counter() - inicio:8.3f} s ({len(previa)} produtos na prévia)")
+        inicio = time.perf_counter()
+        alterados = db.aplicar_reajuste(regras, fornecedor, usuario_id=1)
+        print(f"{'aplicar_reajuste (fornecedor)':>32}: {time.perf_counter() - inicio:8.3f} s ({alterados} produtos)")
+        inicio = time.perf_counter()
+        alterados = db.aplicar_reajuste([{"tipo": "percentual_venda", "valor": 5}], usuario_id=1)
+        print(f"{'aplicar_reajuste (catálogo)':>32}: {time.perf_counter() - inicio:8.3f} s ({alterados} produtos)")
+
+        cache = {p["id"]: (p["preco_custo"], p["preco_venda"]) for p in db.listar_produtos()}
+        with db.conexao() as conn:
+            banco = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT id, preco_custo, preco_venda FROM produtos")}
+            historico = conn.execute("SELECT COUNT(*) FROM historico_precos").fetchone()[0]
+        print(f"{'':>32}  {historico} linhas no histórico de preços; cache {'igual' if cache == banco else 'DIFERENTE'} do banco")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Benchmark: estoque em uma data ---
+
+def bench_estoque_data(args):
+    """Estoque em uma data: somar o histórico inteiro de movimentações x saldo fechado + movimentações recentes."""
+    diretorio = tempfile.mkdtemp(prefix="bench_estoque_data_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos)
+        dias = 365 * args.anos
+        inicio_periodo = datetime.date.today() - datetime.timedelta(days=dias)
+        tipos = ("entrada", "saida", "saida", "saida")
+        with db.transacao_escrita() as conn:
+            for dia in range(dias):
+                data = inicio_periodo + datetime.timedelta(days=dia)
+                conn.executemany('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, data_hora, motivo, usuario_id)
+                                 VALUES (?, ?, ?, ?, 'Carga benchmark', 1)''',
+                                 ((random.randint(1, args.produtos), random.choice(tipos), random.randint(1, 20),
+                                   f"{data} {random.randint(8, 21):02d}:{random.randint(0, 59):02d}:00")
+                                  for _ in range(args.movimentacoes_dia)))
+        print(f"{dias * args.movimentacoes_dia} movimentações em {dias} dias")
+
+        # A migração já fechou o dia de ontem com o banco vazio: a carga retroativa pede `desde`
+        inicio = time.perf_counter()
+        saldos = db.fechar_saldos_estoque(desde=str(inicio_periodo))
+        print(f"fechar_saldos_estoque (primeira vez): {saldos} saldos em {time.perf_counter() - inicio:.1f} s")
+
+        datas = [str(inicio_periodo + datetime.timedelta(days=random.randrange(dias))) for _ in range(args.consultas)]
+        produtos = [random.randint(1, args.produtos) for _ in range(args.consultas)]
+        hoje = str(datetime.date.today())
+
+        def historico_inteiro(produto_id, data):
+            with db.conexao() as conn:
+                return conn.execute(f'''SELECT COALESCE(SUM({db.DELTA_MOVIMENTACAO}), 0) FROM movimentacoes_estoque
+                                    WHERE produto_id = ? AND data_hora <= ?''',
+                                    (produto_id, f"{data} 23:59:59")).fetchone()[0]
+
+        def posicao_historico_inteiro(data):
+            with db.conexao() as conn:
+                return conn.execute(f'''SELECT p.nome, COALESCE(SUM({db.DELTA_MOVIMENTACAO}), 0) FROM produtos p
+                                    LEFT JOIN movimentacoes_estoque m ON m.produto_id = p.id AND m.data_hora <= ?
+                                    GROUP BY p.id ORDER BY p.nome''', (f"{data} 23:59:59",)).fetchall()
+
+        for nome, funcao in (("histórico inteiro", historico_inteiro), ("estoque_em", db.estoque_em)):
+            inicio = time.perf_counter()
+            for produto_id, data in zip(produtos, datas):
+                funcao(produto_id, data)
+            print(f"Estoque de um produto ({nome}): {(time.perf_counter() - inicio) * 1000 / args.consultas:.2f} ms por consulta")
+        for nome, funcao in (("histórico inteiro", posicao_historico_inteiro),
+                             ("obter_posicao_estoque", db.obter_posicao_estoque)):
+            inicio = time.perf_counter()
+            funcao(hoje)
+            print(f"Posição de todos os produtos hoje ({nome}): {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Verificação dos planos de consulta ---
+
+def capturar_consultas(funcao, *args, **kwargs):
+    """Executa uma função do database.py e retorna os SQLs (com parâmetros) que ela emitiu."""
+    consultas = []
+    db.invalidar_cache_produtos() # Força a ida ao banco, mesmo para dados já no catálogo em memória
+    with db.conexao() as conn:
+        conn.set_trace_callback(consultas.append)
+        try:
+            funcao(*args, **kwargs)
+        finally:
+            conn.set_trace_callback(None)
+    return [sql for sql in consultas if sql.lstrip().upper().startswith("SELECT")]
+
+def varreduras_completas(sql):
+    """Retorna as linhas do EXPLAIN QUERY PLAN que leem uma tabela inteira sem índice."""
+    with db.conexao() as conn:
+        plano = [linha["detail"] for linha in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    # Subconsultas materializadas (tabelas temporárias pequenas), listas de parâmetros
+    # em json_each e linhas constantes não contam como varredura
+    temporarias = {d.split()[1] for d in plano if d.startswith(("MATERIALIZE ", "CO-ROUTINE "))} | {"json_each", "CONSTANT"}
+    return plano, [d for d in plano if d.startswith("SCAN ") and " USING " not in d and d.split()[1] not in temporarias]
+
+def bench_planos(args):
+    """Confere que relatórios e buscas usam índices (falha se houver varredura completa)."""
+    diretorio = tempfile.mkdtemp(prefix="bench_planos_")
+    try:
+        preparar_banco(diretorio, produtos=args.produtos, movimentacoes=args.produtos)
+        for _ in range(args.vendas):
+            db.registrar_venda(1, "Dinheiro", 1, 7.5, itens_aleatorios(args.produtos))
+        casos = {
+            "listar_produtos": (db.listar_produtos,),
+            "buscar_produto_por_id": (db.buscar_produto_por_id, 1),
+            "obter_vendas_por_periodo": (db.obter_vendas_por_periodo, "2024-01-01", "2024-01-31"),
+            "pagina_vendas_por_periodo": (db.pagina_vendas_por_periodo, "2024-01-01", "2024-01-31",
+                                          ("2024-01-15 12:00:00", 10)),
+            "obter_itens_venda": (db.obter_itens_venda, 1),
+            "iterar_vendas_com_itens": (lambda *periodo: list(db.iterar_vendas_com_itens(*periodo)),
+                                        "2024-01-01", "2024-01-31"),
+            "obter_itens_vendas": (db.obter_itens_vendas, [1, 2, 3]),
+            "obter_itens_vendas_por_periodo": (db.obter_itens_vendas_por_periodo, "2024-01-01", "2024-01-31"),
+            "pagina_vendas_itens_por_periodo": (db.pagina_vendas_itens_por_periodo, "2024-01-01", "2024-01-31"),
+            "obter_produtos_mais_vendidos": (db.obter_produtos_mais_vendidos, "2024-01-01", "2024-01-31"),
+            "obter_totais_periodo": (db.obter_totais_periodo, "2024-01-01", "2024-01-31"),
+            "obter_movimentacoes_estoque": (db.obter_movimentacoes_estoque, "2024-01-01", "2024-01-31"),
+            "obter_movimentacoes_estoque (produto)": (db.obter_movimentacoes_estoque, "2024-01-01", "2024-01-31", 1),
+            "pagina_movimentacoes_estoque": (db.pagina_movimentacoes_estoque, "2024-01-01", "2024-01-31", None,
+                                             ("2024-01-15 12:00:00", 10)),
+            "estoque_em": (db.estoque_em, 1, "2024-01-31"),
+            "obter_posicao_estoque": (db.obter_posicao_estoque, "2024-01-31"),
+            "obter_conflitos_estoque": (db.obter_conflitos_estoque, "2024-01-01", "2024-01-31"),
+            "obter_historico_precos": (db.obter_historico_precos, "2024-01-01", "2024-01-31"),
+            "obter_historico_precos (produto)": (db.obter_historico_precos, "2024-01-01", "2024-01-31", 1),
+            "listar_fornecedores": (db.listar_fornecedores,),
+            "simular_reajuste (fornecedor)": (db.simular_reajuste, [{"tipo": "markup", "valor": 2}], "Fornecedor 1"),
+        }
+        problemas = 0
+        for nome, (funcao, *parametros) in casos.items():
+            for sql in capturar_consultas(funcao, *parametros):
+                plano, scans = varreduras_completas(sql)
+                status = "OK" if not scans else "VARREDURA COMPLETA"
+                print(f"[{status}] {nome}: {' | '.join(plano)}")
+                problemas += len(scans)
+        print(f"Versão do esquema: {db.versao_esquema()}")
+        return problemas
+    finally:
+        db.fechar_conexoes()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do sistema da loja")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_wal = sub.add_parser("wal", help="Vendas/s com relatórios concorrentes (WAL x journal padrão)")
+    p_wal.add_argument("--segundos", type=float, default=5.0)
+    p_wal.add_argument("--leitores", type=int, default=4)
+    p_wal.add_argument("--produtos", type=int, default=2000)
+    p_wal.add_argument("--movimentacoes", type=int, default=50000)
+    p_wal.set_defaults(func=bench_wal)
+
+    p_planos = sub.add_parser("planos", help="Verifica EXPLAIN QUERY PLAN das consultas de relatório")
+    p_planos.add_argument("--produtos", type=int, default=2000)
+    p_planos.add_argument("--vendas", type=int, default=200)
+    p_planos.set_defaults(func=bench_planos)
+
+    p_busca = sub.add_parser("busca", help="Busca de produtos: LIKE x FTS5")
+    p_busca.add_argument("--produtos", type=int, default=200000)
+    p_busca.set_defaults(func=bench_busca)
+
+    p_digitacao = sub.add_parser("digitacao", help="Tempo por tecla da busca incremental")
+    p_digitacao.add_argument("--produtos", type=int, default=200000)
+    p_digitacao.set_defaults(func=bench_digitacao)
+
+    p_codigo = sub.add_parser("codigo_barras", help="Latência da leitura de código de barras")
+    p_codigo.add_argument("--produtos", type=int, default=200000)
+    p_codigo.add_argument("--leituras", type=int, default=5000)
+    p_codigo.set_defaults(func=bench_codigo_barras)
+
+    p_venda = sub.add_parser("venda_grande", help="Tempo de registrar_venda com muitas linhas")
+    p_venda.add_argument("--linhas", type=int, default=300)
+    p_venda.add_argument("--produtos", type=int, default=5000)
+    p_venda.add_argument("--vendas", type=int, default=50)
+    p_venda.set_defaults(func=bench_venda_grande)
+
+    p_resumos = sub.add_parser("resumos", help="Mais vendidos em vários anos: vendas x resumo diário")
+    p_resumos.add_argument("--anos", type=int, default=3)
+    p_resumos.add_argument("--vendas-dia", type=int, default=500)
+    p_resumos.add_argument("--produtos", type=int, default=2000)
+    p_resumos.set_defaults(func=bench_resumos)
+
+    p_streaming = sub.add_parser("streaming", help="Memória dos relatórios: listas de dicts x tuplas em lotes x páginas")
+    p_streaming.add_argument("--movimentacoes", type=int, default=300000)
+    p_streaming.add_argument("--produtos", type=int, default=2000)
+    p_streaming.add_argument("--paginas", type=int, default=100)
+    p_streaming.set_defaults(func=bench_streaming)
+
+    p_excel = sub.add_parser("excel", help="Exportação de um relatório grande para Excel")
+    p_excel.add_argument("--movimentacoes", type=int, default=1000000)
+    p_excel.add_argument("--produtos", type=int, default=2000)
+    p_excel.set_defaults(func=bench_excel)
+
+    p_pdf = sub.add_parser("pdf", help="Geração de um relatório grande em PDF")
+    p_pdf.add_argument("--linhas", type=int, default=50000)
+    p_pdf.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    p_pdf.set_defaults(func=bench_pdf)
+
+    p_recibos = sub.add_parser("recibos", help="Regeneração de recibos de vendas antigas em lote")
+    p_recibos.add_argument("--vendas", type=int, default=5000)
+    p_recibos.add_argument("--produtos", type=int, default=2000)
+    p_recibos.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    p_recibos.set_defaults(func=bench_recibos)
+
+    p_detalhado = sub.add_parser("detalhado", help="Vendas com itens: uma consulta por venda x consultas em lote")
+    p_detalhado.add_argument("--vendas", type=int, default=20000)
+    p_detalhado.add_argument("--produtos", type=int, default=2000)
+    p_detalhado.set_defaults(func=bench_detalhado)
+
+    p_estoque = sub.add_parser("estoque_data", help="Estoque em uma data: histórico inteiro x saldos diários fechados")
+    p_estoque.add_argument("--anos", type=int, default=3)
+    p_estoque.add_argument("--movimentacoes-dia", type=int, default=2000)
+    p_estoque.add_argument("--produtos", type=int, default=2000)
+    p_estoque.add_argument("--consultas", type=int, default=200)
+    p_estoque.set_defaults(func=bench_estoque_data)
+
+    p_grupo = sub.add_parser("grupo", help="Vendas/s: uma transação por venda x commit em grupo (FilaVendas)")
+    p_grupo.add_argument("--produtores", type=int, default=16)
+    p_grupo.add_argument("--segundos", type=float, default=5.0)
+    p_grupo.add_argument("--lote", type=int, default=db.LOTE_VENDAS)
+    p_grupo.add_argument("--espera-ms", type=float, default=db.ESPERA_LOTE_VENDAS * 1000)
+    p_grupo.add_argument("--produtos", type=int, default=2000)
+    p_grupo.set_defaults(func=bench_grupo)
+
+    p_servidor = sub.add_parser("servidor", help="Vendas/s no servidor HTTP com N caixas simulados")
+    p_servidor.add_argument("--terminais", type=int, nargs="+", default=[1, 4, 16])
+    p_servidor.add_argument("--segundos", type=float, default=5.0)
+    p_servidor.add_argument("--trabalhadores", type=int, default=4)
+    p_servidor.add_argument("--produtos", type=int, default=2000)
+    p_servidor.set_defaults(func=bench_servidor)
+
+    p_diario = sub.add_parser("diario", help="Diário local de vendas: caixa livre com o banco ocupado e importação em lote")
+    p_diario.add_argument("--vendas", type=int, default=300)
+    p_diario.add_argument("--bloqueio-ms", type=float, default=200.0)
+    p_diario.add_argument("--intervalo-ms", type=float, default=300.0)
+    p_diario.add_argument("--importar", type=int, default=5000)
+    p_diario.add_argument("--produtos", type=int, default=2000)
+    p_diario.set_defaults(func=bench_diario)
+
+    p_importacao = sub.add_parser("importacao", help="Importação de planilha de produtos: um a um x em lotes")
+    p_importacao.add_argument("--produtos", type=int, default=150000)
+    p_importacao.add_argument("--amostra", type=int, default=2000, help="Produtos cadastrados um a um")
+    p_importacao.add_argument("--lote", type=int, default=db.LOTE_IMPORTACAO)
+    p_importacao.set_defaults(func=bench_importacao)
+
+    p_reajuste = sub.add_parser("reajuste", help="Reajuste de preços por fornecedor: um a um x UPDATE em lote")
+    p_reajuste.add_argument("--produtos", type=int, default=250000)
+    p_reajuste.add_argument("--amostra", type=int, default=500, help="Produtos atualizados um a um")
+    p_reajuste.set_defaults(func=bench_reajuste)
+
+    args = parser.parse_args()
+    if args.func(args) and args.comando == "planos":
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Modo cliente: o caixa usa o banco através do servidor (servidor.py) em vez de abrir o loja.db.
+
+Com LOJA_SERVIDOR definido (ex.: "192.168.0.10:8765"), banco() retorna um
+ClienteLoja, que tem a mesma interface das funções do database.py usadas pela
+interface; sem ele, retorna o próprio módulo database.
+"""
+import contextlib
+import functools
+import http.client
+import json
+import os
+import threading
+import time
+
+import database
+import servidor
+
+SERVIDOR = os.environ.get("LOJA_SERVIDOR", "") # host:porta do servidor; vazio = banco local
+TOKEN = os.environ.get("LOJA_TOKEN", "")
+TIMEOUT = 60.0 # Segundos esperando uma resposta (relatórios grandes)
+TENTATIVAS = 4 # Para servidor ocupado (503) e conexão caída em leituras
+# Conexões paradas há mais que isso são reabertas antes de usar (o servidor as fecha após TEMPO_OCIOSO)
+REUSO_MAXIMO = servidor.TEMPO_OCIOSO - 5
+
+# Atributos do database.py que não acessam o banco e podem ser usados localmente
+LOCAIS = {"LIMITE_BUSCA", "TAMANHO_LOTE", "TAMANHO_PAGINA", "COLUNAS_VENDAS", "COLUNAS_MOVIMENTACOES",
+          "COLUNAS_VENDAS_ITENS", "COLUNAS_PRODUTOS", "LOTE_IMPORTACAO", "filtrar_produtos", "percorrer_paginas",
+          "descrever_regras"}
+
+class ErroServidor(Exception):
+    """Servidor inacessível ou falha ao executar a chamada no servidor."""
+
+class ClienteLoja:
+    """Chamadas ao servidor da loja com a interface do database.py.
+
+    `cliente.listar_produtos("cafe")` vira um POST /api/listar_produtos. Cada thread
+    usa sua própria conexão HTTP keep-alive, então o cliente pode ser usado pelas
+    tarefas em segundo plano da interface. ValueError do servidor (ex.: estoque
+    insuficiente numa venda) é relançado como ValueError; o resto vira ErroServidor.
+    """
+
+    def __init__(self, endereco, token=TOKEN, timeout=TIMEOUT):
+        endereco = endereco.split("://", 1)[-1].rstrip("/")
+        host, _, porta = endereco.partition(":")
+        self.host = host
+        self.porta = int(porta or servidor.PORTA_PADRAO)
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"ClienteLoja({self.host}:{self.porta})"
+
+    def __getattr__(self, nome):
+        if nome in servidor.FUNCOES_API:
+            funcao = functools.partial(self.chamar, nome)
+            setattr(self, nome, funcao) # Próximos acessos não passam por __getattr__
+            return funcao
+        if nome in LOCAIS:
+            return getattr(database, nome)
+        raise AttributeError(f"'{nome}' não está disponível no modo cliente")
+
+    # --- API ---
+
+    def chamar(self, funcao, *args, **kwargs):
+        """Executa `funcao` do database.py no servidor e retorna o resultado."""
+        resposta = self._requisitar(f"/api/{funcao}", {"args": args, "kwargs": kwargs},
+                                    repetir=not servidor.FUNCOES_API.get(funcao, True))
+        return resposta["resultado"]
+
+    def lote(self, chamadas):
+        """Executa várias chamadas [(funcao, args, kwargs), ...] numa só requisição.
+
+        Retorna a lista de resultados na mesma ordem; se alguma chamada falhou,
+        levanta ErroServidor (as demais já foram executadas).
+        """
+        chamadas = [{"funcao": funcao, "args": list(args), "kwargs": kwargs or {}} for funcao, args, kwargs in chamadas]
+        escrita = any(servidor.FUNCOES_API.get(c["funcao"], True) for c in chamadas)
+        resposta = self._requisitar("/api/lote", {"chamadas": chamadas}, repetir=not escrita)
+        falhas = [f"#{i}: {erro}" for i, erro in enumerate(resposta["erros"]) if erro]
+        if falhas:
+            raise ErroServidor("Falha no lote: " + "; ".join(falhas))
+        return resposta["resultados"]
+
+    def saude(self):
+        """Estado do servidor ({"versao_esquema", "pendentes"}); levanta ErroServidor se não responder."""
+        return self._requisitar("/api/saude", None, repetir=True, metodo="GET")
+
+    def interrompivel(self, cancelado, intervalo=1000):
+        # Chamadas remotas não são interrompidas no meio; o cancelamento vale entre uma chamada e outra
+        return contextlib.nullcontext()
+
+    def fechar(self):
+        """Fecha a conexão HTTP da thread atual."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Internos ---
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and time.monotonic() - self._local.usada_em > REUSO_MAXIMO:
+            self.fechar()
+            conn = None
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _requisitar(self, caminho, dados, repetir, metodo="POST"):
+        """Envia a requisição e retorna o JSON da resposta.
+
+        Servidor ocupado (503) sempre é tentado de novo: a chamada não foi executada.
+        Conexão caída só é tentada de novo em leituras (`repetir`), porque uma venda
+        pode ter sido gravada antes de a resposta se perder.
+        """
+        corpo = servidor.codificar(dados) if dados is not None else None
+        cabecalhos = {"Content-Type": "application/json"}
+        if self.token:
+            cabecalhos["X-Loja-Token"] = self.token
+        for tentativa in range(TENTATIVAS):
+            espera = 0.05 * 2 ** tentativa
+            conn = self._conexao()
+            try:
+                conn.request(metodo, caminho, corpo, cabecalhos)
+                resposta = conn.getresponse()
+                status = resposta.status
+                conteudo = json.loads(resposta.read() or b"{}")
+                self._local.usada_em = time.monotonic()
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                self.fechar()
+                if repetir and tentativa + 1 < TENTATIVAS:
+                    time.sleep(espera)
+                    continue
+                raise ErroServidor(f"Sem resposta do servidor {self.host}:{self.porta} ({caminho}): {e}")
+            if status == 503 and tentativa + 1 < TENTATIVAS:
+                time.sleep(espera)
+                continue
+            if status == 200:
+                return conteudo
+            if conteudo.get("tipo") == "ValueError":
+                raise ValueError(conteudo.get("erro"))
+            raise ErroServidor(f"Servidor respondeu {status} ({caminho}): {conteudo.get('erro')}")
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+def banco():
+    """O módulo database (banco local) ou, com LOJA_SERVIDOR definido, o ClienteLoja do processo."""
+    global _cliente
+    if not SERVIDOR:
+        return database
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = ClienteLoja(SERVIDOR)
+    return _cliente
@@ -3,100 +3,635 @@ import sqlite3
 import datetime
 import hashlib
 import os
+import threading
+import atexit
+import time
+import re
+import itertools
+import json
+import math
+import queue
+import unicodedata
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 # --- Definição do Caminho do Banco de Dados ---
 # Obtém o caminho absoluto do diretório onde este script (database.py) está
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Cria o caminho completo para o arquivo loja.db dentro desse diretório
 DATABASE = os.path.join(SCRIPT_DIR, 'loja.db')
+# Modo WAL (opt-in): leitores concorrentes e um único escritor serializado.
+# Ative com a variável de ambiente LOJA_MODO_WAL=1 ou configurar_banco(modo_wal=True).
+MODO_WAL = os.environ.get('LOJA_MODO_WAL', '0') == '1'
 # ----------------------------------------------
 
+# --- Gerenciador de Conexões ---
+# PRAGMAs aplicados uma única vez, quando a conexão é criada.
+PRAGMAS_CONEXAO = (
+    "PRAGMA foreign_keys = ON", # Ativa as restrições ON DELETE RESTRICT/CASCADE das tabelas
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000", # ~8 MB de cache de páginas por conexão
+)
+# PRAGMAs adicionais do modo WAL. journal_mode é persistente no arquivo do banco.
+PRAGMAS_WAL = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL", # Seguro em WAL: só perde as últimas transações em queda de energia
+    "PRAGMA wal_autocheckpoint = 1000", # Checkpoint automático a cada ~1000 páginas
+    "PRAGMA journal_size_limit = 67108864", # Trunca o -wal para 64 MB após checkpoint
+)
+TIMEOUT_OCUPADO = 5.0 # Segundos que o SQLite espera por um lock antes de SQLITE_BUSY
+TENTATIVAS_OCUPADO = 5 # Retentativas (com espera crescente) após esgotar o timeout
+LIMITE_BUSCA = 500 # Máximo de resultados retornados por uma busca textual de produtos
+LIMITE_ALTERACOES = 5000 # Alterações de produtos lembradas para atualizações incrementais da interface
+TAMANHO_LOTE = 1000 # Linhas lidas por fetchmany() nas consultas em streaming
+TAMANHO_PAGINA = 200 # Linhas por página na paginação por chave (data_hora, id)
+LOTE_IMPORTACAO = 5000 # Produtos gravados por transação na importação de planilhas
+LOTE_VENDAS = 64 # Máximo de vendas gravadas por commit na FilaVendas
+ESPERA_LOTE_VENDAS = 0.0 # Segundos que a primeira venda de um lote espera por outras
+                         # (0: o lote junta só as vendas que chegaram durante o commit anterior)
+
+class GerenciadorConexoes:
+    """Pool de conexões SQLite reutilizáveis, seguro para uso entre threads.
+
+    Cada thread recebe uma conexão do pool ao entrar em conexao()/transacao() e a
+    devolve ao sair. Chamadas aninhadas na mesma thread reaproveitam a mesma
+    conexão (e a mesma transação), então funções de CRUD podem chamar umas às outras.
+
+    Escritas passam por transacao_escrita(), que usa uma conexão dedicada protegida
+    por um lock: há no máximo um escritor por processo, e em modo WAL os leitores
+    do pool continuam lendo em paralelo.
+    """
+
+    def __init__(self, caminho, tamanho_maximo=5, pragmas=PRAGMAS_CONEXAO, modo_wal=False):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo # Máximo de conexões ociosas mantidas no pool
+        self.modo_wal = modo_wal
+        self.pragmas = tuple(pragmas) + (PRAGMAS_WAL if modo_wal else ())
+        self._livres = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._fechado = False
+        self._lock_escrita = threading.Lock()
+        self._conn_escrita = None
+
+    def _nova_conexao(self):
+        # check_same_thread=False: a conexão pode ser usada por outra thread depois de devolvida ao pool
+        conn = sqlite3.connect(self.caminho, timeout=TIMEOUT_OCUPADO, check_same_thread=False)
+        conn.row_factory = sqlite3.Row # Retorna dicionários em vez de tuplas
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def _obter(self):
+        with self._lock:
+            if self._livres:
+                return self._livres.pop()
+        return self._nova_conexao()
+
+    def _devolver(self, conn):
+        if conn.in_transaction: # Nunca devolve ao pool uma conexão com transação pendente
+            conn.rollback()
+        with self._lock:
+            if not self._fechado and len(self._livres) < self.tamanho_maximo:
+                self._livres.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão do pool (reentrante dentro da mesma thread)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._obter()
+        self._local.conn = conn
+        self._local.em_transacao = False
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._devolver(conn)
+
+    @contextmanager
+    def transacao(self):
+        """Conexão com commit ao final do bloco e rollback em caso de erro.
+
+        Se já existir uma transação aberta na thread, participa dela sem commitar.
+        """
+        with self.conexao() as conn:
+            if self._local.em_transacao:
+                yield conn
+                return
+            self._local.em_transacao = True
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.em_transacao = False
+
+    @contextmanager
+    def transacao_escrita(self):
+        """Transação de escrita serializada na conexão dedicada do escritor.
+
+        Abre com BEGIN IMMEDIATE (o lock de escrita é obtido no início, evitando
+        SQLITE_BUSY no meio da transação). Se já existir uma transação aberta na
+        thread, participa dela.
+        """
+        if getattr(self._local, 'em_transacao', False):
+            yield self._local.conn
+            return
+        with self._lock_escrita:
+            if self._conn_escrita is None:
+                self._conn_escrita = self._nova_conexao()
+            conn = self._conn_escrita
+            anterior = getattr(self._local, 'conn', None)
+            self._local.conn = conn
+            self._local.em_transacao = True
+            try:
+                executar_com_retentativa(conn, "BEGIN IMMEDIATE")
+                yield conn
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                self._local.conn = anterior
+                self._local.em_transacao = False
+
+    @contextmanager
+    def interrompivel(self, cancelado, intervalo=1000):
+        """Conexão da thread cujas consultas são abortadas quando cancelado() retorna True.
+
+        O SQLite chama cancelado() a cada `intervalo` instruções da VM; a consulta em
+        andamento falha com sqlite3.OperationalError ("interrupted"). Só afeta leituras
+        do pool: a conexão do escritor não é interrompida.
+        """
+        with self.conexao() as conn:
+            conn.set_progress_handler(lambda: 1 if cancelado() else 0, intervalo)
+            try:
+                yield conn
+            finally:
+                conn.set_progress_handler(None, 0)
+
+    def iterar(self, sql, params=(), tamanho_lote=TAMANHO_LOTE):
+        """Gera as linhas de `sql` como tuplas, lidas do cursor em lotes de `tamanho_lote`.
+
+        Dentro de um bloco conexao()/transacao() usa a conexão da thread (o bloco deve
+        durar até o fim da iteração); fora dele, empresta uma conexão só para o gerador.
+        Sem WAL, a leitura em andamento segura o lock compartilhado do banco: não
+        intercale gravações demoradas com a iteração.
+        """
+        conn = getattr(self._local, 'conn', None)
+        propria = conn is None
+        if propria:
+            conn = self._obter()
+        cursor = conn.cursor()
+        cursor.row_factory = None # Tuplas: bem menores que sqlite3.Row ou dict por linha
+        try:
+            cursor.execute(sql, params)
+            while True:
+                lote = cursor.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                yield from lote
+        finally:
+            cursor.close()
+            if propria:
+                self._devolver(conn)
+
+    def em_transacao(self):
+        """True se a thread atual está dentro de transacao()/transacao_escrita()."""
+        return getattr(self._local, 'em_transacao', False)
+
+    def checkpoint(self, modo='PASSIVE'):
+        """Executa um checkpoint do WAL (PASSIVE, FULL, RESTART ou TRUNCATE)."""
+        if not self.modo_wal:
+            return None
+        with self._lock_escrita:
+            if self._conn_escrita is None:
+                self._conn_escrita = self._nova_conexao()
+            return tuple(self._conn_escrita.execute(f"PRAGMA wal_checkpoint({modo})").fetchone())
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas do pool e a conexão do escritor."""
+        with self._lock:
+            self._fechado = True
+            livres, self._livres = self._livres, []
+        for conn in livres:
+            conn.close()
+        with self._lock_escrita:
+            if self._conn_escrita is not None:
+                self._conn_escrita.close()
+                self._conn_escrita = None
+
+def executar_com_retentativa(conn, sql, params=(), tentativas=TENTATIVAS_OCUPADO):
+    """Executa um comando repetindo-o, com espera crescente, se o banco estiver ocupado."""
+    espera = 0.05
+    for tentativa in range(tentativas):
+        try:
+            return conn.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            mensagem = str(e).lower()
+            if ('locked' not in mensagem and 'busy' not in mensagem) or tentativa == tentativas - 1:
+                raise
+            print(f"Banco ocupado, tentando novamente em {espera:.2f}s ({tentativa + 1}/{tentativas})")
+            time.sleep(espera)
+            espera *= 2
+
+_gerenciador = None
+_gerenciador_lock = threading.Lock()
+
+def obter_gerenciador():
+    """Retorna o gerenciador de conexões do processo, criando-o na primeira chamada."""
+    global _gerenciador
+    if _gerenciador is None:
+        with _gerenciador_lock:
+            if _gerenciador is None:
+                _gerenciador = GerenciadorConexoes(DATABASE, modo_wal=MODO_WAL)
+    return _gerenciador
+
+def configurar_banco(caminho=None, modo_wal=None, **opcoes):
+    """Troca o arquivo de banco e/ou as opções do pool (útil para testes e benchmarks)."""
+    global DATABASE, MODO_WAL, _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is not None:
+            _gerenciador.fechar()
+        if caminho:
+            DATABASE = caminho
+        if modo_wal is not None:
+            MODO_WAL = modo_wal
+        _gerenciador = GerenciadorConexoes(DATABASE, modo_wal=MODO_WAL, **opcoes)
+    invalidar_cache_produtos() # O catálogo em memória pertence ao banco anterior
+    return _gerenciador
+
+def fechar_conexoes():
+    """Fecha as conexões mantidas pelo pool (chamado automaticamente ao sair)."""
+    if _gerenciador is not None:
+        _gerenciador.fechar()
+
+atexit.register(fechar_conexoes)
+
+def conexao():
+    """Atalho para obter_gerenciador().conexao()."""
+    return obter_gerenciador().conexao()
+
+def transacao():
+    """Atalho para obter_gerenciador().transacao()."""
+    return obter_gerenciador().transacao()
+
+def transacao_escrita():
+    """Atalho para obter_gerenciador().transacao_escrita()."""
+    return obter_gerenciador().transacao_escrita()
+
+def interrompivel(cancelado, intervalo=1000):
+    """Atalho para obter_gerenciador().interrompivel()."""
+    return obter_gerenciador().interrompivel(cancelado, intervalo)
+
+def iterar_consulta(sql, params=(), tamanho_lote=TAMANHO_LOTE):
+    """Atalho para obter_gerenciador().iterar()."""
+    return obter_gerenciador().iterar(sql, params, tamanho_lote)
+
+def checkpoint_wal(modo='PASSIVE'):
+    """Força um checkpoint do WAL (sem efeito fora do modo WAL)."""
+    return obter_gerenciador().checkpoint(modo)
+
 def conectar_bd():
-    """Conecta ao banco de dados SQLite."""
+    """Abre uma conexão avulsa (fora do pool). Prefira conexao()/transacao()."""
     conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row # Retorna dicionários em vez de tuplas
+    for pragma in PRAGMAS_CONEXAO:
+        conn.execute(pragma)
     return conn
 
 def criar_tabelas():
     """Cria as tabelas do banco de dados se não existirem."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-
-    # Tabela de Usuários
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS usuarios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nome TEXT NOT NULL,
-        usuario TEXT UNIQUE NOT NULL,
-        senha TEXT NOT NULL,
-        tipo TEXT NOT NULL CHECK(tipo IN ('admin', 'vendedor'))
-    )
-    ''')
+    with transacao() as conn:
+        cursor = conn.cursor()
 
-    # Tabela de Produtos
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS produtos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        codigo_barras TEXT UNIQUE,
-        nome TEXT NOT NULL,
-        preco_custo REAL,
-        preco_venda REAL NOT NULL,
-        estoque INTEGER NOT NULL DEFAULT 0,
-        fornecedor TEXT,
-        estoque_minimo INTEGER DEFAULT 5
-    )
-    ''')
+        # Tabela de Usuários
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            usuario TEXT UNIQUE NOT NULL,
+            senha TEXT NOT NULL,
+            tipo TEXT NOT NULL CHECK(tipo IN ('admin', 'vendedor'))
+        )
+        ''')
 
-    # Tabela de Vendas
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS vendas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        data_hora DATETIME DEFAULT CURRENT_TIMESTAMP,
-        usuario_id INTEGER NOT NULL,
-        forma_pagamento TEXT NOT NULL CHECK(forma_pagamento IN ('Dinheiro', 'Débito', 'Crédito')),
-        parcelas INTEGER DEFAULT 1,
-        total REAL NOT NULL,
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
-    )
-    ''')
+        # Tabela de Produtos
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo_barras TEXT UNIQUE,
+            nome TEXT NOT NULL,
+            preco_custo REAL,
+            preco_venda REAL NOT NULL,
+            estoque INTEGER NOT NULL DEFAULT 0,
+            fornecedor TEXT,
+            estoque_minimo INTEGER DEFAULT 5
+        )
+        ''')
 
-    # Tabela de Itens da Venda
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS itens_venda (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        venda_id INTEGER NOT NULL,
-        produto_id INTEGER NOT NULL,
-        quantidade INTEGER NOT NULL,
-        preco_unitario REAL NOT NULL,
-        FOREIGN KEY (venda_id) REFERENCES vendas(id) ON DELETE CASCADE, -- Cascata para limpar itens se venda for deletada
-        FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE RESTRICT -- Impede excluir produto se estiver em item_venda
-    )
-    ''')
+        # Tabela de Vendas
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vendas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data_hora DATETIME DEFAULT CURRENT_TIMESTAMP,
+            usuario_id INTEGER NOT NULL,
+            forma_pagamento TEXT NOT NULL CHECK(forma_pagamento IN ('Dinheiro', 'Débito', 'Crédito')),
+            parcelas INTEGER DEFAULT 1,
+            total REAL NOT NULL,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+        ''')
+
+        # Tabela de Itens da Venda
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS itens_venda (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            venda_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            preco_unitario REAL NOT NULL,
+            FOREIGN KEY (venda_id) REFERENCES vendas(id) ON DELETE CASCADE, -- Cascata para limpar itens se venda for deletada
+            FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE RESTRICT -- Impede excluir produto se estiver em item_venda
+        )
+        ''')
+
+        # Tabela de Movimentações de Estoque
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movimentacoes_estoque (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produto_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL CHECK(tipo IN ('entrada', 'saida', 'inicial', 'ajuste')),
+            quantidade INTEGER NOT NULL,
+            data_hora DATETIME DEFAULT CURRENT_TIMESTAMP,
+            motivo TEXT, -- Ex: 'Venda #123', 'Compra NF 456', 'Ajuste Inventário'
+            usuario_id INTEGER,
+            FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE, -- Cascata se produto for deletado
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+        ''')
 
-    # Tabela de Movimentações de Estoque
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS movimentacoes_estoque (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        produto_id INTEGER NOT NULL,
-        tipo TEXT NOT NULL CHECK(tipo IN ('entrada', 'saida', 'inicial', 'ajuste')),
-        quantidade INTEGER NOT NULL,
-        data_hora DATETIME DEFAULT CURRENT_TIMESTAMP,
-        motivo TEXT, -- Ex: 'Venda #123', 'Compra NF 456', 'Ajuste Inventário'
-        usuario_id INTEGER,
-        FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE, -- Cascata se produto for deletado
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
-    )
+        # Adicionar usuário admin padrão se não existir
+        cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'") # Fechar parêntese aqui
+        if not cursor.fetchone():
+            senha_hash = hashlib.sha256('admin'.encode('utf-8')).hexdigest()
+            cursor.execute("INSERT INTO usuarios (nome, usuario, senha, tipo) VALUES (?, ?, ?, ?)",
+                           ('Administrador', 'admin', senha_hash, 'admin'))
+
+    aplicar_migracoes()
+
+def _criar_indice_fts_produtos(conn):
+    """Cria a tabela FTS5 de busca de produtos e os triggers que a mantêm sincronizada."""
+    try:
+        # remove_diacritics 2: "cafe" encontra "Café"; prefix: acelera buscas por prefixo curto
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5 (
+            nome, codigo_barras,
+            content = 'produtos', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sem FTS5: listar_produtos continua usando LIKE
+        print(f"FTS5 indisponível, busca de produtos usará LIKE: {e}")
+        return
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_insert AFTER INSERT ON produtos BEGIN
+        INSERT INTO produtos_fts (rowid, nome, codigo_barras) VALUES (new.id, new.nome, new.codigo_barras);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_delete AFTER DELETE ON produtos BEGIN
+        INSERT INTO produtos_fts (produtos_fts, rowid, nome, codigo_barras) VALUES ('delete', old.id, old.nome, old.codigo_barras);
+    END
     ''')
+    # Só dispara quando nome/código mudam (baixas de estoque não reindexam o produto)
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_update AFTER UPDATE OF nome, codigo_barras ON produtos BEGIN
+        INSERT INTO produtos_fts (produtos_fts, rowid, nome, codigo_barras) VALUES ('delete', old.id, old.nome, old.codigo_barras);
+        INSERT INTO produtos_fts (rowid, nome, codigo_barras) VALUES (new.id, new.nome, new.codigo_barras);
+    END
+    ''')
+    conn.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')") # Indexa produtos já existentes
+
+def _reconstruir_resumos_vendas(conn, data_inicio=None, data_fim=None):
+    """Recalcula os resumos a partir de vendas/itens_venda (período opcional, 'AAAA-MM-DD').
+
+    O período é ampliado para meses inteiros, por causa do resumo mensal.
+    """
+    params = ((data_inicio or '0000-01')[:7] + '-01', (data_fim or '9999-12')[:7] + '-31')
+    filtro = "WHERE date(v.data_hora) BETWEEN ? AND ?"
+    conn.execute("DELETE FROM resumo_vendas_dia WHERE dia BETWEEN ? AND ?", params)
+    conn.execute("DELETE FROM resumo_produtos_dia WHERE dia BETWEEN ? AND ?", params)
+    conn.execute("DELETE FROM resumo_produtos_mes WHERE mes BETWEEN ? AND ?", (params[0][:7], params[1][:7]))
+    conn.execute(f'''INSERT INTO resumo_vendas_dia (dia, forma_pagamento, quantidade_vendas, total)
+                 SELECT date(v.data_hora), v.forma_pagamento, COUNT(*), SUM(v.total)
+                 FROM vendas v {filtro}
+                 GROUP BY date(v.data_hora), v.forma_pagamento''', params)
+    conn.execute(f'''INSERT INTO resumo_produtos_dia (dia, produto_id, quantidade, receita)
+                 SELECT date(v.data_hora), iv.produto_id, SUM(iv.quantidade), SUM(iv.quantidade * iv.preco_unitario)
+                 FROM itens_venda iv
+                 JOIN vendas v ON v.id = iv.venda_id
+                 {filtro}
+                 GROUP BY date(v.data_hora), iv.produto_id''', params)
+    conn.execute('''INSERT INTO resumo_produtos_mes (mes, produto_id, quantidade, receita)
+                 SELECT substr(dia, 1, 7), produto_id, SUM(quantidade), SUM(receita)
+                 FROM resumo_produtos_dia
+                 WHERE dia BETWEEN ? AND ?
+                 GROUP BY substr(dia, 1, 7), produto_id''', params)
+
+# Efeito de uma movimentação no estoque: saídas subtraem; entradas, carga inicial e
+# ajustes (com sinal) somam
+DELTA_MOVIMENTACAO = "CASE tipo WHEN 'saida' THEN -quantidade ELSE quantidade END"
+
+def _fechar_saldos_estoque(conn, ate=None, desde=None):
+    """Grava em saldos_estoque o saldo de fechamento de cada produto em cada dia com movimentação.
+
+    Processa só os dias após o último fechamento até `ate` (padrão: ontem, em UTC
+    como o CURRENT_TIMESTAMP das movimentações). Com `desde`, descarta os
+    fechamentos a partir desse dia e os refaz (ex.: movimentações lançadas com
+    data retroativa). Retorna o número de saldos gravados.
+    """
+    ate = ate or conn.execute("SELECT date('now', '-1 day')").fetchone()[0]
+    if desde:
+        conn.execute("DELETE FROM fechamentos_estoque WHERE dia >= ?", (desde,))
+    fechado = conn.execute("SELECT MAX(dia) FROM fechamentos_estoque").fetchone()[0]
+    conn.execute("DELETE FROM saldos_estoque WHERE dia > ?", (fechado or '',)) # Sobras de fechamentos desfeitos
+    if fechado and fechado >= ate:
+        return 0
+    # Saldo anterior (último saldo até o fechamento) + soma acumulada dos dias novos
+    cursor = conn.execute(f'''INSERT INTO saldos_estoque (produto_id, dia, estoque)
+                          SELECT d.produto_id, d.dia,
+                                 COALESCE((SELECT s.estoque FROM saldos_estoque s
+                                           WHERE s.produto_id = d.produto_id AND s.dia <= ?
+                                           ORDER BY s.dia DESC LIMIT 1), 0)
+                                 + SUM(d.delta) OVER (PARTITION BY d.produto_id ORDER BY d.dia)
+                          FROM (SELECT produto_id, date(data_hora) AS dia, SUM({DELTA_MOVIMENTACAO}) AS delta
+                                FROM movimentacoes_estoque
+                                WHERE data_hora > ? AND data_hora <= ?
+                                GROUP BY produto_id, date(data_hora)) d''',
+                          (fechado or '', f"{fechado} 23:59:59" if fechado else '', f"{ate} 23:59:59"))
+    conn.execute("INSERT INTO fechamentos_estoque (dia) VALUES (?)", (ate,))
+    return cursor.rowcount
+
+# --- Migrações de Esquema ---
+# Lista ordenada de (versão, descrição, passos). Cada passo é um comando SQL ou uma
+# função que recebe a conexão. Nunca altere uma migração já publicada: adicione
+# uma nova versão ao final da lista.
+MIGRACOES = [
+    (1, "Índices para relatórios de vendas", (
+        # Filtro/ordenação por período; cobre o join com itens_venda em obter_produtos_mais_vendidos
+        "CREATE INDEX IF NOT EXISTS idx_vendas_data_hora ON vendas (data_hora, id)",
+        # Itens por venda, cobrindo produto e quantidade (evita ler a tabela no GROUP BY)
+        "CREATE INDEX IF NOT EXISTS idx_itens_venda_venda ON itens_venda (venda_id, produto_id, quantidade)",
+        # Usado pela verificação ON DELETE RESTRICT ao excluir produtos
+        "CREATE INDEX IF NOT EXISTS idx_itens_venda_produto ON itens_venda (produto_id)",
+    )),
+    (2, "Índices para movimentações de estoque", (
+        "CREATE INDEX IF NOT EXISTS idx_movimentacoes_data_hora ON movimentacoes_estoque (data_hora)",
+        # Filtro por produto + período; também atende ON DELETE CASCADE de produtos
+        "CREATE INDEX IF NOT EXISTS idx_movimentacoes_produto_data ON movimentacoes_estoque (produto_id, data_hora)",
+    )),
+    (3, "Índice de produtos por nome", (
+        "CREATE INDEX IF NOT EXISTS idx_produtos_nome ON produtos (nome)",
+    )),
+    (4, "Busca textual de produtos (FTS5)", (
+        _criar_indice_fts_produtos,
+    )),
+    (5, "Resumos diários e mensais de vendas", (
+        # Totais por dia e forma de pagamento, mantidos por registrar_venda
+        '''CREATE TABLE IF NOT EXISTS resumo_vendas_dia (
+            dia TEXT NOT NULL, -- AAAA-MM-DD, como date(vendas.data_hora)
+            forma_pagamento TEXT NOT NULL,
+            quantidade_vendas INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, forma_pagamento)
+        ) WITHOUT ROWID''',
+        # Quantidade e receita por dia e produto (produtos mais vendidos)
+        '''CREATE TABLE IF NOT EXISTS resumo_produtos_dia (
+            dia TEXT NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, produto_id)
+        ) WITHOUT ROWID''',
+        # O mesmo por mês: períodos longos leem meses inteiros daqui e só as pontas do diário
+        '''CREATE TABLE IF NOT EXISTS resumo_produtos_mes (
+            mes TEXT NOT NULL, -- AAAA-MM
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (mes, produto_id)
+        ) WITHOUT ROWID''',
+        _reconstruir_resumos_vendas, # Preenche com o histórico existente
+    )),
+    (6, "Saldos diários de estoque", (
+        # Saldo de fechamento por produto, só nos dias em que houve movimentação
+        '''CREATE TABLE IF NOT EXISTS saldos_estoque (
+            produto_id INTEGER NOT NULL,
+            dia TEXT NOT NULL, -- AAAA-MM-DD, como date(movimentacoes_estoque.data_hora)
+            estoque INTEGER NOT NULL,
+            PRIMARY KEY (produto_id, dia),
+            FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE
+        ) WITHOUT ROWID''',
+        # Dias já fechados pelo job de manutenção; depois do último, vale o histórico de movimentações
+        '''CREATE TABLE IF NOT EXISTS fechamentos_estoque (
+            dia TEXT PRIMARY KEY,
+            gerado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        _fechar_saldos_estoque, # Fecha o histórico existente até ontem
+    )),
+    (7, "Vendas importadas do diário dos caixas", (
+        # Identificador da venda no diário do caixa ("<terminal>-<sessão>-<sequência>"); NULL nas vendas feitas no banco
+        "ALTER TABLE vendas ADD COLUMN origem TEXT",
+        # Impede importar a mesma venda duas vezes (sincronização repetida após uma falha)
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_vendas_origem ON vendas (origem) WHERE origem IS NOT NULL",
+        # Quantidade vendida offline além do estoque que o banco tinha (compensada com um 'ajuste')
+        '''CREATE TABLE IF NOT EXISTS conflitos_estoque (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            venda_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            data_hora DATETIME NOT NULL, -- Da venda, não da sincronização
+            FOREIGN KEY (venda_id) REFERENCES vendas(id) ON DELETE CASCADE,
+            FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_conflitos_estoque_data_hora ON conflitos_estoque (data_hora)",
+    )),
+    (8, "Histórico de preços e reajuste por fornecedor", (
+        # Reajustes em lote filtram por fornecedor
+        "CREATE INDEX IF NOT EXISTS idx_produtos_fornecedor ON produtos (fornecedor)",
+        '''CREATE TABLE IF NOT EXISTS historico_precos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produto_id INTEGER NOT NULL,
+            data_hora DATETIME DEFAULT CURRENT_TIMESTAMP,
+            preco_custo_anterior REAL,
+            preco_custo_novo REAL,
+            preco_venda_anterior REAL,
+            preco_venda_novo REAL,
+            motivo TEXT, -- Ex: 'Reajuste: custo +8%', 'Importação de produtos'; NULL = edição do cadastro
+            usuario_id INTEGER,
+            FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_historico_precos_data_hora ON historico_precos (data_hora)",
+        "CREATE INDEX IF NOT EXISTS idx_historico_precos_produto ON historico_precos (produto_id, data_hora)",
+        # Toda alteração de preço fica registrada, venha de onde vier (cadastro, importação, reajuste)
+        '''CREATE TRIGGER IF NOT EXISTS produtos_historico_precos AFTER UPDATE OF preco_custo, preco_venda ON produtos
+        WHEN old.preco_custo IS NOT new.preco_custo OR old.preco_venda IS NOT new.preco_venda BEGIN
+            INSERT INTO historico_precos (produto_id, preco_custo_anterior, preco_custo_novo, preco_venda_anterior, preco_venda_novo)
+            VALUES (new.id, old.preco_custo, new.preco_custo, old.preco_venda, new.preco_venda);
+        END''',
+    )),
+]
+
+def versao_esquema():
+    """Retorna a versão atual do esquema (0 se nenhuma migração foi aplicada)."""
+    with conexao() as conn:
+        existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+        if not existe:
+            return 0
+        return conn.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_version").fetchone()[0]
+
+def aplicar_migracoes():
+    """Aplica, em ordem e cada uma em sua transação, as migrações ainda pendentes.
 
-    # Adicionar usuário admin padrão se não existir
-    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'") # Fechar parêntese aqui
-    if not cursor.fetchone():
-        senha_hash = hashlib.sha256('admin'.encode('utf-8')).hexdigest()
-        cursor.execute("INSERT INTO usuarios (nome, usuario, senha, tipo) VALUES (?, ?, ?, ?)",
-                       ('Administrador', 'admin', senha_hash, 'admin'))
+    Retorna a lista de versões aplicadas nesta chamada.
+    """
+    with transacao_escrita() as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
 
-    conn.commit()
-    conn.close()
+    aplicadas = []
+    for versao, descricao, passos in MIGRACOES:
+        with transacao_escrita() as conn:
+            # Rechecagem dentro da transação: outro processo pode ter migrado antes
+            if conn.execute("SELECT 1 FROM schema_version WHERE versao = ?", (versao,)).fetchone():
+                continue
+            for passo in passos:
+                if callable(passo):
+                    passo(conn)
+                else:
+                    conn.execute(passo)
+            conn.execute("INSERT INTO schema_version (versao, descricao) VALUES (?, ?)", (versao, descricao))
+        print(f"Migração {versao} aplicada: {descricao}")
+        aplicadas.append(versao)
+    return aplicadas
 
 def hash_senha(senha):
     """Gera o hash SHA256 de uma senha."""
@@ -106,284 +641,1403 @@ def hash_senha(senha):
 
 def autenticar_usuario(usuario, senha):
     """Verifica as credenciais do usuário no banco de dados."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
     senha_hash = hash_senha(senha)
-    cursor.execute("SELECT id, nome, tipo FROM usuarios WHERE usuario = ? AND senha = ?", (usuario, senha_hash))
-    resultado = cursor.fetchone()
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.execute("SELECT id, nome, tipo FROM usuarios WHERE usuario = ? AND senha = ?", (usuario, senha_hash))
+        resultado = cursor.fetchone()
     if resultado:
         return dict(resultado)
     return None
 
+# --- Cache do Catálogo de Produtos ---
+
+class CatalogoProdutos:
+    """Cache write-through do catálogo de produtos, indexado por id e por código de barras.
+
+    As funções de escrita deste módulo atualizam o cache logo após o commit. `versao`
+    aumenta a cada alteração: quem guardou dados do catálogo compara com
+    versao_catalogo() para saber se precisa recarregar. Uma leitura do banco só é
+    guardada se nenhuma escrita aconteceu enquanto ela rodava.
+
+    Cada alteração também entra num registro (versão, produto_id) limitado a
+    LIMITE_ALTERACOES, consultado por alteracoes_desde() para atualizar só os
+    produtos que mudaram.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_id = {}
+        self._id_por_codigo = {}
+        self._ordem_nome = None # Ids ordenados por nome, calculado sob demanda
+        self.completo = False # True quando todos os produtos do banco estão no cache
+        self.versao = 0
+        self._alteracoes = deque()
+        self._versao_base = 0 # Versões anteriores a esta não têm o registro de alterações completo
+
+    def _guardar(self, produto):
+        anterior = self._por_id.get(produto['id'])
+        if anterior is not None and anterior['codigo_barras']:
+            self._id_por_codigo.pop(anterior['codigo_barras'], None)
+        self._por_id[produto['id']] = produto
+        if produto['codigo_barras']:
+            self._id_por_codigo[produto['codigo_barras']] = produto['id']
+
+    def _registrar_alteracao(self, produto_ids):
+        self.versao += 1
+        for produto_id in produto_ids:
+            if len(self._alteracoes) >= LIMITE_ALTERACOES:
+                self._versao_base = self._alteracoes.popleft()[0]
+            self._alteracoes.append((self.versao, produto_id))
+
+    def alteracoes_desde(self, versao):
+        """Retorna (ids alterados após `versao`, versão atual), ou (None, versão atual)
+        se o registro não cobre `versao` e quem pergunta precisa recarregar tudo."""
+        with self._lock:
+            if versao < self._versao_base:
+                return None, self.versao
+            ids = set()
+            for versao_alteracao, produto_id in reversed(self._alteracoes):
+                if versao_alteracao <= versao:
+                    break
+                ids.add(produto_id)
+            return ids, self.versao
+
+    def obter_por_id(self, produto_id):
+        """Retorna (cópia do produto ou None, encontrado_no_cache, versão)."""
+        with self._lock:
+            produto = self._por_id.get(produto_id)
+            if produto is not None:
+                return dict(produto), True, self.versao
+            return None, self.completo, self.versao
+
+    def obter_por_codigo(self, codigo_barras):
+        with self._lock:
+            produto_id = self._id_por_codigo.get(codigo_barras)
+            if produto_id is not None:
+                return dict(self._por_id[produto_id]), True, self.versao
+            return None, self.completo, self.versao
+
+    def listar(self):
+        """Todos os produtos ordenados por nome, ou None se o catálogo não estiver completo."""
+        with self._lock:
+            if not self.completo:
+                return None
+            if self._ordem_nome is None:
+                self._ordem_nome = sorted(self._por_id, key=lambda pid: (self._por_id[pid]['nome'], pid))
+            return [dict(self._por_id[pid]) for pid in self._ordem_nome]
+
+    def carregar(self, produtos, versao_leitura, completo=False):
+        """Guarda produtos lidos do banco, se o catálogo não mudou desde `versao_leitura`."""
+        with self._lock:
+            if versao_leitura != self.versao:
+                return
+            if completo:
+                self._por_id = {}
+                self._id_por_codigo = {}
+                self.completo = True
+            for produto in produtos:
+                self._guardar(dict(produto))
+            self._ordem_nome = None
+
+    def gravar(self, produto):
+        """Insere/substitui um produto (write-through após INSERT/UPDATE)."""
+        with self._lock:
+            self._guardar(dict(produto))
+            self._ordem_nome = None
+            self._registrar_alteracao((produto['id'],))
+
+    def gravar_lote(self, produtos):
+        """Insere/substitui vários produtos com uma única nova versão (importação em lote)."""
+        with self._lock:
+            for produto in produtos:
+                self._guardar(dict(produto))
+            self._ordem_nome = None
+            self._registrar_alteracao([produto['id'] for produto in produtos])
+
+    def atualizar_campos(self, alteracoes):
+        """Aplica {produto_id: {coluna: valor}} já gravados no banco (ex.: reajuste de preços)."""
+        with self._lock:
+            for produto_id, campos in alteracoes.items():
+                produto = self._por_id.get(produto_id)
+                if produto is not None:
+                    produto.update(campos)
+            self._registrar_alteracao(alteracoes)
+
+    def remover(self, produto_id):
+        with self._lock:
+            produto = self._por_id.pop(produto_id, None)
+            if produto is not None and produto['codigo_barras']:
+                self._id_por_codigo.pop(produto['codigo_barras'], None)
+            self._ordem_nome = None
+            self._registrar_alteracao((produto_id,))
+
+    def ajustar_estoque(self, deltas):
+        """Aplica variações de estoque {produto_id: delta} já gravadas no banco."""
+        with self._lock:
+            for produto_id, delta in deltas.items():
+                produto = self._por_id.get(produto_id)
+                if produto is not None:
+                    produto['estoque'] += delta
+            self._registrar_alteracao(deltas)
+
+    def invalidar(self, *produto_ids):
+        """Descarta os produtos informados (ou o catálogo inteiro, se nenhum id for passado)."""
+        with self._lock:
+            if not produto_ids:
+                self._por_id = {}
+                self._id_por_codigo = {}
+            for produto_id in produto_ids:
+                produto = self._por_id.pop(produto_id, None)
+                if produto is not None and produto['codigo_barras']:
+                    self._id_por_codigo.pop(produto['codigo_barras'], None)
+            self.completo = False
+            self._ordem_nome = None
+            self._registrar_alteracao(produto_ids)
+            if not produto_ids: # Qualquer produto pode ter mudado
+                self._alteracoes.clear()
+                self._versao_base = self.versao
+
+_catalogo = CatalogoProdutos()
+
+def versao_catalogo():
+    """Versão atual do catálogo em memória (muda a cada escrita em produtos/estoque)."""
+    return _catalogo.versao
+
+def produtos_alterados_desde(versao):
+    """Ids dos produtos alterados (cadastro, vendas, entradas de estoque) após `versao`.
+
+    Retorna (ids, versão atual); ids é None se não for possível saber e quem pergunta
+    deve recarregar a lista inteira. Guarde a versão retornada para a próxima chamada.
+    """
+    return _catalogo.alteracoes_desde(versao)
+
+def invalidar_cache_produtos(*produto_ids):
+    """Descarta do cache os produtos informados (ou todos). Use após escritas feitas fora deste módulo."""
+    _catalogo.invalidar(*produto_ids)
+
 # --- Funções CRUD Produtos ---
 
 def adicionar_produto(codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo):
     """Adiciona um novo produto ao banco de dados."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''INSERT INTO produtos (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo)
-                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                      (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo))
-        produto_id = cursor.lastrowid
-        # Registrar estoque inicial
-        if estoque > 0:
-            registrar_movimentacao_estoque(produto_id, 'inicial', estoque, motivo='Cadastro inicial')
-        conn.commit()
+        with transacao_escrita() as conn:
+            cursor = conn.execute('''INSERT INTO produtos (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                          (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo))
+            produto_id = cursor.lastrowid
+            # Registrar estoque inicial (mesma conexão/transação)
+            if estoque > 0:
+                registrar_movimentacao_estoque(produto_id, 'inicial', estoque, motivo='Cadastro inicial', conn_externa=conn)
+        _catalogo.gravar({'id': produto_id, 'codigo_barras': codigo_barras, 'nome': nome, 'preco_custo': preco_custo,
+                          'preco_venda': preco_venda, 'estoque': estoque, 'fornecedor': fornecedor,
+                          'estoque_minimo': estoque_minimo})
         return True
     except sqlite3.IntegrityError: # Caso código de barras já exista
         return False
-    finally:
-        conn.close()
 
-def listar_produtos(termo_busca=''):
-    """Lista todos os produtos ou filtra por nome ou código."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    if termo_busca:
-        cursor.execute("SELECT * FROM produtos WHERE nome LIKE ? OR codigo_barras LIKE ? ORDER BY nome", ('%'+termo_busca+'%', '%'+termo_busca+'%'))
-    else:
-        cursor.execute("SELECT * FROM produtos ORDER BY nome")
-    produtos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+def _consulta_fts(termo_busca):
+    """Converte o texto digitado em uma consulta FTS5: todas as palavras, cada uma como prefixo."""
+    palavras = re.findall(r"\w+", termo_busca)
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+_fts_em_uso = True # Se a última busca usou o FTS5; filtrar_produtos() segue o mesmo critério sem abrir o banco
+
+def _fts_disponivel(conn):
+    global _fts_em_uso
+    _fts_em_uso = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'").fetchone() is not None
+    return _fts_em_uso
+
+def listar_produtos(termo_busca='', limite=LIMITE_BUSCA):
+    """Lista todos os produtos ou filtra por nome ou código.
+
+    Com termo de busca, usa o índice FTS5 (prefixo de cada palavra, sem diferenciar
+    acentos), ordena por relevância e retorna no máximo `limite` produtos (None = sem limite).
+    Se o termo tiver mais de `limite` ocorrências, retorna as primeiras encontradas em
+    ordem de nome (o usuário ainda está digitando/refinando).
+    """
+    ordenar_por_nome = False
+    with conexao() as conn:
+        consulta_fts = _consulta_fts(termo_busca) if termo_busca else ''
+        if consulta_fts and _fts_disponivel(conn):
+            # Ordenar por relevância calcula o rank de todas as ocorrências. Termo amplo demais
+            # (mais de `limite` ocorrências, ex.: a primeira letra digitada) retorna as primeiras
+            # encontradas, em ordem de nome, sem pagar por isso.
+            amplo = limite is not None and conn.execute('''SELECT count(*) FROM
+                                                         (SELECT rowid FROM produtos_fts WHERE produtos_fts MATCH ? LIMIT ?)''',
+                                                         (consulta_fts, limite + 1)).fetchone()[0] > limite
+            cursor = conn.execute(f'''SELECT p.* FROM produtos_fts f
+                                  JOIN produtos p ON p.id = f.rowid
+                                  WHERE produtos_fts MATCH ?
+                                  {"" if amplo else "ORDER BY f.rank, p.nome"}
+                                  LIMIT ?''',
+                                  (consulta_fts, limite if limite is not None else -1))
+            ordenar_por_nome = amplo
+        elif termo_busca:
+            cursor = conn.execute("SELECT * FROM produtos WHERE nome LIKE ? OR codigo_barras LIKE ? ORDER BY nome LIMIT ?",
+                                  ('%'+termo_busca+'%', '%'+termo_busca+'%', limite if limite is not None else -1))
+        else:
+            produtos = _catalogo.listar()
+            if produtos is not None:
+                return produtos
+            versao = _catalogo.versao
+            cursor = conn.execute("SELECT * FROM produtos ORDER BY nome")
+        produtos = [dict(row) for row in cursor.fetchall()]
+    if ordenar_por_nome:
+        produtos.sort(key=lambda p: (p['nome'], p['id']))
+    if not termo_busca:
+        _catalogo.carregar(produtos, versao, completo=True)
     return produtos
 
+def _normalizar_busca(texto):
+    """Minúsculas e sem acentos, como o tokenizador unicode61 (remove_diacritics 2)."""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+def filtrar_produtos(produtos, termo_busca):
+    """Aplica em memória o filtro de listar_produtos(termo_busca) a produtos já buscados.
+
+    Serve para refinar um resultado anterior (ex.: "arr" -> "arroz") sem voltar ao
+    banco; a ordem do resultado anterior é mantida. Só trabalha em memória (não
+    abre o banco), então pode ser usada no modo cliente e na thread do Tk.
+    """
+    if not termo_busca:
+        return list(produtos)
+    if not (_consulta_fts(termo_busca) and _fts_em_uso): # Mesmo critério do LIKE '%termo%'
+        termo = termo_busca.lower()
+        return [p for p in produtos
+                if termo in p['nome'].lower() or termo in (p['codigo_barras'] or '').lower()]
+    palavras = re.findall(r"[^\W_]+", _normalizar_busca(termo_busca))
+    resultado = []
+    for produto in produtos:
+        tokens = re.findall(r"[^\W_]+", _normalizar_busca(f"{produto['nome']} {produto['codigo_barras'] or ''}"))
+        if all(any(token.startswith(palavra) for token in tokens) for palavra in palavras):
+            resultado.append(produto)
+    return resultado
+
 def buscar_produto_por_id(produto_id):
-    """Busca um produto pelo seu ID."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM produtos WHERE id = ?", (produto_id,))
-    produto = cursor.fetchone()
-    conn.close()
-    return dict(produto) if produto else None
-
-def atualizar_produto(produto_id, codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo):
-    """Atualiza os dados de um produto existente."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    """Busca um produto pelo seu ID (catálogo em memória, depois o banco)."""
+    produto, no_cache, versao = _catalogo.obter_por_id(produto_id)
+    if no_cache:
+        return produto
+    with conexao() as conn:
+        produto = conn.execute("SELECT * FROM produtos WHERE id = ?", (produto_id,)).fetchone()
+    if produto is None:
+        return None
+    _catalogo.carregar([produto], versao)
+    return dict(produto)
+
+def buscar_produtos_por_ids(produto_ids):
+    """Lista dos produtos com os IDs dados (os inexistentes ficam de fora).
+
+    Os que não estão no catálogo em memória vêm numa única consulta; no modo
+    cliente, atualizar várias linhas de uma lista custa uma só requisição.
+    """
+    versao = _catalogo.versao # Lida antes da consulta
+    produtos, faltantes = [], []
+    for produto_id in produto_ids:
+        produto, no_cache, _ = _catalogo.obter_por_id(produto_id)
+        if produto is not None:
+            produtos.append(produto)
+        elif not no_cache:
+            faltantes.append(produto_id)
+    if faltantes:
+        with conexao() as conn:
+            linhas = conn.execute("SELECT * FROM produtos WHERE id IN (SELECT value FROM json_each(?))",
+                                  (json.dumps(faltantes),)).fetchall()
+        _catalogo.carregar(linhas, versao)
+        produtos.extend(dict(linha) for linha in linhas)
+    return produtos
+
+def buscar_produto_por_codigo_barras(codigo_barras):
+    """Busca um produto pelo código de barras exato (catálogo em memória + índice UNIQUE)."""
+    codigo_barras = (codigo_barras or '').strip()
+    if not codigo_barras:
+        return None
+    produto, no_cache, versao = _catalogo.obter_por_codigo(codigo_barras)
+    if no_cache:
+        return produto
+    with conexao() as conn:
+        produto = conn.execute("SELECT * FROM produtos WHERE codigo_barras = ?", (codigo_barras,)).fetchone()
+    if produto is None:
+        return None
+    _catalogo.carregar([produto], versao)
+    return dict(produto)
+
+def atualizar_produto(produto_id, codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo,
+                      usuario_id=None):
+    """Atualiza os dados de um produto existente.
+
+    Se `estoque` for diferente do atual, a diferença é gravada como movimentação
+    'ajuste' na mesma transação: os saldos diários e estoque_em() partem só das
+    movimentações.
+    """
     try:
-        cursor.execute('''UPDATE produtos SET
+        with transacao_escrita() as conn:
+            atual = conn.execute("SELECT estoque FROM produtos WHERE id = ?", (produto_id,)).fetchone()
+            if atual is not None and estoque != atual[0]:
+                conn.execute('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, motivo, usuario_id)
+                             VALUES (?, 'ajuste', ?, 'Ajuste no cadastro do produto', ?)''',
+                             (produto_id, estoque - atual[0], usuario_id))
+            cursor = conn.execute('''UPDATE produtos SET
                       codigo_barras = ?, nome = ?, preco_custo = ?, preco_venda = ?, estoque = ?, fornecedor = ?, estoque_minimo = ?
                       WHERE id = ?''',
                       (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo, produto_id))
-        conn.commit()
+            atualizado = cursor.rowcount > 0
+        if atualizado:
+            _catalogo.gravar({'id': produto_id, 'codigo_barras': codigo_barras, 'nome': nome, 'preco_custo': preco_custo,
+                              'preco_venda': preco_venda, 'estoque': estoque, 'fornecedor': fornecedor,
+                              'estoque_minimo': estoque_minimo})
         return True
     except sqlite3.IntegrityError:
         return False # Provavelmente código de barras duplicado
-    finally:
-        conn.close()
 
 def excluir_produto(produto_id):
     """Exclui um produto do banco de dados. Retorna True se sucesso, False se falhar (provavelmente por restrição FK)."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
     try:
-        # Tenta excluir. Se o produto estiver em itens_venda, a restrição FK (ON DELETE RESTRICT) causará um erro.
-        cursor.execute("DELETE FROM produtos WHERE id = ?", (produto_id,))
-        # Se chegou aqui, a exclusão foi permitida (produto não estava em itens_venda)
-        # Excluir movimentações de estoque relacionadas (ON DELETE CASCADE faz isso automaticamente, mas podemos garantir)
-        cursor.execute("DELETE FROM movimentacoes_estoque WHERE produto_id = ?", (produto_id,))
-        conn.commit()
+        with transacao_escrita() as conn:
+            # Tenta excluir. Se o produto estiver em itens_venda, a restrição FK (ON DELETE RESTRICT) causará um erro.
+            conn.execute("DELETE FROM produtos WHERE id = ?", (produto_id,))
+            # Se chegou aqui, a exclusão foi permitida (produto não estava em itens_venda)
+            # Excluir movimentações de estoque relacionadas (ON DELETE CASCADE faz isso automaticamente, mas podemos garantir)
+            conn.execute("DELETE FROM movimentacoes_estoque WHERE produto_id = ?", (produto_id,))
+        _catalogo.remover(produto_id)
         return True
     except sqlite3.IntegrityError as e:
         # Erro esperado se o produto estiver em itens_venda
         print(f"Erro de integridade ao excluir produto {produto_id} (provavelmente está em uma venda): {e}")
-        conn.rollback()
         return False
     except Exception as e:
         print(f"Erro inesperado ao excluir produto {produto_id}: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 def atualizar_estoque_produto(produto_id, quantidade_alteracao, tipo_movimentacao):
     """Atualiza o estoque de um produto (soma ou subtrai). Usado internamente por outras funções."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    if tipo_movimentacao == 'entrada':
-        cursor.execute("UPDATE produtos SET estoque = estoque + ? WHERE id = ?", (quantidade_alteracao, produto_id))
-    elif tipo_movimentacao == 'saida':
-        cursor.execute("UPDATE produtos SET estoque = estoque - ? WHERE id = ?", (quantidade_alteracao, produto_id))
-    else: # inicial ou ajuste - define o estoque diretamente (embora ajuste possa ser +/-)
-         # Para simplificar, vamos tratar ajuste como entrada/saída manual via registrar_movimentacao_estoque
-         pass
-    conn.commit()
-    conn.close()
+    delta = 0
+    with transacao_escrita() as conn:
+        if tipo_movimentacao == 'entrada':
+            conn.execute("UPDATE produtos SET estoque = estoque + ? WHERE id = ?", (quantidade_alteracao, produto_id))
+            delta = quantidade_alteracao
+        elif tipo_movimentacao == 'saida':
+            conn.execute("UPDATE produtos SET estoque = estoque - ? WHERE id = ?", (quantidade_alteracao, produto_id))
+            delta = -quantidade_alteracao
+        else: # inicial ou ajuste - define o estoque diretamente (embora ajuste possa ser +/-)
+             # Para simplificar, vamos tratar ajuste como entrada/saída manual via registrar_movimentacao_estoque
+             pass
+    if delta:
+        _catalogo.ajustar_estoque({produto_id: delta})
+
+# --- Importação de Produtos em Lote ---
+
+COLUNAS_PRODUTOS = ('codigo_barras', 'nome', 'preco_custo', 'preco_venda', 'estoque', 'fornecedor', 'estoque_minimo')
+# Colunas que a planilha não trouxer, em produtos novos (mesmos padrões do cadastro pela interface)
+PADROES_PRODUTO = {'preco_custo': 0.0, 'estoque': 0, 'fornecedor': '', 'estoque_minimo': 5}
+
+def importar_produtos(produtos, usuario_id=None):
+    """Cadastra ou atualiza, numa única transação, um lote de produtos identificados pelo código de barras.
+
+    Cada produto é um dict com codigo_barras e as colunas de COLUNAS_PRODUTOS que a
+    planilha trouxer, já convertidas (ver importacao.py). Produtos novos precisam
+    de nome e preco_venda; as demais colunas ausentes recebem PADROES_PRODUTO e o
+    estoque entra como movimentação 'inicial'. Em produtos já cadastrados só as
+    colunas presentes mudam, e o estoque não é alterado (isso é feito por
+    movimentações); produtos sem alteração não são regravados. Se o código se
+    repetir no lote, vale a primeira linha.
+
+    Usa um número fixo de comandos por lote. Retorna um dict com
+    novos, atualizados, inalterados e rejeitados ({índice no lote: motivo}).
+    """
+    resultado = {"novos": 0, "atualizados": 0, "inalterados": 0, "rejeitados": {}}
+    por_codigo = {}
+    for indice, produto in enumerate(produtos):
+        codigo = produto.get('codigo_barras')
+        if not codigo:
+            resultado["rejeitados"][indice] = "sem código de barras"
+        elif codigo in por_codigo:
+            resultado["rejeitados"][indice] = f"código {codigo} repetido no lote"
+        else:
+            por_codigo[codigo] = (indice, {coluna: produto[coluna] for coluna in COLUNAS_PRODUTOS if coluna in produto})
+    if not por_codigo:
+        return resultado
+
+    novos, alterados, renomeados = [], [], []
+    with transacao_escrita() as conn:
+        ultimo_historico = _ultimo_historico_precos(conn)
+        existentes = {row['codigo_barras']: dict(row) for row in conn.execute(
+            "SELECT * FROM produtos WHERE codigo_barras IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(por_codigo)),))}
+        for codigo, (indice, produto) in por_codigo.items():
+            atual = existentes.get(codigo)
+            if atual is None:
+                if not produto.get('nome') or produto.get('preco_venda') is None:
+                    resultado["rejeitados"][indice] = "produto novo sem nome ou preço de venda"
+                else:
+                    novos.append({**PADROES_PRODUTO, **produto})
+                continue
+            produto.pop('estoque', None)
+            novo = {**atual, **produto}
+            if novo == atual:
+                resultado["inalterados"] += 1
+            elif novo['nome'] != atual['nome']:
+                renomeados.append(novo)
+            else:
+                alterados.append(novo)
+
+        # Inserções e renomeações disparam os triggers do FTS, que grava o índice no fim de cada
+        # comando: um único INSERT/UPDATE com json_each por lote, em vez de um comando por produto
+        if novos:
+            conn.execute('''INSERT INTO produtos (codigo_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo)
+                         SELECT json_extract(value, '$.codigo_barras'), json_extract(value, '$.nome'),
+                                json_extract(value, '$.preco_custo'), json_extract(value, '$.preco_venda'),
+                                json_extract(value, '$.estoque'), json_extract(value, '$.fornecedor'),
+                                json_extract(value, '$.estoque_minimo')
+                         FROM json_each(?)''', (json.dumps(novos),))
+        if renomeados:
+            conn.execute('''UPDATE produtos SET nome = json_extract(r.value, '$.nome'),
+                                preco_custo = json_extract(r.value, '$.preco_custo'),
+                                preco_venda = json_extract(r.value, '$.preco_venda'),
+                                fornecedor = json_extract(r.value, '$.fornecedor'),
+                                estoque_minimo = json_extract(r.value, '$.estoque_minimo')
+                         FROM json_each(?) AS r
+                         WHERE produtos.id = json_extract(r.value, '$.id')''', (json.dumps(renomeados),))
+        # Sem o nome no SET, o trigger do FTS não dispara para produtos que só mudaram de preço
+        conn.executemany('''UPDATE produtos SET preco_custo = :preco_custo, preco_venda = :preco_venda,
+                                fornecedor = :fornecedor, estoque_minimo = :estoque_minimo
+                         WHERE id = :id''', alterados)
+        _anotar_historico_precos(conn, ultimo_historico, "Importação de produtos", usuario_id)
+        if novos:
+            ids = dict(conn.execute("SELECT codigo_barras, id FROM produtos WHERE codigo_barras IN (SELECT value FROM json_each(?))",
+                                    (json.dumps([produto['codigo_barras'] for produto in novos]),)).fetchall())
+            for produto in novos:
+                produto['id'] = ids[produto['codigo_barras']]
+            conn.executemany('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, motivo, usuario_id)
+                             VALUES (?, 'inicial', ?, 'Importação de produtos', ?)''',
+                             [(produto['id'], produto['estoque'], usuario_id) for produto in novos if produto['estoque'] > 0])
+
+    if novos or alterados or renomeados:
+        _catalogo.gravar_lote(novos + alterados + renomeados)
+    resultado["novos"] = len(novos)
+    resultado["atualizados"] = len(alterados) + len(renomeados)
+    return resultado
+
+# --- Reajuste de Preços em Lote ---
+
+# Regras de reajuste, aplicadas em ordem (cada uma parte do resultado da anterior):
+#   {"tipo": "percentual_custo", "valor": 8}    custo = custo × 1,08
+#   {"tipo": "percentual_venda", "valor": -5}   venda = venda × 0,95
+#   {"tipo": "markup", "valor": 1.8}            venda = custo × 1,8
+#   {"tipo": "terminacao", "valor": 0.90}       venda arredondada para cima até terminar em ,90
+TIPOS_REGRA_PRECO = ("percentual_custo", "percentual_venda", "markup", "terminacao")
+
+def _ultimo_historico_precos(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM historico_precos").fetchone()[0]
+
+def _anotar_historico_precos(conn, desde_id, motivo, usuario_id):
+    """Completa motivo e usuário das linhas que o trigger gravou em historico_precos após `desde_id`."""
+    conn.execute("UPDATE historico_precos SET motivo = ?, usuario_id = ? WHERE id > ?", (motivo, usuario_id, desde_id))
+
+def _expressoes_reajuste(regras):
+    """Expressões SQL (novo custo, nova venda) das regras aplicadas em sequência.
+
+    Os valores das regras passam por float() e entram no SQL como literais, porque
+    cada regra é composta sobre a expressão da anterior. ValueError se alguma
+    regra for inválida.
+    """
+    if not regras:
+        raise ValueError("Nenhuma regra de reajuste informada.")
+    custo, venda = "preco_custo", "preco_venda"
+    for regra in regras:
+        tipo = regra.get("tipo")
+        try:
+            valor = float(regra.get("valor"))
+        except (TypeError, ValueError):
+            raise ValueError(f"Valor inválido na regra {tipo}: {regra.get('valor')!r}")
+        if not math.isfinite(valor): # inf/nan passariam pelas comparações abaixo e iriam para o SQL
+            raise ValueError(f"Valor inválido na regra {tipo}: {regra.get('valor')!r}")
+        if tipo in ("percentual_custo", "percentual_venda"):
+            if valor <= -100:
+                raise ValueError("O percentual de reajuste deve ser maior que -100%.")
+            fator = repr(1 + valor / 100)
+            if tipo == "percentual_custo":
+                custo = f"ROUND(({custo}) * {fator}, 2)"
+            else:
+                venda = f"ROUND(({venda}) * {fator}, 2)"
+        elif tipo == "markup":
+            if valor <= 0:
+                raise ValueError("O markup deve ser maior que zero.")
+            venda = f"ROUND(({custo}) * {valor!r}, 2)"
+        elif tipo == "terminacao":
+            if not 0 <= valor < 1:
+                raise ValueError("A terminação deve estar entre 0,00 e 0,99.")
+            # Menor preço >= venda terminado em `valor`: teto(venda - valor) + valor. Com o
+            # valor em centavos, teto(x) = CAST(x + 0.995 AS INTEGER) (SQLite não tem CEIL)
+            venda = f"ROUND(CAST(ROUND(({venda}) - {valor!r}, 2) + 0.995 AS INTEGER) + {valor!r}, 2)"
+        else:
+            raise ValueError(f"Tipo de regra desconhecido: {tipo!r} (use {', '.join(TIPOS_REGRA_PRECO)})")
+    return custo, venda
+
+def descrever_regras(regras):
+    """Texto das regras, ex.: "custo +8%, markup 1.8, terminação 0.90" (gravado no histórico de preços)."""
+    partes = []
+    for regra in regras:
+        valor = float(regra["valor"])
+        if regra["tipo"] == "percentual_custo":
+            partes.append(f"custo {valor:+g}%")
+        elif regra["tipo"] == "percentual_venda":
+            partes.append(f"venda {valor:+g}%")
+        elif regra["tipo"] == "markup":
+            partes.append(f"markup {valor:g}")
+        else:
+            partes.append(f"terminação {valor:.2f}")
+    return ", ".join(partes)
+
+def _reajuste(regras, fornecedor=None, produto_ids=None):
+    """(novo custo, nova venda, WHERE, parâmetros) do reajuste; o WHERE seleciona só os produtos que mudam."""
+    custo, venda = _expressoes_reajuste(regras)
+    condicoes, params = [], []
+    if fornecedor is not None:
+        condicoes.append("fornecedor = ?")
+        params.append(fornecedor)
+    if produto_ids is not None:
+        condicoes.append("id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(produto_ids)))
+    condicoes.append(f"(({custo}) IS NOT preco_custo OR ({venda}) IS NOT preco_venda)")
+    # Produtos cujo novo preço de venda não seria positivo (ex.: markup sobre custo zerado) ficam de fora
+    condicoes.append(f"({venda}) > 0")
+    return custo, venda, " AND ".join(condicoes), params
+
+def simular_reajuste(regras, fornecedor=None, produto_ids=None):
+    """Produtos que aplicar_reajuste() alteraria, com preços atuais e novos, sem gravar nada.
+
+    Filtra por `fornecedor` e/ou `produto_ids` (sem filtro: o catálogo inteiro).
+    """
+    custo, venda, filtro, params = _reajuste(regras, fornecedor, produto_ids)
+    with conexao() as conn:
+        cursor = conn.execute(f'''SELECT id, codigo_barras, nome, fornecedor, preco_custo, preco_venda,
+                                         {custo} AS novo_preco_custo, {venda} AS novo_preco_venda
+                               FROM produtos WHERE {filtro}
+                               ORDER BY nome, id''', params)
+        return [dict(row) for row in cursor.fetchall()]
+
+def aplicar_reajuste(regras, fornecedor=None, produto_ids=None, usuario_id=None, motivo=None):
+    """Aplica as regras de reajuste num único UPDATE, numa transação.
+
+    Os preços anteriores e novos de cada produto vão para historico_precos (pelo
+    trigger), com `motivo` (padrão: a descrição das regras) e `usuario_id`.
+    Retorna a quantidade de produtos alterados.
+    """
+    custo, venda, filtro, params = _reajuste(regras, fornecedor, produto_ids)
+    if motivo is None:
+        motivo = f"Reajuste: {descrever_regras(regras)}" + (f" (fornecedor {fornecedor})" if fornecedor is not None else "")
+    with transacao_escrita() as conn:
+        ultimo_historico = _ultimo_historico_precos(conn)
+        conn.execute(f"UPDATE produtos SET preco_custo = {custo}, preco_venda = {venda} WHERE {filtro}", params)
+        _anotar_historico_precos(conn, ultimo_historico, motivo, usuario_id)
+        # Os novos preços saem do histórico gravado pelo trigger, sem calcular as regras de novo
+        alterados = conn.execute('''SELECT produto_id, preco_custo_novo, preco_venda_novo FROM historico_precos
+                                   WHERE id > ?''', (ultimo_historico,)).fetchall()
+    if alterados:
+        _catalogo.atualizar_campos({produto_id: {'preco_custo': custo_novo, 'preco_venda': venda_novo}
+                                    for produto_id, custo_novo, venda_novo in alterados})
+    return len(alterados)
+
+def listar_fornecedores():
+    """Fornecedores cadastrados nos produtos, em ordem alfabética."""
+    with conexao() as conn:
+        return [row[0] for row in conn.execute('''SELECT DISTINCT fornecedor FROM produtos
+                                                WHERE fornecedor IS NOT NULL AND fornecedor != ''
+                                                ORDER BY fornecedor''')]
+
+def obter_historico_precos(data_inicio, data_fim, produto_id=None):
+    """Alterações de preço no período (mais recentes primeiro), opcionalmente de um produto."""
+    filtro_produto = "AND h.produto_id = ?" if produto_id is not None else ""
+    params = (data_inicio, f"{data_fim} 23:59:59") + ((produto_id,) if produto_id is not None else ())
+    with conexao() as conn:
+        cursor = conn.execute(f'''SELECT h.data_hora, p.nome AS produto, h.preco_custo_anterior, h.preco_custo_novo,
+                                         h.preco_venda_anterior, h.preco_venda_novo,
+                                         COALESCE(h.motivo, 'Edição do cadastro') AS motivo, u.nome AS usuario
+                               FROM historico_precos h
+                               JOIN produtos p ON p.id = h.produto_id
+                               LEFT JOIN usuarios u ON u.id = h.usuario_id
+                               WHERE h.data_hora BETWEEN ? AND ? {filtro_produto}
+                               ORDER BY h.data_hora DESC, h.id DESC''', params)
+        return [dict(row) for row in cursor.fetchall()]
 
 # --- Funções de Venda ---
 
 def registrar_venda(usuario_id, forma_pagamento, parcelas, total, itens_venda):
-    """Registra uma nova venda e seus itens, atualizando o estoque."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    try:
-        # Iniciar transação
-        conn.execute('BEGIN TRANSACTION')
-
-        # Registrar a venda
-        cursor.execute('''INSERT INTO vendas (usuario_id, forma_pagamento, parcelas, total)
-                      VALUES (?, ?, ?, ?)''',
-                      (usuario_id, forma_pagamento, parcelas, total))
-        venda_id = cursor.lastrowid
-
-        # Registrar os itens da venda e atualizar estoque
-        for item in itens_venda:
-            # Verificar estoque novamente dentro da transação para segurança
-            cursor.execute("SELECT estoque FROM produtos WHERE id = ?", (item['produto_id'],))
-            estoque_atual = cursor.fetchone()['estoque']
-            if item['quantidade'] > estoque_atual:
-                raise ValueError(f"Estoque insuficiente para {item['nome']} no momento da finalização.")
-
-            cursor.execute('''INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario)
-                          VALUES (?, ?, ?, ?)''',
-                          (venda_id, item['produto_id'], item['quantidade'], item['preco']))
-
-            # Atualizar estoque do produto
-            cursor.execute("UPDATE produtos SET estoque = estoque - ? WHERE id = ?", (item['quantidade'], item['produto_id']))
+    """Registra uma nova venda e seus itens, atualizando o estoque.
 
-            # Registrar saída no histórico de movimentações
-            # Usando a mesma conexão para manter a transação
-            registrar_movimentacao_estoque(item['produto_id'], 'saida', item['quantidade'],
-                                           motivo=f'Venda #{venda_id}', usuario_id=usuario_id, conn_externa=conn)
+    Com uma FilaVendas ativa (iniciar_fila_vendas), a venda entra no próximo
+    commit em grupo; o retorno e as exceções são os mesmos.
+    """
+    fila = _fila_vendas
+    if fila is not None and not obter_gerenciador().em_transacao():
+        return fila.registrar(usuario_id, forma_pagamento, parcelas, total, itens_venda)
+    try:
+        with transacao_escrita() as conn:
+            venda_id = _gravar_venda(conn, usuario_id, forma_pagamento, parcelas, total, itens_venda)
 
-        # Finalizar transação
-        conn.commit()
+        # Transação finalizada (commit) ao sair do bloco
+        _catalogo.ajustar_estoque(_deltas_estoque_venda(itens_venda))
         return venda_id
     except ValueError as ve:
         print(f"Erro ao registrar venda (ValueError): {ve}")
-        conn.rollback()
         raise ve # Re-lança a exceção para ser tratada na interface
     except Exception as e:
         print(f"Erro geral ao registrar venda: {e}")
-        conn.rollback()
         return None
-    finally:
-        conn.close()
+
+def _deltas_estoque_venda(itens_venda):
+    """Variação de estoque {produto_id: -quantidade} causada pelos itens de uma venda."""
+    deltas = {}
+    for item in itens_venda:
+        deltas[item['produto_id']] = deltas.get(item['produto_id'], 0) - item['quantidade']
+    return deltas
+
+def _gravar_venda(conn, usuario_id, forma_pagamento, parcelas, total, itens_venda):
+    """Grava venda, itens, baixa de estoque e movimentações na transação aberta em `conn`.
+
+    Usa um número fixo de comandos, independente da quantidade de itens. Lança
+    ValueError (sem commitar) se algum produto não tiver estoque suficiente.
+    """
+    # Soma as quantidades por produto (o mesmo produto pode aparecer em mais de uma linha)
+    quantidades = {}
+    nomes = {}
+    for item in itens_venda:
+        quantidades[item['produto_id']] = quantidades.get(item['produto_id'], 0) + item['quantidade']
+        nomes[item['produto_id']] = item.get('nome', f"produto {item['produto_id']}")
+    quantidades_json = json.dumps(list(quantidades.items()))
+
+    # Baixa de estoque em um único UPDATE condicional: só atualiza produtos com saldo suficiente
+    cursor = conn.execute('''UPDATE produtos SET estoque = produtos.estoque - q.quantidade
+                          FROM (SELECT json_extract(value, '$[0]') AS produto_id,
+                                       json_extract(value, '$[1]') AS quantidade
+                                FROM json_each(?)) AS q
+                          WHERE produtos.id = q.produto_id AND produtos.estoque >= q.quantidade''',
+                          (quantidades_json,))
+    if cursor.rowcount != len(quantidades):
+        # Algum produto faltou: descobre qual (uma consulta) e aborta a transação inteira
+        estoques = dict(conn.execute("SELECT id, estoque FROM produtos WHERE id IN (SELECT value FROM json_each(?))",
+                                     (json.dumps(list(quantidades)),)).fetchall())
+        for produto_id, quantidade in quantidades.items():
+            if quantidade > estoques.get(produto_id, 0):
+                raise ValueError(f"Estoque insuficiente para {nomes[produto_id]} no momento da finalização.")
+        raise ValueError("Estoque alterado durante a finalização da venda.")
+
+    # Registrar a venda
+    cursor = conn.execute('''INSERT INTO vendas (usuario_id, forma_pagamento, parcelas, total)
+                          VALUES (?, ?, ?, ?)''',
+                          (usuario_id, forma_pagamento, parcelas, total))
+    venda_id = cursor.lastrowid
+
+    # Itens da venda e saídas no histórico de movimentações, em lote
+    conn.executemany('''INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario)
+                     VALUES (?, ?, ?, ?)''',
+                     [(venda_id, item['produto_id'], item['quantidade'], item['preco']) for item in itens_venda])
+    conn.executemany('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, motivo, usuario_id)
+                     VALUES (?, 'saida', ?, ?, ?)''',
+                     [(item['produto_id'], item['quantidade'], f'Venda #{venda_id}', usuario_id) for item in itens_venda])
+
+    # Resumos diário e mensal (relatórios por período leem daqui em vez de agregar as vendas)
+    conn.execute('''INSERT INTO resumo_vendas_dia (dia, forma_pagamento, quantidade_vendas, total)
+                 SELECT date(data_hora), forma_pagamento, 1, total FROM vendas WHERE id = ?
+                 ON CONFLICT (dia, forma_pagamento) DO UPDATE SET
+                     quantidade_vendas = quantidade_vendas + 1,
+                     total = total + excluded.total''',
+                 (venda_id,))
+    conn.execute('''INSERT INTO resumo_produtos_dia (dia, produto_id, quantidade, receita)
+                 SELECT date(v.data_hora), iv.produto_id, SUM(iv.quantidade), SUM(iv.quantidade * iv.preco_unitario)
+                 FROM itens_venda iv
+                 JOIN vendas v ON v.id = iv.venda_id
+                 WHERE iv.venda_id = ?
+                 GROUP BY iv.produto_id
+                 ON CONFLICT (dia, produto_id) DO UPDATE SET
+                     quantidade = quantidade + excluded.quantidade,
+                     receita = receita + excluded.receita''',
+                 (venda_id,))
+    conn.execute('''INSERT INTO resumo_produtos_mes (mes, produto_id, quantidade, receita)
+                 SELECT strftime('%Y-%m', v.data_hora), iv.produto_id, SUM(iv.quantidade), SUM(iv.quantidade * iv.preco_unitario)
+                 FROM itens_venda iv
+                 JOIN vendas v ON v.id = iv.venda_id
+                 WHERE iv.venda_id = ?
+                 GROUP BY iv.produto_id
+                 ON CONFLICT (mes, produto_id) DO UPDATE SET
+                     quantidade = quantidade + excluded.quantidade,
+                     receita = receita + excluded.receita''',
+                 (venda_id,))
+    return venda_id
+
+# --- Commit em Grupo de Vendas ---
+
+class FilaVendas:
+    """Grava as vendas de vários produtores (threads) em commits em grupo.
+
+    Uma thread escritora retira da fila até `max_lote` vendas — esperando no
+    máximo `espera_max` segundos, a partir da primeira, pelas seguintes — e grava
+    todas numa única transação, com um só commit (e um só fsync). Cada venda fica
+    num SAVEPOINT próprio: se faltar estoque, só ela é desfeita e o chamador recebe
+    o ValueError, como em registrar_venda (qualquer outro erro da venda: None); as
+    outras do lote seguem. As vendas são validadas na ordem de chegada, cada uma
+    vendo a baixa de estoque das anteriores.
+
+    enviar() retorna um Future com o venda_id; registrar() espera por ele.
+    """
+
+    def __init__(self, max_lote=LOTE_VENDAS, espera_max=ESPERA_LOTE_VENDAS):
+        self.max_lote = max_lote
+        self.espera_max = espera_max
+        self._fila = queue.Queue()
+        self._lock = threading.Lock() # enviar() e encerrar(): nada entra na fila depois do sinal de parada
+        self.ativa = True
+        self.estatisticas = {"lotes": 0, "vendas": 0, "recusadas": 0, "falhas": 0}
+        self._thread = threading.Thread(target=self._escritor, name="fila-vendas", daemon=True)
+        self._thread.start()
+
+    def enviar(self, usuario_id, forma_pagamento, parcelas, total, itens_venda):
+        """Põe a venda na fila e retorna um concurrent.futures.Future com o venda_id."""
+        futuro = Future()
+        with self._lock:
+            if not self.ativa:
+                raise RuntimeError("Fila de vendas encerrada")
+            self._fila.put((futuro, (usuario_id, forma_pagamento, parcelas, total, list(itens_venda))))
+        return futuro
+
+    def registrar(self, usuario_id, forma_pagamento, parcelas, total, itens_venda):
+        """Como registrar_venda: retorna o venda_id, None em erro geral, ou lança ValueError."""
+        return self.enviar(usuario_id, forma_pagamento, parcelas, total, itens_venda).result()
+
+    def encerrar(self, espera=10):
+        """Grava o que já está na fila e para a thread escritora.
+
+        Nada entra na fila depois do sinal de parada, então a escritora grava tudo
+        antes de parar. Se ela tiver parado antes (por um erro inesperado), as vendas
+        que sobraram recebem RuntimeError, para nenhum chamador esperar para sempre.
+        """
+        with self._lock:
+            self.ativa = False
+            self._fila.put(None)
+        self._thread.join(espera)
+        if self._thread.is_alive():
+            return # Ainda gravando; o que está na fila é gravado antes do sinal de parada
+        while True:
+            try:
+                pedido = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if pedido is not None and pedido[0].set_running_or_notify_cancel():
+                pedido[0].set_exception(RuntimeError("Fila de vendas encerrada"))
+
+    def _proximo_lote(self):
+        primeira = self._fila.get()
+        if primeira is None:
+            return None
+        lote = [primeira]
+        limite = time.monotonic() + self.espera_max
+        while len(lote) < self.max_lote:
+            try:
+                pedido = self._fila.get(timeout=max(0, limite - time.monotonic()))
+            except queue.Empty:
+                break
+            if pedido is None:
+                self._fila.put(None) # Encerra depois de gravar este lote
+                break
+            lote.append(pedido)
+        return lote
+
+    def _escritor(self):
+        while True:
+            lote = self._proximo_lote()
+            if lote is None:
+                return
+            self._gravar_lote(lote)
+
+    def _gravar_lote(self, lote):
+        # Vendas cujo Future foi cancelado (ex.: requisição abandonada no servidor) não são gravadas;
+        # as demais ficam em execução e não podem mais ser canceladas
+        lote = [(futuro, venda) for futuro, venda in lote if futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+        resultados = [] # (futuro, venda_id ou exceção) só são entregues depois do commit
+        deltas = {}
+        try:
+            with transacao_escrita() as conn:
+                for futuro, venda in lote:
+                    conn.execute("SAVEPOINT venda")
+                    try:
+                        venda_id = _gravar_venda(conn, *venda)
+                    except Exception as e: # Estoque, integridade, item malformado...: só esta venda é desfeita
+                        conn.execute("ROLLBACK TO venda")
+                        resultados.append((futuro, e))
+                    else:
+                        for produto_id, delta in _deltas_estoque_venda(venda[4]).items():
+                            deltas[produto_id] = deltas.get(produto_id, 0) + delta
+                        resultados.append((futuro, venda_id))
+                    conn.execute("RELEASE venda")
+        except Exception as e:
+            # Commit (ou o lock de escrita) falhou: nenhuma venda do lote foi gravada
+            print(f"Erro geral ao registrar lote de {len(lote)} vendas: {e}")
+            self.estatisticas["falhas"] += len(lote)
+            for futuro, _ in lote:
+                futuro.set_result(None)
+            return
+        if deltas:
+            _catalogo.ajustar_estoque(deltas)
+        self.estatisticas["lotes"] += 1
+        for futuro, resultado in resultados:
+            if isinstance(resultado, ValueError):
+                print(f"Erro ao registrar venda (ValueError): {resultado}")
+                self.estatisticas["recusadas"] += 1
+                futuro.set_exception(resultado)
+            elif isinstance(resultado, Exception):
+                print(f"Erro geral ao registrar venda: {resultado}")
+                self.estatisticas["recusadas"] += 1
+                futuro.set_result(None)
+            else:
+                self.estatisticas["vendas"] += 1
+                futuro.set_result(resultado)
+
+_fila_vendas = None
+
+def iniciar_fila_vendas(max_lote=LOTE_VENDAS, espera_max=ESPERA_LOTE_VENDAS):
+    """Passa registrar_venda() a gravar pela FilaVendas (commits em grupo). Retorna a fila."""
+    global _fila_vendas
+    if _fila_vendas is None:
+        _fila_vendas = FilaVendas(max_lote, espera_max)
+    return _fila_vendas
+
+def encerrar_fila_vendas():
+    """Grava as vendas pendentes e volta registrar_venda() a uma transação por venda."""
+    global _fila_vendas
+    fila, _fila_vendas = _fila_vendas, None
+    if fila is not None:
+        fila.encerrar()
+
+def fila_vendas():
+    """A FilaVendas ativa, ou None."""
+    return _fila_vendas
+
+atexit.register(encerrar_fila_vendas) # Roda antes de fechar_conexoes (atexit é LIFO)
+
+# --- Importação de Vendas do Diário dos Caixas ---
+
+def _validar_venda_diario(venda, estoques):
+    """Motivo para rejeitar uma venda do diário, ou None se ela pode ser importada."""
+    try:
+        if not venda["itens"]:
+            return "venda sem itens"
+        for item in venda["itens"]:
+            if item["produto_id"] not in estoques:
+                return f"produto {item['produto_id']} não existe"
+            if not isinstance(item["quantidade"], int) or item["quantidade"] <= 0:
+                return f"quantidade inválida para o produto {item['produto_id']}"
+            float(item["preco"])
+    except (KeyError, TypeError, ValueError) as e:
+        return f"item malformado: {e}"
+    return None
+
+def importar_vendas(vendas):
+    """Grava, numa única transação, vendas já feitas no caixa e guardadas no diário local (diario.py).
+
+    Cada venda é um dict com origem, data_hora (UTC), usuario_id, forma_pagamento,
+    parcelas, total e itens. A mercadoria já saiu da loja, então a venda nunca é
+    recusada por falta de estoque. Conflitos são resolvidos de forma determinística:
+    as vendas são aplicadas em ordem de (data_hora, origem), o estoque de cada
+    produto desce até zero e nunca abaixo, e o que faltou é gravado em
+    conflitos_estoque e compensado com uma movimentação 'ajuste' (o histórico de
+    movimentações continua batendo com produtos.estoque).
+
+    Vendas cuja `origem` já está no banco são ignoradas, então reenviar um lote
+    após uma falha é seguro. Vendas com produto, usuário ou pagamento inválidos
+    são rejeitadas, sem impedir as demais. Retorna um dict com importadas,
+    duplicadas, conflitos, rejeitadas ({origem: motivo}) e venda_ids ({origem: id}).
+    """
+    vendas = sorted(vendas, key=lambda venda: (venda["data_hora"], venda["origem"]))
+    resultado = {"importadas": 0, "duplicadas": 0, "conflitos": 0, "rejeitadas": {}, "venda_ids": {}}
+    if not vendas:
+        return resultado
+    itens, movimentacoes, conflitos = [], [], []
+    with transacao_escrita() as conn:
+        existentes = {row[0] for row in conn.execute(
+            "SELECT origem FROM vendas WHERE origem IN (SELECT value FROM json_each(?))",
+            (json.dumps([venda["origem"] for venda in vendas]),))}
+        produto_ids = {item.get("produto_id") for venda in vendas for item in venda.get("itens") or ()}
+        estoques = dict(conn.execute("SELECT id, estoque FROM produtos WHERE id IN (SELECT value FROM json_each(?))",
+                                     (json.dumps([pid for pid in produto_ids if isinstance(pid, int)]),)).fetchall())
+        iniciais = dict(estoques)
+
+        for venda in vendas:
+            origem = venda["origem"]
+            if origem in existentes:
+                resultado["duplicadas"] += 1
+                continue
+            motivo = _validar_venda_diario(venda, estoques)
+            if motivo is None:
+                try:
+                    cursor = conn.execute('''INSERT INTO vendas (data_hora, usuario_id, forma_pagamento, parcelas, total, origem)
+                                          VALUES (?, ?, ?, ?, ?, ?)''',
+                                          (venda["data_hora"], venda["usuario_id"], venda["forma_pagamento"],
+                                           venda.get("parcelas", 1), venda["total"], origem))
+                except (sqlite3.IntegrityError, KeyError) as e: # Usuário inexistente, pagamento fora da lista...
+                    motivo = str(e)
+            if motivo is not None:
+                resultado["rejeitadas"][origem] = motivo
+                continue
+            venda_id = cursor.lastrowid
+            existentes.add(origem)
+            resultado["venda_ids"][origem] = venda_id
+            for item in venda["itens"]:
+                produto_id, quantidade = item["produto_id"], item["quantidade"]
+                itens.append((venda_id, produto_id, quantidade, item["preco"]))
+                movimentacoes.append((produto_id, 'saida', quantidade, venda["data_hora"], f"Venda #{venda_id}",
+                                      venda["usuario_id"]))
+                falta = max(0, quantidade - estoques[produto_id])
+                estoques[produto_id] = max(0, estoques[produto_id] - quantidade)
+                if falta:
+                    conflitos.append((venda_id, produto_id, falta, venda["data_hora"]))
+                    movimentacoes.append((produto_id, 'ajuste', falta, venda["data_hora"],
+                                          f"Conflito de estoque na venda #{venda_id} ({origem})", venda["usuario_id"]))
+
+        venda_ids = list(resultado["venda_ids"].values())
+        if venda_ids:
+            conn.executemany('''INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario)
+                             VALUES (?, ?, ?, ?)''', itens)
+            conn.executemany('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, data_hora, motivo, usuario_id)
+                             VALUES (?, ?, ?, ?, ?, ?)''', movimentacoes)
+            conn.executemany('''INSERT INTO conflitos_estoque (venda_id, produto_id, quantidade, data_hora)
+                             VALUES (?, ?, ?, ?)''', conflitos)
+            # Estoque final de cada produto num único UPDATE
+            deltas = {pid: estoques[pid] - iniciais[pid] for pid in estoques if estoques[pid] != iniciais[pid]}
+            conn.execute('''UPDATE produtos SET estoque = produtos.estoque + d.delta
+                         FROM (SELECT json_extract(value, '$[0]') AS produto_id, json_extract(value, '$[1]') AS delta
+                               FROM json_each(?)) AS d
+                         WHERE produtos.id = d.produto_id''', (json.dumps(list(deltas.items())),))
+            _somar_resumos_vendas(conn, venda_ids)
+            # Vendas de dias já fechados: refaz os saldos diários a partir do dia mais antigo
+            fechado = conn.execute("SELECT MAX(dia) FROM fechamentos_estoque").fetchone()[0]
+            primeiro_dia = min(venda["data_hora"] for venda in vendas if venda["origem"] in resultado["venda_ids"])[:10]
+            if fechado and primeiro_dia <= fechado:
+                _fechar_saldos_estoque(conn, ate=fechado, desde=primeiro_dia)
+
+    if venda_ids:
+        _catalogo.ajustar_estoque(deltas)
+    resultado["importadas"] = len(venda_ids)
+    resultado["conflitos"] = len(conflitos)
+    return resultado
+
+def _somar_resumos_vendas(conn, venda_ids):
+    """Acrescenta as vendas `venda_ids` aos resumos diário e mensal (um comando por tabela)."""
+    ids = json.dumps(venda_ids)
+    conn.execute('''INSERT INTO resumo_vendas_dia (dia, forma_pagamento, quantidade_vendas, total)
+                 SELECT date(data_hora), forma_pagamento, COUNT(*), SUM(total)
+                 FROM vendas WHERE id IN (SELECT value FROM json_each(?))
+                 GROUP BY date(data_hora), forma_pagamento
+                 ON CONFLICT (dia, forma_pagamento) DO UPDATE SET
+                     quantidade_vendas = quantidade_vendas + excluded.quantidade_vendas,
+                     total = total + excluded.total''', (ids,))
+    for tabela, coluna, periodo in (("resumo_produtos_dia", "dia", "date(v.data_hora)"),
+                                    ("resumo_produtos_mes", "mes", "strftime('%Y-%m', v.data_hora)")):
+        conn.execute(f'''INSERT INTO {tabela} ({coluna}, produto_id, quantidade, receita)
+                     SELECT {periodo}, iv.produto_id, SUM(iv.quantidade), SUM(iv.quantidade * iv.preco_unitario)
+                     FROM itens_venda iv
+                     JOIN vendas v ON v.id = iv.venda_id
+                     WHERE iv.venda_id IN (SELECT value FROM json_each(?))
+                     GROUP BY {periodo}, iv.produto_id
+                     ON CONFLICT ({coluna}, produto_id) DO UPDATE SET
+                         quantidade = quantidade + excluded.quantidade,
+                         receita = receita + excluded.receita''', (ids,))
+
+def obter_conflitos_estoque(data_inicio, data_fim):
+    """Conflitos de estoque das vendas importadas dos caixas no período (mais recentes primeiro)."""
+    with conexao() as conn:
+        cursor = conn.execute('''SELECT c.data_hora, c.venda_id, v.origem, p.nome AS produto, c.quantidade
+                              FROM conflitos_estoque c
+                              JOIN vendas v ON v.id = c.venda_id
+                              JOIN produtos p ON p.id = c.produto_id
+                              WHERE c.data_hora BETWEEN ? AND ?
+                              ORDER BY c.data_hora DESC, c.id DESC''', (data_inicio, f"{data_fim} 23:59:59"))
+        return [dict(row) for row in cursor.fetchall()]
 
 # --- Funções de Estoque ---
 
 def registrar_movimentacao_estoque(produto_id, tipo, quantidade, motivo='', usuario_id=None, conn_externa=None):
     """Registra uma movimentação de estoque (entrada, saida, inicial, ajuste)."""
     # Permite usar uma conexão externa para transações (como em registrar_venda)
-    is_external_conn = conn_externa is not None
-    conn = conn_externa if is_external_conn else conectar_bd()
-    cursor = conn.cursor()
+    if conn_externa is not None:
+        return _inserir_movimentacao(conn_externa, produto_id, tipo, quantidade, motivo, usuario_id)
+    try:
+        with transacao_escrita() as conn:
+            if not _inserir_movimentacao(conn, produto_id, tipo, quantidade, motivo, usuario_id):
+                raise sqlite3.Error(f"Falha ao inserir movimentação ({tipo})")
+        if tipo == 'entrada':
+            _catalogo.ajustar_estoque({produto_id: quantidade})
+        return True
+    except sqlite3.Error:
+        return False
 
+def _inserir_movimentacao(conn, produto_id, tipo, quantidade, motivo, usuario_id):
+    """Insere a movimentação usando a conexão dada, sem commitar."""
     try:
         # Insere o registro da movimentação
-        cursor.execute('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, motivo, usuario_id)
+        conn.execute('''INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, motivo, usuario_id)
                       VALUES (?, ?, ?, ?, ?)''',
                       (produto_id, tipo, quantidade, motivo, usuario_id))
 
         # Atualiza o estoque na tabela produtos APENAS se for entrada manual ou ajuste
         # Saída é tratada na venda, Inicial é tratado no cadastro.
         if tipo == 'entrada':
-             cursor.execute("UPDATE produtos SET estoque = estoque + ? WHERE id = ?", (quantidade, produto_id))
+             conn.execute("UPDATE produtos SET estoque = estoque + ? WHERE id = ?", (quantidade, produto_id))
         # Adicionar lógica para 'ajuste' se necessário (ex: ajuste positivo/negativo)
         # elif tipo == 'ajuste':
-        #    cursor.execute("UPDATE produtos SET estoque = estoque + ? WHERE id = ?", (quantidade, produto_id)) # Exemplo: ajuste positivo
-
-        if not is_external_conn: # Só commita se não for conexão externa
-            conn.commit()
+        #    conn.execute("UPDATE produtos SET estoque = estoque + ? WHERE id = ?", (quantidade, produto_id)) # Exemplo: ajuste positivo
         return True
     except Exception as e:
         print(f"Erro ao registrar movimentação de estoque ({tipo}): {e}")
-        if not is_external_conn:
-            conn.rollback()
-        # Se for conexão externa, o rollback deve ser feito pela função chamadora (registrar_venda)
+        # O rollback deve ser feito por quem controla a transação
         return False
-    finally:
-        if not is_external_conn:
-            conn.close()
 
 def obter_estoque_atual(produto_id):
     """Obtém o estoque atual de um produto."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    cursor.execute("SELECT estoque FROM produtos WHERE id = ?", (produto_id,))
-    resultado = cursor.fetchone()
-    conn.close()
-    return resultado['estoque'] if resultado else 0
+    produto = buscar_produto_por_id(produto_id)
+    return produto['estoque'] if produto else 0
+
+def fechar_saldos_estoque(ate=None, desde=None):
+    """Fecha os saldos diários de estoque até `ate` (padrão: ontem); veja _fechar_saldos_estoque.
+
+    Rode periodicamente (manutencao.py estoque): estoque_em() lê o último saldo
+    fechado e soma só as movimentações posteriores a ele.
+    """
+    with transacao_escrita() as conn:
+        return _fechar_saldos_estoque(conn, ate, desde)
+
+def _cauda_movimentacoes(conn, data):
+    """Para o fim de `data`: (dia do saldo fechado a usar, início das movimentações a somar, ou None)."""
+    fechado = conn.execute("SELECT MAX(dia) FROM fechamentos_estoque").fetchone()[0]
+    if fechado is None:
+        return '', '' # Job nunca rodou: todo o histórico entra na soma
+    if fechado >= data:
+        return data, None
+    return fechado, f"{fechado} 23:59:59"
+
+def estoque_em(produto_id, data):
+    """Estoque do produto no fim do dia `data` ('AAAA-MM-DD'), pelo histórico de movimentações.
+
+    Lê o último saldo fechado até a data (uma busca na chave primária) e soma só as
+    movimentações entre o último fechamento e a data — nunca o histórico inteiro.
+    """
+    with conexao() as conn:
+        base, inicio = _cauda_movimentacoes(conn, data)
+        saldo = conn.execute('''SELECT estoque FROM saldos_estoque WHERE produto_id = ? AND dia <= ?
+                             ORDER BY dia DESC LIMIT 1''', (produto_id, base)).fetchone()
+        estoque = saldo[0] if saldo else 0
+        if inicio is not None:
+            estoque += conn.execute(f'''SELECT COALESCE(SUM({DELTA_MOVIMENTACAO}), 0) FROM movimentacoes_estoque
+                                    WHERE produto_id = ? AND data_hora > ? AND data_hora <= ?''',
+                                    (produto_id, inicio, f"{data} 23:59:59")).fetchone()[0]
+    return estoque
+
+def obter_posicao_estoque(data):
+    """Estoque e valor (a preço de custo atual) de cada produto no fim do dia `data`.
+
+    Uma busca no índice de saldos por produto mais as movimentações após o último
+    fechamento, agregadas de uma vez. Retorna dicts com nome, estoque, preco_custo, valor.
+    """
+    with conexao() as conn:
+        base, inicio = _cauda_movimentacoes(conn, data)
+        cauda = "SELECT NULL AS produto_id, 0 AS delta"
+        params = [base]
+        if inicio is not None:
+            cauda = f'''SELECT produto_id, SUM({DELTA_MOVIMENTACAO}) AS delta FROM movimentacoes_estoque
+                      WHERE data_hora > ? AND data_hora <= ? GROUP BY produto_id'''
+            params += [inicio, f"{data} 23:59:59"]
+        cursor = conn.execute(f'''SELECT p.nome, p.preco_custo,
+                                     COALESCE((SELECT s.estoque FROM saldos_estoque s
+                                               WHERE s.produto_id = p.id AND s.dia <= ?
+                                               ORDER BY s.dia DESC LIMIT 1), 0) + COALESCE(c.delta, 0) AS estoque
+                              FROM produtos p
+                              LEFT JOIN ({cauda}) c ON c.produto_id = p.id
+                              ORDER BY p.nome''', params)
+        # valor calculado aqui: no SQL, a subconsulta do saldo rodaria duas vezes por produto
+        return [dict(row, valor=row["estoque"] * (row["preco_custo"] or 0)) for row in cursor.fetchall()]
 
 # --- Funções de Relatório ---
 
+# Colunas das linhas (tuplas) geradas por iterar_*/pagina_*, na ordem das colunas de tela
+COLUNAS_VENDAS = ('id', 'data_hora', 'usuario', 'forma_pagamento', 'parcelas', 'total')
+COLUNAS_MOVIMENTACOES = ('data_hora', 'produto', 'tipo', 'quantidade', 'motivo', 'usuario', 'id')
+
+def _filtro_periodo(alias, data_inicio, data_fim, apos=None):
+    """Condição de período em (data_hora, id), opcionalmente continuando após a chave `apos`."""
+    if apos is None:
+        # Adiciona a hora final para incluir o dia todo
+        return f"{alias}.data_hora BETWEEN ? AND ?", [data_inicio, f"{data_fim} 23:59:59"]
+    # A chave já está dentro do período: ela passa a ser o limite superior da busca no índice
+    return f"{alias}.data_hora >= ? AND ({alias}.data_hora, {alias}.id) < (?, ?)", [data_inicio, *apos]
+
+def _consulta_vendas(data_inicio, data_fim, apos=None):
+    filtro, params = _filtro_periodo("v", data_inicio, data_fim, apos)
+    sql = f'''SELECT v.id, v.data_hora, u.nome as usuario, v.forma_pagamento, v.parcelas, v.total
+             FROM vendas v
+             JOIN usuarios u ON v.usuario_id = u.id
+             WHERE {filtro}'''
+    return sql, params
+
+def _consulta_movimentacoes(data_inicio, data_fim, produto_id=None, apos=None):
+    filtro, params = _filtro_periodo("m", data_inicio, data_fim, apos)
+    sql = f'''SELECT m.data_hora, p.nome as produto, m.tipo, m.quantidade, m.motivo, u.nome as usuario, m.id
+             FROM movimentacoes_estoque m
+             JOIN produtos p ON m.produto_id = p.id
+             LEFT JOIN usuarios u ON m.usuario_id = u.id
+             WHERE {filtro}'''
+    if produto_id:
+        sql += " AND m.produto_id = ?"
+        params.append(produto_id)
+    return sql, params
+
+def _pagina(sql, params, alias, tamanho):
+    """Página por chave (keyset) em ordem decrescente de (data_hora, id).
+
+    Em vez de OFFSET, a consulta continua do par (data_hora, id) da última linha da
+    página anterior (veja _filtro_periodo), então cada página custa uma busca no
+    índice e nenhuma linha é pulada ou repetida quando há inserções no meio.
+    Retorna (linhas, ultima_linha) — ultima_linha é None se não há mais páginas.
+    """
+    sql += f" ORDER BY {alias}.data_hora DESC, {alias}.id DESC LIMIT ?"
+    params = list(params)
+    params.append(tamanho + 1) # Uma linha a mais só para saber se há próxima página
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        linhas = cursor.execute(sql, params).fetchall()
+    if len(linhas) <= tamanho:
+        return linhas, None
+    del linhas[tamanho:]
+    return linhas, linhas[-1]
+
 def obter_vendas_por_periodo(data_inicio, data_fim):
     """Busca vendas realizadas dentro de um período."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    # Adiciona a hora final para incluir o dia todo
-    data_fim_ajustada = f"{data_fim} 23:59:59"
-    cursor.execute('''SELECT v.id, v.data_hora, u.nome as usuario, v.forma_pagamento, v.parcelas, v.total
-                  FROM vendas v
-                  JOIN usuarios u ON v.usuario_id = u.id
-                  WHERE v.data_hora BETWEEN ? AND ?
-                  ORDER BY v.data_hora DESC''',
-                  (data_inicio, data_fim_ajustada))
-    vendas = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    sql, params = _consulta_vendas(data_inicio, data_fim)
+    with conexao() as conn:
+        cursor = conn.execute(sql + " ORDER BY v.data_hora DESC, v.id DESC", params)
+        vendas = [dict(row) for row in cursor.fetchall()]
     return vendas
 
+def iterar_vendas_por_periodo(data_inicio, data_fim, tamanho_lote=TAMANHO_LOTE):
+    """Gera as vendas do período (mais recentes primeiro) como tuplas COLUNAS_VENDAS, sem carregar tudo."""
+    sql, params = _consulta_vendas(data_inicio, data_fim)
+    return iterar_consulta(sql + " ORDER BY v.data_hora DESC, v.id DESC", params, tamanho_lote)
+
+def pagina_vendas_por_periodo(data_inicio, data_fim, apos=None, tamanho=TAMANHO_PAGINA):
+    """Uma página de vendas do período (tuplas COLUNAS_VENDAS, mais recentes primeiro).
+
+    `apos` é a chave retornada pela página anterior (None na primeira). Retorna
+    (linhas, proxima) — `proxima` é None na última página.
+    """
+    sql, params = _consulta_vendas(data_inicio, data_fim, apos)
+    linhas, ultima = _pagina(sql, params, "v", tamanho)
+    return linhas, None if ultima is None else (ultima[1], ultima[0])
+
 def obter_itens_venda(venda_id):
     """Busca os itens de uma venda específica."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT p.nome, iv.quantidade, iv.preco_unitario
-                  FROM itens_venda iv
-                  JOIN produtos p ON iv.produto_id = p.id
-                  WHERE iv.venda_id = ?''',
-                  (venda_id,))
-    itens = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    with conexao() as conn:
+        cursor = conn.execute('''SELECT p.nome, iv.quantidade, iv.preco_unitario
+                      FROM itens_venda iv
+                      JOIN produtos p ON iv.produto_id = p.id
+                      WHERE iv.venda_id = ?''',
+                      (venda_id,))
+        itens = [dict(row) for row in cursor.fetchall()]
     return itens
 
+def iterar_vendas_com_itens(data_inicio, data_fim, tamanho_lote=TAMANHO_LOTE):
+    """Gera (venda, itens) para cada venda do período, em ordem cronológica.
+
+    `venda` é uma tupla COLUNAS_VENDAS e `itens` uma lista de (nome, quantidade,
+    preco_unitario), como em obter_itens_venda. Vendas e itens vêm de uma única
+    consulta lida em lotes (vendas pelo índice de data, itens pelo índice de
+    venda_id) e agrupados aqui, em vez de uma consulta de itens por venda.
+    """
+    filtro, params = _filtro_periodo("v", data_inicio, data_fim)
+    sql = f'''SELECT v.id, v.data_hora, u.nome, v.forma_pagamento, v.parcelas, v.total,
+                     COALESCE(p.nome, 'Produto Desconhecido'), iv.quantidade, iv.preco_unitario
+             FROM vendas v
+             JOIN usuarios u ON v.usuario_id = u.id
+             LEFT JOIN itens_venda iv ON iv.venda_id = v.id
+             LEFT JOIN produtos p ON iv.produto_id = p.id
+             WHERE {filtro}
+             ORDER BY v.data_hora, v.id'''
+    num_cols = len(COLUNAS_VENDAS)
+    for _, linhas in itertools.groupby(iterar_consulta(sql, params, tamanho_lote), key=lambda linha: linha[0]):
+        primeira = next(linhas)
+        itens = [linha[num_cols:] for linha in itertools.chain([primeira], linhas) if linha[num_cols + 1] is not None]
+        yield primeira[:num_cols], itens
+
+def _agrupar_itens(cursor, venda_ids=()):
+    """{venda_id: [itens como em obter_itens_venda]} a partir de linhas (venda_id, nome, quantidade, preco_unitario)."""
+    itens = {venda_id: [] for venda_id in venda_ids} # Vendas sem itens também aparecem
+    for venda_id, nome, quantidade, preco_unitario in cursor:
+        itens.setdefault(venda_id, []).append({'nome': nome, 'quantidade': quantidade, 'preco_unitario': preco_unitario})
+    return itens
+
+def obter_itens_vendas(venda_ids):
+    """Itens de várias vendas numa única consulta: {venda_id: [itens como em obter_itens_venda]}.
+
+    Os ids vão num só parâmetro JSON (json_each), então não há limite de variáveis
+    do SQLite nem uma consulta por venda.
+    """
+    venda_ids = list(venda_ids)
+    if not venda_ids:
+        return {}
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute('''SELECT iv.venda_id, p.nome, iv.quantidade, iv.preco_unitario
+                       FROM itens_venda iv
+                       JOIN produtos p ON iv.produto_id = p.id
+                       WHERE iv.venda_id IN (SELECT value FROM json_each(?))''',
+                       (json.dumps(venda_ids),))
+        return _agrupar_itens(cursor, venda_ids)
+
+def obter_itens_vendas_por_periodo(data_inicio, data_fim):
+    """Itens de todas as vendas do período numa única consulta: {venda_id: [itens]}."""
+    filtro, params = _filtro_periodo("v", data_inicio, data_fim)
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'''SELECT iv.venda_id, p.nome, iv.quantidade, iv.preco_unitario
+                        FROM vendas v
+                        JOIN itens_venda iv ON iv.venda_id = v.id
+                        JOIN produtos p ON iv.produto_id = p.id
+                        WHERE {filtro}
+                        ORDER BY v.data_hora DESC, v.id DESC''',
+                       params)
+        return _agrupar_itens(cursor)
+
+# Linhas do relatório detalhado: uma por item, com os dados da venda
+COLUNAS_VENDAS_ITENS = ('id', 'data_hora', 'usuario', 'forma_pagamento', 'produto', 'quantidade', 'preco_unitario', 'subtotal')
+
+def pagina_vendas_itens_por_periodo(data_inicio, data_fim, apos=None, tamanho=TAMANHO_PAGINA):
+    """Uma página do relatório detalhado: `tamanho` vendas com seus itens (tuplas COLUNAS_VENDAS_ITENS).
+
+    Duas consultas por página, qualquer que seja o número de vendas: a página de
+    vendas (por chave, como pagina_vendas_por_periodo) e os itens de todas elas
+    (obter_itens_vendas). `apos`/`proxima` são chaves de venda.
+    """
+    vendas, proxima = pagina_vendas_por_periodo(data_inicio, data_fim, apos, tamanho)
+    itens = obter_itens_vendas(venda[0] for venda in vendas)
+    linhas = []
+    for venda_id, data_hora, usuario, forma_pagamento, _parcelas, _total in vendas:
+        cabecalho = (venda_id, data_hora, usuario, forma_pagamento)
+        if not itens[venda_id]:
+            linhas.append(cabecalho + (None, None, None, None))
+        for item in itens[venda_id]:
+            linhas.append(cabecalho + (item['nome'], item['quantidade'], item['preco_unitario'],
+                                       item['quantidade'] * item['preco_unitario']))
+    return linhas, proxima
+
+def _partes_periodo(data_inicio, data_fim):
+    """Divide o período em meses inteiros (resumo mensal) e dias avulsos nas pontas (diário).
+
+    Retorna (lista de (dia_inicio, dia_fim), (mes_inicio, mes_fim) ou None).
+    """
+    try:
+        inicio = datetime.date.fromisoformat(data_inicio)
+        fim = datetime.date.fromisoformat(data_fim)
+    except (TypeError, ValueError):
+        return [(data_inicio, data_fim)], None
+    um_dia = datetime.timedelta(days=1)
+    primeiro_mes = inicio if inicio.day == 1 else (inicio.replace(day=28) + 4 * um_dia).replace(day=1)
+    ultimo_dia_meses = fim if (fim + um_dia).day == 1 else fim.replace(day=1) - um_dia
+    if primeiro_mes > ultimo_dia_meses:
+        return [(data_inicio, data_fim)], None
+    dias = []
+    if inicio < primeiro_mes:
+        dias.append((data_inicio, str(primeiro_mes - um_dia)))
+    if ultimo_dia_meses < fim:
+        dias.append((str(ultimo_dia_meses + um_dia), data_fim))
+    return dias, (primeiro_mes.strftime('%Y-%m'), ultimo_dia_meses.strftime('%Y-%m'))
+
 def obter_produtos_mais_vendidos(data_inicio, data_fim, limite=10):
-    """Busca os produtos mais vendidos em um período."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    data_fim_ajustada = f"{data_fim} 23:59:59"
-    cursor.execute('''SELECT p.nome, SUM(iv.quantidade) as total_vendido
-                  FROM itens_venda iv
-                  JOIN vendas v ON iv.venda_id = v.id
-                  JOIN produtos p ON iv.produto_id = p.id
-                  WHERE v.data_hora BETWEEN ? AND ?
-                  GROUP BY p.id, p.nome
-                  ORDER BY total_vendido DESC
-                  LIMIT ?''',
-                  (data_inicio, data_fim_ajustada, limite))
-    produtos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    """Busca os produtos mais vendidos em um período (a partir dos resumos por produto)."""
+    dias, meses = _partes_periodo(data_inicio, data_fim)
+    partes = ["SELECT produto_id, quantidade, receita FROM resumo_produtos_dia WHERE dia BETWEEN ? AND ?"] * len(dias)
+    params = [data for intervalo in dias for data in intervalo]
+    if meses:
+        partes.append("SELECT produto_id, quantidade, receita FROM resumo_produtos_mes WHERE mes BETWEEN ? AND ?")
+        params.extend(meses)
+    with conexao() as conn:
+        # Agrega e limita antes do JOIN: só os `limite` primeiros buscam o nome do produto
+        cursor = conn.execute(f'''SELECT p.nome, t.total_vendido, t.receita
+                      FROM (SELECT produto_id, SUM(quantidade) as total_vendido, SUM(receita) as receita
+                            FROM ({" UNION ALL ".join(partes)})
+                            GROUP BY produto_id
+                            ORDER BY total_vendido DESC
+                            LIMIT ?) t
+                      JOIN produtos p ON t.produto_id = p.id
+                      ORDER BY t.total_vendido DESC''',
+                      (*params, limite))
+        produtos = [dict(row) for row in cursor.fetchall()]
     return produtos
 
+def obter_totais_periodo(data_inicio, data_fim):
+    """Quantidade de vendas e total por forma de pagamento em um período (resumo diário)."""
+    with conexao() as conn:
+        cursor = conn.execute('''SELECT forma_pagamento, SUM(quantidade_vendas) as quantidade_vendas, SUM(total) as total
+                      FROM resumo_vendas_dia
+                      WHERE dia BETWEEN ? AND ?
+                      GROUP BY forma_pagamento
+                      ORDER BY total DESC''',
+                      (data_inicio, data_fim))
+        totais = [dict(row) for row in cursor.fetchall()]
+    return totais
+
+def reconstruir_resumos_vendas(data_inicio=None, data_fim=None):
+    """Recalcula os resumos diários e mensais de vendas (todo o histórico ou um período).
+
+    Use após importar vendas ou corrigir dados diretamente no banco. Retorna o número
+    de linhas de resumo por produto do período.
+    """
+    with transacao_escrita() as conn:
+        _reconstruir_resumos_vendas(conn, data_inicio, data_fim)
+        return conn.execute("SELECT COUNT(*) FROM resumo_produtos_dia WHERE dia BETWEEN ? AND ?",
+                            (data_inicio or '0000-01-01', data_fim or '9999-12-31')).fetchone()[0]
+
 def obter_movimentacoes_estoque(data_inicio, data_fim, produto_id=None):
     """Busca as movimentações de estoque em um período, opcionalmente por produto."""
-    conn = conectar_bd()
-    cursor = conn.cursor()
-    data_fim_ajustada = f"{data_fim} 23:59:59"
-    query = '''SELECT m.data_hora, p.nome as produto, m.tipo, m.quantidade, m.motivo, u.nome as usuario
-             FROM movimentacoes_estoque m
-             JOIN produtos p ON m.produto_id = p.id
-             LEFT JOIN usuarios u ON m.usuario_id = u.id
-             WHERE m.data_hora BETWEEN ? AND ?'''
-    params = [data_inicio, data_fim_ajustada]
+    sql, params = _consulta_movimentacoes(data_inicio, data_fim, produto_id)
+    with conexao() as conn:
+        cursor = conn.execute(sql + " ORDER BY m.data_hora DESC, m.id DESC", params)
+        movimentacoes = [dict(row) for row in cursor.fetchall()]
+    return movimentacoes
 
-    if produto_id:
-        query += " AND m.produto_id = ?"
-        params.append(produto_id)
+def iterar_movimentacoes_estoque(data_inicio, data_fim, produto_id=None, tamanho_lote=TAMANHO_LOTE):
+    """Gera as movimentações do período como tuplas COLUNAS_MOVIMENTACOES, sem carregar tudo."""
+    sql, params = _consulta_movimentacoes(data_inicio, data_fim, produto_id)
+    return iterar_consulta(sql + " ORDER BY m.data_hora DESC, m.id DESC", params, tamanho_lote)
 
-    query += " ORDER BY m.data_hora DESC"
+def pagina_movimentacoes_estoque(data_inicio, data_fim, produto_id=None, apos=None, tamanho=TAMANHO_PAGINA):
+    """Uma página de movimentações (tuplas COLUNAS_MOVIMENTACOES); veja pagina_vendas_por_periodo()."""
+    sql, params = _consulta_movimentacoes(data_inicio, data_fim, produto_id, apos)
+    linhas, ultima = _pagina(sql, params, "m", tamanho)
+    return linhas, None if ultima is None else (ultima[0], ultima[-1])
 
-    cursor.execute(query, params)
-    movimentacoes = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return movimentacoes
+def percorrer_paginas(pagina, *args, tamanho=TAMANHO_LOTE):
+    """Gera todas as linhas de uma função pagina_*, página a página.
+
+    Diferente de iterar_*, nenhuma leitura fica aberta entre uma página e outra,
+    então gravações (ex.: vendas no caixa) não esperam por um consumidor lento,
+    como uma exportação em PDF.
+    """
+    apos = None
+    while True:
+        linhas, apos = pagina(*args, apos=apos, tamanho=tamanho)
+        yield from linhas
+        if apos is None:
+            return
 
 # --- Inicialização ---
 
+# Importar o módulo não abre o banco: quem usa o loja.db diretamente (main.py no modo
+# local, servidor.py, manutencao.py) chama criar_tabelas() ao iniciar. No modo cliente
+# só o servidor abre o banco.
+
 # Descomente a linha abaixo APENAS se precisar recriar o banco do zero
 # import os; os.remove(DATABASE) if os.path.exists(DATABASE) else None
-
-criar_tabelas() # Garante que as tabelas existam ao importar o módulo
-# print("Banco de dados inicializado e tabelas criadas/verificadas.") # Opcional: remover print
-
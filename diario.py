@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Diário local de vendas do caixa e sincronização em lote com o banco.
+
+Com LOJA_DIARIO definido (caminho de um arquivo no disco do caixa), a venda
+finalizada é gravada só no diário — uma linha JSON acrescentada ao arquivo, com
+fsync — e o caixa já passa ao próximo cliente, não importa se o banco (num
+compartilhamento de rede ou no servidor) está lento ou fora do ar. O
+SincronizadorVendas envia as vendas pendentes em segundo plano, em lotes, com
+importar_vendas() do database.py (ou do servidor, no modo cliente).
+"""
+import datetime
+import json
+import os
+import socket
+import threading
+import uuid
+
+CAMINHO_DIARIO = os.environ.get("LOJA_DIARIO", "") # Vazio: as vendas vão direto para o banco
+TERMINAL = os.environ.get("LOJA_TERMINAL") or socket.gethostname() # Prefixo das origens das vendas deste caixa
+LOTE_SINCRONIZACAO = 500 # Vendas por chamada a importar_vendas()
+INTERVALO_SINCRONIZACAO = 2.0 # Segundos entre sincronizações enquanto houver pendentes
+ESPERA_MAXIMA = 60.0 # Segundos entre tentativas quando o banco continua inacessível
+
+class DiarioVendas:
+    """Arquivo JSON-lines, só de acréscimo, com as vendas feitas neste caixa.
+
+    Cada linha é uma venda com uma `origem` única ("<terminal>-<sessão>-<sequência>"),
+    que o banco usa para nunca importar a mesma venda duas vezes. O arquivo
+    <diario>.estado guarda até que byte o diário já foi sincronizado, a sessão e a
+    última sequência usada; quando tudo foi sincronizado, o diário é esvaziado. A
+    sessão é um identificador aleatório criado quando não há estado: se o
+    <diario>.estado se perder, a sequência recomeça numa sessão nova e as origens
+    novas não coincidem com as de vendas já importadas. Uma linha
+    incompleta no fim (queda durante a gravação) é descartada ao abrir: a venda
+    não chegou a ser confirmada ao caixa.
+    """
+
+    def __init__(self, caminho, terminal=None):
+        self.caminho = caminho
+        self._caminho_estado = caminho + ".estado"
+        self._lock = threading.Lock()
+        estado = self._ler_estado()
+        self.terminal = terminal or estado.get("terminal") or TERMINAL
+        self._sincronizado = estado.get("sincronizado", 0) # Bytes do início do arquivo já no banco
+        self._sequencia = estado.get("sequencia", 0)
+        self._sessao = estado.get("sessao") or uuid.uuid4().hex[:12]
+        self._arquivo = open(caminho, "ab")
+        self.pendentes = self._recuperar()
+        if "sessao" not in estado:
+            self._gravar_estado() # Sessão nova fica registrada antes da primeira venda
+
+    def _ler_estado(self):
+        try:
+            with open(self._caminho_estado, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            # Sem o estado, tudo é reenviado; o banco descarta as vendas já importadas
+            print(f"Estado do diário ilegível ({e}); o diário inteiro será sincronizado.")
+            return {}
+
+    def _gravar_estado(self):
+        temporario = self._caminho_estado + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"sincronizado": self._sincronizado, "sequencia": self._sequencia, "sessao": self._sessao,
+                       "terminal": self.terminal}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self._caminho_estado)
+
+    def _recuperar(self):
+        """Descarta uma linha incompleta no fim e retorna quantas vendas faltam sincronizar."""
+        tamanho = os.path.getsize(self.caminho)
+        if self._sincronizado > tamanho: # Diário esvaziado antes de o estado ser gravado
+            self._sincronizado = 0
+        with open(self.caminho, "rb") as f:
+            f.seek(self._sincronizado)
+            dados = f.read()
+        completos = dados.rfind(b"\n") + 1
+        if completos < len(dados):
+            print(f"Diário {self.caminho}: descartada uma venda incompleta ({len(dados) - completos} bytes).")
+            self._arquivo.truncate(self._sincronizado + completos)
+        linhas = dados[:completos].splitlines()
+        for linha in linhas:
+            self._sequencia = max(self._sequencia, json.loads(linha)["sequencia"])
+        return len(linhas)
+
+    def registrar(self, usuario_id, forma_pagamento, parcelas, total, itens_venda):
+        """Grava a venda no diário (durável ao retornar) e retorna sua origem."""
+        with self._lock:
+            self._sequencia += 1
+            venda = {
+                "origem": f"{self.terminal}-{self._sessao}-{self._sequencia}",
+                "sequencia": self._sequencia,
+                # UTC, no formato do CURRENT_TIMESTAMP do SQLite
+                "data_hora": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "usuario_id": usuario_id,
+                "forma_pagamento": forma_pagamento,
+                "parcelas": parcelas,
+                "total": total,
+                "itens": [{"produto_id": item["produto_id"], "nome": item.get("nome"),
+                           "quantidade": item["quantidade"], "preco": item["preco"]} for item in itens_venda],
+            }
+            self._arquivo.write(json.dumps(venda, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self.pendentes += 1
+        return venda["origem"]
+
+    def ler_pendentes(self, limite=LOTE_SINCRONIZACAO):
+        """Retorna (vendas ainda não sincronizadas, até `limite`; posição para confirmar())."""
+        with self._lock:
+            vendas = []
+            posicao = self._sincronizado
+            with open(self.caminho, "rb") as f:
+                f.seek(posicao)
+                for linha in f:
+                    if len(vendas) >= limite or not linha.endswith(b"\n"):
+                        break
+                    vendas.append(json.loads(linha))
+                    posicao += len(linha)
+            return vendas, posicao
+
+    def confirmar(self, posicao, quantidade):
+        """Marca como sincronizadas as vendas até `posicao` (retornada por ler_pendentes)."""
+        with self._lock:
+            self._sincronizado = posicao
+            self.pendentes -= quantidade
+            if posicao == os.fstat(self._arquivo.fileno()).st_size: # Tudo sincronizado: recomeça o arquivo
+                self._arquivo.truncate(0)
+                self._sincronizado = 0
+            self._gravar_estado()
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+class SincronizadorVendas:
+    """Thread que envia as vendas pendentes do diário ao banco, em lotes.
+
+    `banco` é o módulo database ou um ClienteLoja (cliente.banco()). iniciar()
+    começa a thread; sincronizar() também pode ser chamado direto (manutencao.py).
+    Em caso de falha, a thread tenta de novo com espera crescente (até
+    ESPERA_MAXIMA); acordar() pede uma sincronização imediata (ex.: logo após uma
+    venda). Vendas rejeitadas pelo
+    banco (produto excluído, usuário inválido...) vão para <diario>.rejeitadas
+    para conferência, e a sincronização segue.
+    """
+
+    def __init__(self, diario, banco, intervalo=INTERVALO_SINCRONIZACAO):
+        self.diario = diario
+        self.banco = banco
+        self.intervalo = intervalo
+        self.estatisticas = {"sincronizadas": 0, "duplicadas": 0, "conflitos": 0, "rejeitadas": 0}
+        self.ultima_falha = None # Mensagem da última falha, None após uma sincronização bem-sucedida
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._rodar, name="sincronizador-vendas", daemon=True)
+        self._thread.start()
+        return self
+
+    def acordar(self):
+        self._acordar.set()
+
+    def encerrar(self, espera=10):
+        """Faz uma última tentativa de sincronizar e para a thread."""
+        if self._thread is None:
+            return
+        self._parar.set()
+        self._acordar.set()
+        self._thread.join(espera)
+
+    def sincronizar(self):
+        """Envia todas as vendas pendentes. Retorna quantas foram confirmadas; propaga a falha do banco."""
+        enviadas = 0
+        while True:
+            vendas, posicao = self.diario.ler_pendentes()
+            if not vendas:
+                return enviadas
+            resultado = self.banco.importar_vendas(vendas)
+            if resultado["rejeitadas"]:
+                self._guardar_rejeitadas(vendas, resultado["rejeitadas"])
+            self.diario.confirmar(posicao, len(vendas))
+            enviadas += len(vendas)
+            self.estatisticas["sincronizadas"] += resultado["importadas"]
+            self.estatisticas["duplicadas"] += resultado["duplicadas"]
+            self.estatisticas["conflitos"] += resultado["conflitos"]
+            self.estatisticas["rejeitadas"] += len(resultado["rejeitadas"])
+
+    def _guardar_rejeitadas(self, vendas, rejeitadas):
+        with open(self.diario.caminho + ".rejeitadas", "a", encoding="utf-8") as f:
+            for venda in vendas:
+                if venda["origem"] in rejeitadas:
+                    print(f"Venda {venda['origem']} rejeitada pelo banco: {rejeitadas[venda['origem']]}")
+                    f.write(json.dumps({**venda, "motivo": rejeitadas[venda["origem"]]}, ensure_ascii=False) + "\n")
+
+    def _rodar(self):
+        espera = 0
+        while True:
+            self._acordar.wait(espera)
+            self._acordar.clear()
+            try:
+                self.sincronizar()
+                self.ultima_falha = None
+                espera = self.intervalo
+            except Exception as e: # Banco inacessível, travado, servidor fora do ar...
+                if self.ultima_falha is None:
+                    print(f"Falha ao sincronizar o diário de vendas (tentando de novo): {e}")
+                self.ultima_falha = str(e)
+                espera = min(ESPERA_MAXIMA, max(self.intervalo, espera * 2))
+            if self._parar.is_set():
+                return
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Importação e exportação do catálogo de produtos em planilhas CSV e XLSX.
+
+A planilha é lida em streaming (csv.reader ou openpyxl em modo read-only), as
+linhas são validadas e enviadas em lotes de LOTE_IMPORTACAO para
+importar_produtos() do database.py (uma transação por lote), e as linhas
+recusadas vão para <planilha>.rejeitadas.csv, com o número da linha e o motivo.
+Usado pela aba Cadastro e por `python manutencao.py importar/exportar`.
+"""
+import csv
+import os
+import re
+import unicodedata
+
+import openpyxl
+
+import database
+
+CODIFICACAO_CSV = "utf-8-sig" # Aceita o BOM que o Excel grava no CSV em UTF-8
+LINHAS_CABECALHO = 20 # Linhas procuradas pelo cabeçalho (a planilha pode começar com um título)
+
+# Nomes aceitos no cabeçalho para cada coluna, comparados sem acentos, maiúsculas e pontuação
+APELIDOS_COLUNAS = {
+    "codigo_barras": ("codigobarras", "codbarras", "codigodebarras", "codigo", "ean", "gtin"),
+    "nome": ("nome", "descricao", "produto"),
+    "preco_custo": ("precocusto", "precodecusto", "custo"),
+    "preco_venda": ("precovenda", "precodevenda", "preco", "venda"),
+    "estoque": ("estoque", "estoqueinicial", "quantidade", "qtd"),
+    "fornecedor": ("fornecedor",),
+    "estoque_minimo": ("estoqueminimo", "minimo"),
+}
+
+def _normalizar_cabecalho(texto):
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return "".join(c for c in texto if c.isalnum() and not unicodedata.combining(c))
+
+def _mapear_cabecalho(valores):
+    """{coluna do banco: índice na linha} para uma linha de cabeçalho, ou None se não for o cabeçalho."""
+    apelidos = {apelido: coluna for coluna, nomes in APELIDOS_COLUNAS.items() for apelido in nomes}
+    indices = {}
+    for indice, valor in enumerate(valores):
+        coluna = apelidos.get(_normalizar_cabecalho(valor))
+        if coluna and coluna not in indices:
+            indices[coluna] = indice
+    return indices if "codigo_barras" in indices else None
+
+# --- Conversão dos valores das células ---
+
+def _texto(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor) # Código de barras lido como número pelo Excel
+    return str(valor).strip() or None
+
+def _decimal(valor):
+    try:
+        numero = float(valor) # Número da planilha ou texto como "12.5"
+    except ValueError:
+        texto = re.sub(r"[R$\s]", "", valor)
+        if "," in texto: # Formato brasileiro: 1.234,56
+            texto = texto.replace(".", "").replace(",", ".")
+        numero = float(texto)
+    if numero < 0:
+        raise ValueError("negativo")
+    return numero
+
+def _inteiro(valor):
+    try:
+        numero = int(valor) if not isinstance(valor, float) else valor
+    except ValueError:
+        numero = float(valor.replace(",", ".")) # "10,0"
+    if numero < 0 or numero != int(numero):
+        raise ValueError("não é um inteiro >= 0")
+    return int(numero)
+
+CONVERSORES = {
+    "codigo_barras": _texto,
+    "nome": _texto,
+    "preco_custo": _decimal,
+    "preco_venda": _decimal,
+    "estoque": _inteiro,
+    "fornecedor": _texto,
+    "estoque_minimo": _inteiro,
+}
+
+def validar_linha(valores, indices):
+    """Converte uma linha da planilha em produto. Retorna (produto, None) ou (None, motivo).
+
+    Células vazias não entram no produto: num produto já cadastrado, mantêm o valor atual.
+    """
+    produto = {}
+    for coluna, indice in indices.items():
+        valor = valores[indice] if indice < len(valores) else None
+        if valor is None or (isinstance(valor, str) and not valor.strip()):
+            continue
+        try:
+            produto[coluna] = CONVERSORES[coluna](valor)
+        except (TypeError, ValueError):
+            return None, f"{coluna} inválido: {valor!r}"
+    if not produto.get("codigo_barras"):
+        return None, "sem código de barras"
+    if produto.get("preco_venda") == 0:
+        return None, "preco_venda deve ser maior que zero"
+    return produto, None
+
+# --- Leitura das planilhas ---
+
+def _detectar_separador(amostra):
+    """O separador presente em mais linhas da amostra (csv.Sniffer falha com título antes do cabeçalho).
+
+    Empate (ex.: ";" com decimais "10,50") fica com o que aparece mais vezes.
+    """
+    linhas = amostra.splitlines()
+    return max(";,\t|", key=lambda separador: (sum(separador in linha for linha in linhas), amostra.count(separador)))
+
+def ler_planilha(caminho, codificacao=CODIFICACAO_CSV):
+    """Gera (número da linha, tupla de valores) de um .csv ou .xlsx, sem carregar o arquivo inteiro."""
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao in (".xlsx", ".xlsm"):
+        wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            yield from enumerate(wb.active.iter_rows(values_only=True), 1)
+        finally:
+            wb.close()
+    elif extensao in (".csv", ".txt"):
+        with open(caminho, newline="", encoding=codificacao) as f:
+            separador = _detectar_separador(f.read(64 * 1024))
+            f.seek(0)
+            yield from enumerate(csv.reader(f, delimiter=separador), 1)
+    else:
+        raise ValueError(f"Formato de planilha não suportado: {extensao or caminho} (use .csv ou .xlsx)")
+
+# --- Importação ---
+
+class _RelatorioRejeitadas:
+    """CSV com as linhas recusadas; só é criado se houver alguma."""
+
+    def __init__(self, caminho, cabecalho):
+        self.caminho = caminho
+        self.cabecalho = cabecalho
+        self.quantidade = 0
+        self._arquivo = None
+        self._escritor = None
+
+    def adicionar(self, numero_linha, motivo, valores):
+        if self._arquivo is None:
+            self._arquivo = open(self.caminho, "w", newline="", encoding=CODIFICACAO_CSV)
+            self._escritor = csv.writer(self._arquivo, delimiter=";")
+            self._escritor.writerow(["linha", "motivo", *self.cabecalho])
+        self._escritor.writerow([numero_linha, motivo, *("" if valor is None else valor for valor in valores)])
+        self.quantidade += 1
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+
+def importar_catalogo(caminho, banco=database, usuario_id=None, lote=database.LOTE_IMPORTACAO, progresso=None,
+                      codificacao=CODIFICACAO_CSV):
+    """Importa os produtos da planilha `caminho` (.csv ou .xlsx) em lotes.
+
+    `banco` é o módulo database ou um ClienteLoja. O cabeçalho é procurado nas
+    primeiras LINHAS_CABECALHO linhas e precisa ter a coluna do código de barras
+    (ver APELIDOS_COLUNAS). Cada lote é confirmado separadamente: se a importação
+    for interrompida, rodar de novo completa o que faltou. `progresso(atual, total,
+    mensagem)` é chamado a cada lote.
+
+    Retorna um dict com linhas, novos, atualizados, inalterados, rejeitados e
+    relatorio_rejeitados (caminho do CSV de rejeitadas, ou None).
+    """
+    resumo = {"linhas": 0, "novos": 0, "atualizados": 0, "inalterados": 0, "rejeitados": 0,
+              "relatorio_rejeitados": None}
+    linhas = ler_planilha(caminho, codificacao)
+    indices = None
+    for numero_linha, valores in linhas:
+        indices = _mapear_cabecalho(valores)
+        if indices is not None:
+            break
+        if numero_linha >= LINHAS_CABECALHO:
+            break
+    if indices is None:
+        linhas.close()
+        raise ValueError("Cabeçalho não encontrado: a planilha precisa de uma coluna 'codigo_barras' "
+                         "(ou Código, EAN, GTIN) e das colunas nome e preco_venda para produtos novos.")
+
+    caminho_rejeitadas = caminho + ".rejeitadas.csv"
+    if os.path.exists(caminho_rejeitadas):
+        os.remove(caminho_rejeitadas) # Relatório de uma importação anterior da mesma planilha
+    rejeitadas = _RelatorioRejeitadas(caminho_rejeitadas, valores)
+    vistos = {} # Código de barras -> linha em que apareceu pela primeira vez
+    pendentes = [] # (número da linha, valores, produto) do lote atual
+
+    def enviar():
+        resultado = banco.importar_produtos([produto for _, _, produto in pendentes], usuario_id)
+        for indice, motivo in resultado["rejeitados"].items():
+            numero, valores_linha, _ = pendentes[int(indice)] # Chaves viram texto no modo cliente (JSON)
+            rejeitadas.adicionar(numero, motivo, valores_linha)
+        for chave in ("novos", "atualizados", "inalterados"):
+            resumo[chave] += resultado[chave]
+        pendentes.clear()
+        if progresso:
+            progresso(resumo["linhas"], None, "Importando produtos")
+
+    try:
+        for numero_linha, valores in linhas:
+            if not any(valor is not None and str(valor).strip() for valor in valores):
+                continue # Linha em branco
+            resumo["linhas"] += 1
+            produto, motivo = validar_linha(valores, indices)
+            if produto is not None:
+                primeira = vistos.setdefault(produto["codigo_barras"], numero_linha)
+                if primeira != numero_linha:
+                    produto, motivo = None, f"código repetido (já importado na linha {primeira})"
+            if produto is None:
+                rejeitadas.adicionar(numero_linha, motivo, valores)
+                continue
+            pendentes.append((numero_linha, valores, produto))
+            if len(pendentes) >= lote:
+                enviar()
+        if pendentes:
+            enviar()
+    finally:
+        linhas.close()
+        rejeitadas.fechar()
+    resumo["rejeitados"] = rejeitadas.quantidade
+    if rejeitadas.quantidade:
+        resumo["relatorio_rejeitados"] = caminho_rejeitadas
+    return resumo
+
+# --- Exportação ---
+
+def exportar_catalogo(caminho, banco=database, progresso=None):
+    """Grava todos os produtos em `caminho` (.csv ou .xlsx), no formato aceito por importar_catalogo().
+
+    Retorna a quantidade de produtos exportados.
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in (".csv", ".xlsx"):
+        raise ValueError(f"Formato não suportado para exportação: {extensao or caminho} (use .csv ou .xlsx)")
+    produtos = banco.listar_produtos()
+    linhas = ([produto[coluna] for coluna in database.COLUNAS_PRODUTOS] for produto in produtos)
+    if extensao == ".csv":
+        with open(caminho, "w", newline="", encoding=CODIFICACAO_CSV) as f:
+            escritor = csv.writer(f, delimiter=";")
+            escritor.writerow(database.COLUNAS_PRODUTOS)
+            for numero, linha in enumerate(linhas):
+                if progresso and numero % 10000 == 0:
+                    progresso(numero, len(produtos), "Exportando produtos")
+                escritor.writerow(linha)
+    else:
+        wb = openpyxl.Workbook(write_only=True) # Cada linha vai direto para o arquivo
+        ws = wb.create_sheet(title="Produtos")
+        ws.append(database.COLUNAS_PRODUTOS)
+        for numero, linha in enumerate(linhas):
+            if progresso and numero % 10000 == 0:
+                progresso(numero, len(produtos), "Exportando produtos")
+            ws.append(linha)
+        wb.save(caminho)
+    return len(produtos)
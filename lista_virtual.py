@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+import tkinter as tk
+from tkinter import ttk
+
+# --- Fontes de Linhas ---
+
+class FonteLista:
+    """Fonte de linhas para TreeviewVirtual a partir de uma lista de registros.
+
+    `formatar(registro)` retorna (valores, tags) e só é chamado para as linhas que
+    entram na janela visível. `linhas_extras` (já formatadas) vão ao final, ex.: total.
+    Com `chave(registro)`, registros podem ser trocados no lugar por substituir();
+    `versao` fica à disposição de quem controla atualizações incrementais.
+    """
+
+    def __init__(self, registros, formatar, linhas_extras=(), chave=None, versao=None):
+        self.registros = registros
+        self.formatar = formatar
+        self.linhas_extras = list(linhas_extras)
+        self.chave = chave
+        self.versao = versao
+        self._posicoes = None # {chave: índice}, montado na primeira consulta
+
+    def __len__(self):
+        return len(self.registros) + len(self.linhas_extras)
+
+    def linhas(self, inicio, fim):
+        """Retorna as linhas [inicio, fim) já formatadas."""
+        resultado = [self.formatar(registro) for registro in self.registros[inicio:fim]]
+        if fim > len(self.registros):
+            extra_inicio = max(0, inicio - len(self.registros))
+            resultado.extend(self.linhas_extras[extra_inicio:fim - len(self.registros)])
+        return resultado
+
+    def posicao(self, valor_chave):
+        """Índice do registro com a chave dada, ou None."""
+        if self._posicoes is None:
+            self._posicoes = {self.chave(registro): indice for indice, registro in enumerate(self.registros)}
+        return self._posicoes.get(valor_chave)
+
+    def substituir(self, indice, registro):
+        """Troca o registro `indice` por outro com a mesma chave."""
+        self.registros[indice] = registro
+
+class FontePaginada(FonteLista):
+    """FonteLista cujos registros são lidos do banco sob demanda, página a página.
+
+    `carregar(apos)` retorna (registros, proxima) como as funções pagina_* do
+    database.py. A primeira página é lida na criação (pode ser numa tarefa em
+    segundo plano); as seguintes, quando a janela pedida passa do que já foi
+    carregado — cada uma é uma busca curta no índice. `linhas_extras` só aparecem
+    depois da última página.
+    """
+
+    def __init__(self, carregar, formatar, linhas_extras=()):
+        super().__init__([], formatar, linhas_extras)
+        self.carregar = carregar
+        self._proxima = None
+        self.completa = False
+        self.carregar_mais()
+
+    def carregar_mais(self):
+        registros, self._proxima = self.carregar(self._proxima)
+        self.registros.extend(registros)
+        self.completa = self._proxima is None
+
+    def __len__(self):
+        return len(self.registros) + (len(self.linhas_extras) if self.completa else 0)
+
+    def linhas(self, inicio, fim):
+        while not self.completa and fim > len(self.registros):
+            self.carregar_mais()
+        return super().linhas(inicio, fim)
+
+# --- Treeview Virtual ---
+
+class TreeviewVirtual(ttk.Treeview):
+    """Treeview que só cria itens para as linhas visíveis.
+
+    O widget mantém um item ("slot") por linha que cabe na tela e, ao rolar, apenas
+    troca os valores desses slots. As linhas vêm de uma fonte (ex.: FonteLista) lida
+    em janelas de `buffer` linhas além das visíveis, então memória e tempo de
+    desenho não dependem do tamanho do resultado. Use definir_fonte()/limpar() no
+    lugar de insert()/delete().
+    """
+
+    def __init__(self, master=None, buffer=50, **kw):
+        super().__init__(master, **kw)
+        self.buffer = buffer
+        self._fonte = None
+        self._inicio = 0 # Índice da linha exibida no primeiro slot
+        self._slots = []
+        self._janela_inicio = 0 # Linhas da fonte já formatadas (janela visível + buffer)
+        self._janela = []
+        self._selecionada = None # Índice (na fonte) da linha selecionada
+        self._yscrollcommand = None
+        self._altura_linha = None
+
+        # Bindtag própria: os binds do código da aplicação não substituem os nossos
+        tag = f"TreeviewVirtual{id(self)}"
+        self.bindtags((tag,) + self.bindtags())
+        self.bind_class(tag, "<Configure>", lambda e: self._redimensionar())
+        self.bind_class(tag, "<MouseWheel>", self._roda_mouse)
+        self.bind_class(tag, "<Button-4>", lambda e: self._rolar_linhas(-3))
+        self.bind_class(tag, "<Button-5>", lambda e: self._rolar_linhas(3))
+        for tecla, passo in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-pagina"), ("<Next>", "pagina"),
+                             ("<Home>", "inicio"), ("<End>", "fim")):
+            self.bind_class(tag, tecla, lambda e, p=passo: self._mover_selecao(p))
+
+    # --- API pública ---
+
+    def definir_fonte(self, fonte, manter_posicao=False):
+        """Exibe as linhas de `fonte` (None limpa a lista)."""
+        self._fonte = fonte
+        self._janela = []
+        self._selecionada = None
+        if self.selection():
+            self.selection_remove(self.selection())
+        self.focus("")
+        if not manter_posicao:
+            self._inicio = 0
+        self._desenhar()
+
+    def limpar(self):
+        self.definir_fonte(None)
+
+    def atualizar(self):
+        """Relê da fonte a janela visível (após alterar os registros da fonte)."""
+        self._janela = []
+        self._capturar_selecao()
+        self._desenhar()
+
+    @property
+    def fonte(self):
+        return self._fonte
+
+    def atualizar_linhas(self, indices):
+        """Reformata só as linhas `indices` (após trocar esses registros na fonte)."""
+        janela_fim = self._janela_inicio + len(self._janela)
+        for indice in indices:
+            if not self._janela_inicio <= indice < janela_fim:
+                continue # Fora da janela: será formatada quando entrar nela
+            linha = self._fonte.linhas(indice, indice + 1)[0]
+            self._janela[indice - self._janela_inicio] = linha
+            if self._inicio <= indice < self._inicio + len(self._slots):
+                valores, tags = linha
+                self.item(self._slots[indice - self._inicio], values=valores, tags=tags)
+
+    def total_linhas(self):
+        return len(self._fonte) if self._fonte is not None else 0
+
+    def linha_selecionada(self):
+        """Índice, na fonte, da linha selecionada (ou None)."""
+        self._capturar_selecao()
+        return self._selecionada
+
+    def rolar_para(self, indice, capturar=True):
+        """Rola para que a linha `indice` fique visível."""
+        if capturar:
+            self._capturar_selecao()
+        visiveis = self._linhas_visiveis()
+        if indice < self._inicio:
+            self._inicio = indice
+        elif indice >= self._inicio + visiveis:
+            self._inicio = indice - visiveis + 1
+        self._desenhar()
+
+    def yview(self, *args):
+        """Rolagem virtual, compatível com ttk.Scrollbar(command=tree.yview)."""
+        total = self.total_linhas()
+        visiveis = self._linhas_visiveis()
+        if not args:
+            if not total:
+                return (0.0, 1.0)
+            return (self._inicio / total, min(1.0, (self._inicio + visiveis) / total))
+        self._capturar_selecao() # Antes de mudar _inicio: a seleção é guardada pelo índice da linha
+        if args[0] == "moveto":
+            self._inicio = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            passos = int(args[1])
+            self._inicio += passos * (visiveis if args[2] == "pages" else 1)
+        self._desenhar()
+
+    def configure(self, cnf=None, **kw):
+        # yscrollcommand é chamado por nós com as frações virtuais, não pelo Tk
+        if isinstance(cnf, dict) and "yscrollcommand" in cnf:
+            cnf = dict(cnf)
+            self._yscrollcommand = cnf.pop("yscrollcommand")
+        if "yscrollcommand" in kw:
+            self._yscrollcommand = kw.pop("yscrollcommand")
+            self._atualizar_barra()
+        return super().configure(cnf, **kw)
+
+    config = configure
+
+    # --- Internos ---
+
+    def _linhas_visiveis(self):
+        altura = self.winfo_height()
+        if altura <= 1: # Ainda não desenhado
+            return int(self.cget("height"))
+        if self._altura_linha is None and self._slots:
+            caixa = self.bbox(self._slots[0])
+            if caixa:
+                self._altura_linha = (caixa[1], caixa[3]) # (topo do primeiro item, altura da linha)
+        topo, altura_linha = self._altura_linha or (25, 20)
+        return max(1, (altura - topo) // altura_linha)
+
+    def _redimensionar(self):
+        if len(self._slots) != min(self._linhas_visiveis(), self.total_linhas() - self._inicio):
+            self._capturar_selecao()
+            self._desenhar()
+
+    def _linhas_da_fonte(self, inicio, quantidade):
+        fim = inicio + quantidade
+        janela_fim = self._janela_inicio + len(self._janela)
+        if not (self._janela_inicio <= inicio and fim <= janela_fim):
+            self._janela_inicio = max(0, inicio - self.buffer)
+            self._janela = self._fonte.linhas(self._janela_inicio, fim + self.buffer)
+        deslocamento = inicio - self._janela_inicio
+        return self._janela[deslocamento:deslocamento + quantidade]
+
+    def _capturar_selecao(self):
+        selecao = self.selection()
+        if selecao and selecao[0] in self._slots:
+            self._selecionada = self._inicio + self._slots.index(selecao[0])
+        elif self._selecionada is not None and self._inicio <= self._selecionada < self._inicio + len(self._slots):
+            self._selecionada = None # A seleção visível foi removida pela aplicação
+
+    def _desenhar(self):
+        total = self.total_linhas()
+        visiveis = self._linhas_visiveis()
+        self._inicio = max(0, min(self._inicio, total - visiveis))
+        linhas = self._linhas_da_fonte(self._inicio, visiveis) if total else []
+
+        # Ajusta a quantidade de slots e apenas troca os valores dos existentes
+        while len(self._slots) > len(linhas):
+            super().delete(self._slots.pop())
+        while len(self._slots) < len(linhas):
+            self._slots.append(super().insert("", tk.END, iid=f"slot{len(self._slots)}"))
+        for slot, (valores, tags) in zip(self._slots, linhas):
+            self.item(slot, values=valores, tags=tags)
+
+        # Mantém a seleção na linha certa (ou some com ela, se a linha saiu da tela)
+        if self._selecionada is not None and self._inicio <= self._selecionada < self._inicio + len(self._slots):
+            slot = self._slots[self._selecionada - self._inicio]
+            if self.selection() != (slot,):
+                self.selection_set(slot)
+            self.focus(slot)
+        elif self.selection():
+            self.selection_remove(self.selection())
+            self.focus("")
+        self._atualizar_barra()
+
+    def _atualizar_barra(self):
+        if self._yscrollcommand:
+            primeiro, ultimo = self.yview()
+            self._yscrollcommand(primeiro, ultimo)
+
+    def _rolar_linhas(self, passos):
+        self._capturar_selecao()
+        self._inicio += passos
+        self._desenhar()
+        return "break"
+
+    def _roda_mouse(self, event):
+        passos = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta # Windows x macOS
+        return self._rolar_linhas(passos * 3 if abs(event.delta) >= 120 else passos)
+
+    def _mover_selecao(self, passo):
+        total = self.total_linhas()
+        if not total:
+            return "break"
+        self._capturar_selecao()
+        atual = self._selecionada if self._selecionada is not None else self._inicio - 1
+        visiveis = self._linhas_visiveis()
+        destino = {"-pagina": atual - visiveis, "pagina": atual + visiveis,
+                   "inicio": 0, "fim": total - 1}.get(passo, atual + passo if isinstance(passo, int) else atual)
+        destino = max(0, min(destino, total - 1))
+        self._selecionada = destino # A nova seleção é aplicada por _desenhar()
+        self.rolar_para(destino, capturar=False)
+        return "break"
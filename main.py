@@ -1,17 +1,32 @@
 # -*- coding: utf-8 -*-
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
-import database as db
+import cliente
+import diario
+import importacao
 import recibo
 import relatorio
+from lista_virtual import TreeviewVirtual, FonteLista, FontePaginada
+from tarefas import ExecutorTarefas, PainelTarefas, BuscaIncremental
 import datetime
+import functools
 import os
 
+db = cliente.banco() # database.py, ou o servidor da loja se LOJA_SERVIDOR estiver definido
+
 # --- Variáveis Globais ---
 itens_venda_atual = []
 usuario_logado = None # Armazenará {"id": id, "nome": nome, "tipo": tipo}
 produto_selecionado_id = None
 produto_selecionado_venda_id = None
+executor = None # ExecutorTarefas: consultas e exportações fora da thread do Tk
+fila_recibos = None # FilaRecibos: recibos gerados em segundo plano, na ordem das vendas
+ultimo_recibo = None # Caminho do último recibo gerado (botão "Abrir Último Recibo")
+recibos_agendado = None # after() que recolhe os recibos prontos, enquanto houver pendentes
+INTERVALO_RECIBOS_MS = 100
+diario_vendas = None # DiarioVendas: com LOJA_DIARIO, as vendas são gravadas no diário local do caixa
+sincronizador = None # SincronizadorVendas: envia as vendas do diário ao banco em segundo plano
+INTERVALO_SINCRONIZACAO_MS = 1000
 
 # --- Funções Auxiliares ---
 def formatar_data(data_str):
@@ -50,20 +65,7 @@ def fazer_login():
     user_data = db.autenticar_usuario(usuario, senha)
 
     if user_data:
-        usuario_logado = user_data
-        # Precisamos buscar o ID também
-        conn = db.conectar_bd()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM usuarios WHERE usuario = ?", (usuario,))
-        user_id_result = cursor.fetchone()
-        conn.close()
-        if user_id_result:
-            usuario_logado["id"] = user_id_result["id"]
-        else:
-             messagebox.showerror("Erro", "Não foi possível obter o ID do usuário.")
-             usuario_logado = None # Resetar se não achar ID
-             return
-
+        usuario_logado = user_data # autenticar_usuario já retorna o id
         janela_login.destroy()
         iniciar_sistema()
     else:
@@ -73,9 +75,12 @@ def fazer_login():
 def iniciar_sistema():
     global tree_produtos_cadastro, entry_cod_barras_cad, entry_nome_cad, entry_custo_cad, entry_venda_cad, entry_estoque_cad, entry_fornecedor_cad, entry_minimo_cad
     global tree_venda_busca, tree_venda_carrinho, lbl_total_venda, var_pagamento, entry_parcelas, combo_pagamento
+    global entry_scanner_venda, entry_busca_prod_venda, entry_qtd_item_venda
     global tree_estoque, entry_produto_id_est, entry_qtd_entrada, entry_motivo_entrada
     global combo_relatorio, entry_data_ini, entry_data_fim, tree_relatorio
     global abas, frame_botoes_cad # Tornar abas e frame_botoes_cad globais
+    global executor, fila_recibos, lbl_status_venda, btn_abrir_recibo
+    global diario_vendas, sincronizador, lbl_sincronizacao, busca_cadastro, busca_venda
 
     janela = tk.Tk()
     janela.title("Sistema Loja Simplificado")
@@ -93,6 +98,27 @@ def iniciar_sistema():
     lbl_usuario = tk.Label(janela, text=info_usuario, anchor="e")
     lbl_usuario.pack(fill="x", padx=10, pady=5)
 
+    # Executor de tarefas em segundo plano e barra de progresso/cancelamento
+    executor = ExecutorTarefas(janela)
+    painel_tarefas = PainelTarefas(janela, executor)
+    painel_tarefas.pack(side=tk.BOTTOM, fill="x", padx=10, pady=5)
+    fila_recibos = recibo.FilaRecibos() # Já prepara o modelo do recibo em segundo plano
+    if diario.CAMINHO_DIARIO:
+        diario_vendas = diario.DiarioVendas(diario.CAMINHO_DIARIO)
+        sincronizador = diario.SincronizadorVendas(diario_vendas, db).iniciar()
+
+    def fechar_janela():
+        executor.encerrar()
+        fila_recibos.encerrar() # Termina os recibos das últimas vendas
+        if sincronizador:
+            sincronizador.encerrar() # Última tentativa de enviar as vendas pendentes
+            if diario_vendas.pendentes:
+                print(f"{diario_vendas.pendentes} venda(s) continuam no diário {diario_vendas.caminho}; "
+                      "serão enviadas na próxima abertura do sistema.")
+            diario_vendas.fechar()
+        janela.destroy()
+    janela.protocol("WM_DELETE_WINDOW", fechar_janela)
+
     abas = ttk.Notebook(janela)
 
     # --- Aba Cadastro --- #
@@ -143,6 +169,12 @@ def iniciar_sistema():
     btn_excluir_cad.pack(side=tk.LEFT, padx=5)
     btn_limpar_cad = ttk.Button(frame_botoes_cad, text="Limpar Campos", command=lambda: limpar_campos_cadastro(True))
     btn_limpar_cad.pack(side=tk.LEFT, padx=5)
+    btn_exportar_cad = ttk.Button(frame_botoes_cad, text="Exportar Planilha...", command=exportar_produtos_interface)
+    btn_exportar_cad.pack(side=tk.RIGHT, padx=5)
+    btn_importar_cad = ttk.Button(frame_botoes_cad, text="Importar Planilha...", command=importar_produtos_interface)
+    btn_importar_cad.pack(side=tk.RIGHT, padx=5)
+    btn_reajustar_cad = ttk.Button(frame_botoes_cad, text="Reajustar Preços...", command=reajustar_precos_interface)
+    btn_reajustar_cad.pack(side=tk.RIGHT, padx=5)
 
     # Frame para pesquisa e listagem
     frame_lista_cad = ttk.LabelFrame(aba_cadastro, text="Produtos Cadastrados")
@@ -151,18 +183,23 @@ def iniciar_sistema():
     ttk.Label(frame_lista_cad, text="Pesquisar (Nome/Cód.):").pack(side=tk.LEFT, padx=5, pady=5)
     entry_pesquisa_cad = ttk.Entry(frame_lista_cad, width=30)
     entry_pesquisa_cad.pack(side=tk.LEFT, padx=5, pady=5)
-    btn_pesquisar_cad = ttk.Button(frame_lista_cad, text="Pesquisar", command=lambda: pesquisar_produto_interface(entry_pesquisa_cad.get()))
+    # Pesquisa enquanto digita (o botão pesquisa na hora)
+    busca_cadastro = BuscaIncremental(entry_pesquisa_cad, executor, exibir_produtos_cadastro, chave="busca_cadastro")
+    btn_pesquisar_cad = ttk.Button(frame_lista_cad, text="Pesquisar", command=busca_cadastro.buscar_agora)
     btn_pesquisar_cad.pack(side=tk.LEFT, padx=5, pady=5)
     btn_listar_todos_cad = ttk.Button(frame_lista_cad, text="Listar Todos", command=lambda: pesquisar_produto_interface(""))
     btn_listar_todos_cad.pack(side=tk.LEFT, padx=5, pady=5)
 
     # Treeview para listar produtos
     cols_cadastro = ("ID", "Cód. Barras", "Nome", "P. Venda", "Estoque", "Est. Mín.")
-    tree_produtos_cadastro = ttk.Treeview(frame_lista_cad, columns=cols_cadastro, show="headings", height=10)
+    tree_produtos_cadastro = TreeviewVirtual(frame_lista_cad, columns=cols_cadastro, show="headings", height=10)
     for col in cols_cadastro:
         tree_produtos_cadastro.heading(col, text=col)
         tree_produtos_cadastro.column(col, width=100, anchor=tk.CENTER)
     tree_produtos_cadastro.column("Nome", width=250, anchor=tk.W)
+    scrollbar_cad = ttk.Scrollbar(frame_lista_cad, orient="vertical", command=tree_produtos_cadastro.yview)
+    scrollbar_cad.pack(side=tk.RIGHT, fill="y")
+    tree_produtos_cadastro.configure(yscrollcommand=scrollbar_cad.set)
     tree_produtos_cadastro.pack(fill="both", expand=True, padx=5, pady=5)
     tree_produtos_cadastro.bind("<<TreeviewSelect>>", lambda event: selecionar_produto_cadastro(event, btn_editar_cad, btn_excluir_cad))
 
@@ -178,13 +215,24 @@ def iniciar_sistema():
     frame_esquerda_venda = ttk.Frame(paned_venda)
     paned_venda.add(frame_esquerda_venda, weight=2)
 
+    # Leitor de Código de Barras (Enter adiciona 1 unidade ao carrinho)
+    frame_scanner_venda = ttk.LabelFrame(frame_esquerda_venda, text="Leitor de Código de Barras")
+    frame_scanner_venda.pack(padx=5, pady=5, fill="x")
+    ttk.Label(frame_scanner_venda, text="Código:").pack(side=tk.LEFT, padx=5)
+    entry_scanner_venda = ttk.Entry(frame_scanner_venda, width=25)
+    entry_scanner_venda.pack(side=tk.LEFT, padx=5)
+    entry_scanner_venda.bind("<Return>", adicionar_por_codigo_barras)
+
     # Busca de Produto
     frame_busca_venda = ttk.LabelFrame(frame_esquerda_venda, text="Buscar Produto")
     frame_busca_venda.pack(padx=5, pady=5, fill="x")
     ttk.Label(frame_busca_venda, text="Nome/Cód.:").pack(side=tk.LEFT, padx=5)
     entry_busca_prod_venda = ttk.Entry(frame_busca_venda, width=20)
     entry_busca_prod_venda.pack(side=tk.LEFT, padx=5)
-    btn_buscar_prod_venda = ttk.Button(frame_busca_venda, text="Buscar", command=lambda: buscar_produto_venda(entry_busca_prod_venda.get()))
+    # Busca enquanto digita; apagar o texto só limpa a lista
+    busca_venda = BuscaIncremental(entry_busca_prod_venda, executor, exibir_produtos_venda, chave="busca_venda",
+                                   buscar_vazio=False)
+    btn_buscar_prod_venda = ttk.Button(frame_busca_venda, text="Buscar", command=busca_venda.buscar_agora)
     btn_buscar_prod_venda.pack(side=tk.LEFT, padx=5)
 
     # Lista de Produtos Encontrados (para adicionar)
@@ -255,6 +303,17 @@ def iniciar_sistema():
     btn_cancelar_venda = ttk.Button(frame_finalizar, text="Cancelar Venda", command=limpar_venda, width=20)
     btn_cancelar_venda.pack(pady=5)
 
+    # Situação da última venda e do seu recibo (sem janelas que interrompam o caixa)
+    lbl_status_venda = ttk.Label(frame_finalizar, text="", wraplength=220, justify=tk.CENTER)
+    lbl_status_venda.pack(pady=5)
+    btn_abrir_recibo = ttk.Button(frame_finalizar, text="Abrir Último Recibo", command=abrir_ultimo_recibo,
+                                  width=20, state=tk.DISABLED)
+    btn_abrir_recibo.pack(pady=5)
+    lbl_sincronizacao = ttk.Label(frame_finalizar, text="", wraplength=220, justify=tk.CENTER)
+    if sincronizador:
+        lbl_sincronizacao.pack(pady=5)
+        acompanhar_sincronizacao()
+
     # --- Aba Estoque --- #
     aba_estoque = ttk.Frame(abas)
     abas.add(aba_estoque, text="Controle de Estoque")
@@ -285,7 +344,7 @@ def iniciar_sistema():
 
     # Treeview para listar estoque
     cols_estoque = ("ID", "Cód. Barras", "Nome", "Estoque Atual", "Est. Mínimo")
-    tree_estoque = ttk.Treeview(frame_lista_est, columns=cols_estoque, show="headings", height=15)
+    tree_estoque = TreeviewVirtual(frame_lista_est, columns=cols_estoque, show="headings", height=15)
     for col in cols_estoque:
         tree_estoque.heading(col, text=col)
         tree_estoque.column(col, width=100, anchor=tk.CENTER)
@@ -295,11 +354,14 @@ def iniciar_sistema():
     tree_estoque.tag_configure("baixo", background="#FFDDDD") # Vermelho claro
     tree_estoque.tag_configure("ok", background="white")
 
-    tree_estoque.pack(fill="both", expand=True, padx=5, pady=5)
-
     # Botão para atualizar lista
     btn_atualizar_lista_est = ttk.Button(frame_lista_est, text="Atualizar Lista", command=atualizar_lista_estoque)
-    btn_atualizar_lista_est.pack(pady=5)
+    btn_atualizar_lista_est.pack(side=tk.BOTTOM, pady=5)
+
+    scrollbar_est = ttk.Scrollbar(frame_lista_est, orient="vertical", command=tree_estoque.yview)
+    scrollbar_est.pack(side=tk.RIGHT, fill="y")
+    tree_estoque.configure(yscrollcommand=scrollbar_est.set)
+    tree_estoque.pack(fill="both", expand=True, padx=5, pady=5)
 
     # --- Aba Relatórios --- #
     aba_relatorio = ttk.Frame(abas)
@@ -312,8 +374,13 @@ def iniciar_sistema():
     ttk.Label(frame_filtros_rel, text="Tipo de Relatório:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
     combo_relatorio = ttk.Combobox(frame_filtros_rel, values=[
         "Vendas por Período",
+        "Vendas Detalhadas (com Itens)",
         "Produtos Mais Vendidos",
-        "Movimentações de Estoque"
+        "Totais por Forma de Pagamento",
+        "Movimentações de Estoque",
+        "Posição de Estoque (Data Fim)",
+        "Conflitos de Estoque (Vendas Offline)",
+        "Histórico de Preços"
     ], state="readonly", width=30)
     combo_relatorio.grid(row=0, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
     combo_relatorio.current(0) # Padrão: Vendas por Período
@@ -338,7 +405,7 @@ def iniciar_sistema():
     frame_exibicao_rel.pack(padx=10, pady=10, fill="both", expand=True)
 
     # Treeview para exibir relatórios tabulares
-    tree_relatorio = ttk.Treeview(frame_exibicao_rel, show="headings") # Colunas definidas dinamicamente
+    tree_relatorio = TreeviewVirtual(frame_exibicao_rel, show="headings") # Colunas definidas dinamicamente
     tree_relatorio.pack(side=tk.LEFT, fill="both", expand=True, padx=5, pady=5)
 
     # Scrollbar para Treeview
@@ -421,27 +488,177 @@ def adicionar_produto_interface():
     except Exception as e:
         messagebox.showerror("Erro Inesperado", f"Ocorreu um erro: {str(e)}")
 
+def importar_produtos_interface():
+    """Importa (cadastra/atualiza) produtos de uma planilha CSV ou XLSX, em segundo plano."""
+    filepath = filedialog.askopenfilename(
+        title="Importar Produtos",
+        filetypes=[("Planilhas", "*.csv *.xlsx"), ("CSV Files", "*.csv"), ("Excel Files", "*.xlsx"), ("All Files", "*.*")]
+    )
+    if not filepath:
+        return # Usuário cancelou
+
+    def concluir(resumo):
+        msg = (f"{resumo['linhas']} linhas lidas:\n\n"
+               f"- {resumo['novos']} produtos novos\n"
+               f"- {resumo['atualizados']} atualizados\n"
+               f"- {resumo['inalterados']} sem alteração\n"
+               f"- {resumo['rejeitados']} linhas rejeitadas")
+        atualizar_produtos_alterados()
+        if resumo["rejeitados"]:
+            messagebox.showwarning("Importação Concluída", f"{msg}\n\nMotivos em:\n{resumo['relatorio_rejeitados']}")
+        else:
+            messagebox.showinfo("Importação Concluída", msg)
+
+    def falhar(e):
+        atualizar_produtos_alterados() # Os lotes já gravados continuam gravados
+        messagebox.showerror("Erro na Importação", f"Ocorreu um erro: {str(e)}")
+
+    usuario_id = usuario_logado["id"]
+    executor.executar(lambda tarefa: importacao.importar_catalogo(filepath, db, usuario_id, progresso=tarefa.progresso),
+                      descricao="Importando produtos",
+                      ao_concluir=concluir, ao_falhar=falhar)
+
+def exportar_produtos_interface():
+    """Exporta o catálogo de produtos para CSV ou XLSX (no formato aceito pela importação)."""
+    filepath = filedialog.asksaveasfilename(
+        defaultextension=".xlsx",
+        filetypes=[("Excel Files", "*.xlsx"), ("CSV Files", "*.csv")],
+        title="Exportar Produtos",
+        initialfile="produtos.xlsx"
+    )
+    if not filepath:
+        return # Usuário cancelou
+    executor.executar(lambda tarefa: importacao.exportar_catalogo(filepath, db, progresso=tarefa.progresso),
+                      descricao="Exportando produtos",
+                      ao_concluir=lambda total: messagebox.showinfo("Sucesso", f"{total} produtos exportados para:\n{filepath}"),
+                      ao_falhar=lambda e: messagebox.showerror("Erro na Exportação", f"Ocorreu um erro: {str(e)}"))
+
+def reajustar_precos_interface():
+    """Janela de reajuste de preços por fornecedor: monta as regras, mostra a prévia e aplica."""
+    TODOS = "(Todos os fornecedores)"
+    dialogo = tk.Toplevel(frame_botoes_cad.winfo_toplevel())
+    dialogo.title("Reajustar Preços")
+    dialogo.geometry("800x500")
+
+    frame_regras = ttk.LabelFrame(dialogo, text="Regras (aplicadas de cima para baixo; deixe em branco para não usar)")
+    frame_regras.pack(padx=10, pady=10, fill="x")
+
+    ttk.Label(frame_regras, text="Fornecedor:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+    combo_fornecedor = ttk.Combobox(frame_regras, values=[TODOS], state="readonly", width=40)
+    combo_fornecedor.grid(row=0, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
+    combo_fornecedor.current(0)
+    executor.executar(lambda tarefa: db.listar_fornecedores(), descricao="Carregando fornecedores",
+                      ao_concluir=lambda fornecedores: combo_fornecedor.config(values=[TODOS] + fornecedores))
+
+    campos = {}
+    for linha, (tipo, rotulo) in enumerate((("percentual_custo", "Reajuste do custo (%):"),
+                                            ("percentual_venda", "Reajuste da venda (%):"),
+                                            ("markup", "Markup (venda = custo ×):"),
+                                            ("terminacao", "Terminação do preço (ex.: 0,90):")), 1):
+        ttk.Label(frame_regras, text=rotulo).grid(row=linha, column=0, padx=5, pady=2, sticky="w")
+        campos[tipo] = ttk.Entry(frame_regras, width=10)
+        campos[tipo].grid(row=linha, column=1, padx=5, pady=2, sticky="w")
+
+    cols = ("Cód. Barras", "Nome", "Custo", "Novo Custo", "Venda", "Nova Venda")
+    tree_previa = TreeviewVirtual(dialogo, columns=cols, show="headings", height=12)
+    for col in cols:
+        tree_previa.heading(col, text=col)
+        tree_previa.column(col, width=90, anchor=tk.E)
+    tree_previa.column("Cód. Barras", width=110, anchor=tk.W)
+    tree_previa.column("Nome", width=250, anchor=tk.W)
+
+    frame_botoes = ttk.Frame(dialogo)
+    frame_botoes.pack(side=tk.BOTTOM, fill="x", padx=10, pady=10)
+    lbl_previa = ttk.Label(frame_botoes, text="")
+    lbl_previa.pack(side=tk.LEFT, padx=5)
+    tree_previa.pack(fill="both", expand=True, padx=10)
+
+    def ler_regras():
+        regras = []
+        for tipo, campo in campos.items():
+            texto = campo.get().strip()
+            if texto:
+                regras.append({"tipo": tipo, "valor": validar_float(texto)})
+        if not regras:
+            raise ValueError("Preencha ao menos uma regra de reajuste.")
+        tipos = [regra["tipo"] for regra in regras]
+        if "percentual_venda" in tipos and "markup" in tipos:
+            raise ValueError("Use o reajuste da venda ou o markup, não os dois (o markup recalcula a venda pelo custo).")
+        fornecedor = combo_fornecedor.get()
+        return regras, (None if fornecedor == TODOS else fornecedor)
+
+    def exibir_previa(alteracoes):
+        tree_previa.definir_fonte(FonteLista(alteracoes, lambda p: ((p["codigo_barras"], p["nome"],
+                                                                    f"{p['preco_custo'] or 0:.2f}", f"{p['novo_preco_custo'] or 0:.2f}",
+                                                                    f"{p['preco_venda']:.2f}", f"{p['novo_preco_venda']:.2f}"), ())))
+        lbl_previa.config(text=f"{len(alteracoes)} produto(s) mudariam de preço")
+
+    def previsualizar():
+        try:
+            regras, fornecedor = ler_regras()
+        except ValueError as e:
+            messagebox.showerror("Regra Inválida", str(e), parent=dialogo)
+            return
+        executor.executar(lambda tarefa: db.simular_reajuste(regras, fornecedor),
+                          descricao="Calculando reajuste", chave="reajuste",
+                          ao_concluir=exibir_previa,
+                          ao_falhar=lambda e: messagebox.showerror("Erro no Reajuste", f"Ocorreu um erro: {str(e)}", parent=dialogo))
+
+    def aplicar():
+        try:
+            regras, fornecedor = ler_regras()
+        except ValueError as e:
+            messagebox.showerror("Regra Inválida", str(e), parent=dialogo)
+            return
+        alvo = f"do fornecedor {fornecedor}" if fornecedor else "de TODOS os produtos"
+        if not messagebox.askyesno("Confirmar Reajuste", f"Aplicar o reajuste ({db.descrever_regras(regras)}) aos preços {alvo}?",
+                                   parent=dialogo):
+            return
+
+        def concluir(alterados):
+            atualizar_produtos_alterados()
+            messagebox.showinfo("Reajuste Concluído", f"{alterados} produto(s) tiveram o preço alterado.", parent=dialogo)
+            dialogo.destroy()
+
+        usuario_id = usuario_logado["id"]
+        executor.executar(lambda tarefa: db.aplicar_reajuste(regras, fornecedor, usuario_id=usuario_id),
+                          descricao="Aplicando reajuste",
+                          ao_concluir=concluir,
+                          ao_falhar=lambda e: messagebox.showerror("Erro no Reajuste", f"Ocorreu um erro: {str(e)}", parent=dialogo))
+
+    ttk.Button(frame_botoes, text="Cancelar", command=dialogo.destroy).pack(side=tk.RIGHT, padx=5)
+    ttk.Button(frame_botoes, text="Aplicar", command=aplicar).pack(side=tk.RIGHT, padx=5)
+    ttk.Button(frame_botoes, text="Pré-visualizar", command=previsualizar).pack(side=tk.RIGHT, padx=5)
+
+def linha_produto_cadastro(prod):
+    return (prod["id"],
+            prod["codigo_barras"],
+            prod["nome"],
+            f"{prod['preco_venda']:.2f}",
+            prod["estoque"],
+            prod["estoque_minimo"]), ()
+
 def pesquisar_produto_interface(termo):
-    try:
-        produtos = db.listar_produtos(termo)
-        # Limpar treeview
-        for i in tree_produtos_cadastro.get_children():
-            tree_produtos_cadastro.delete(i)
-        # Preencher com resultados
-        for prod in produtos:
-            tree_produtos_cadastro.insert("", tk.END, values=(
-                prod["id"],
-                prod["codigo_barras"],
-                prod["nome"],
-                f"{prod['preco_venda']:.2f}",
-                prod["estoque"],
-                prod["estoque_minimo"]
-            ))
-        limpar_campos_cadastro(True) # Limpa campos e seleção
-    except tk.TclError:
-        pass # Ignora erro se a treeview não existir mais
-    except Exception as e:
-        messagebox.showerror("Erro ao Pesquisar", f"Ocorreu um erro: {str(e)}")
+    def consultar(tarefa):
+        versao = db.versao_catalogo() # Lida antes da consulta: alterações concorrentes são reaplicadas depois
+        return versao, db.listar_produtos(termo)
+
+    def exibir(resultado):
+        versao, produtos = resultado
+        try:
+            exibir_produtos_cadastro(produtos, versao)
+        except tk.TclError:
+            pass # Ignora erro se a treeview não existir mais
+
+    # Mesma chave da busca enquanto digita: a consulta mais recente é a que vale
+    executor.executar(consultar, chave="busca_cadastro", ao_concluir=exibir,
+                      ao_falhar=lambda e: messagebox.showerror("Erro ao Pesquisar", f"Ocorreu um erro: {str(e)}"))
+
+def exibir_produtos_cadastro(produtos, versao):
+    # Só as linhas visíveis são formatadas/inseridas na treeview
+    tree_produtos_cadastro.definir_fonte(FonteLista(produtos, linha_produto_cadastro,
+                                                    chave=lambda prod: prod["id"], versao=versao))
+    limpar_campos_cadastro(True) # Limpa campos e seleção
 
 def selecionar_produto_cadastro(event, btn_editar, btn_excluir):
     global produto_selecionado_id
@@ -511,7 +728,8 @@ def editar_produto_interface():
             messagebox.showwarning("Dados Inválidos", "Nome, Preço de Venda (>0) e Estoque Mínimo (>=0) são obrigatórios.")
             return
 
-        if db.atualizar_produto(produto_selecionado_id, cod_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo):
+        if db.atualizar_produto(produto_selecionado_id, cod_barras, nome, preco_custo, preco_venda, estoque, fornecedor, estoque_minimo,
+                                usuario_logado["id"]):
             messagebox.showinfo("Sucesso", "Produto atualizado com sucesso!")
             limpar_campos_cadastro(True)
             pesquisar_produto_interface("") # Atualiza lista
@@ -542,10 +760,9 @@ def excluir_produto_interface():
             messagebox.showerror("Erro", "Não foi possível excluir o produto. Verifique se ele está associado a vendas registradas.")
 
 # --- Funções da Aba Venda --- #
-def buscar_produto_venda(termo):
+def exibir_produtos_venda(produtos, versao=None):
     global produto_selecionado_venda_id
     try:
-        produtos = db.listar_produtos(termo)
         tree_venda_busca.delete(*tree_venda_busca.get_children())
         produto_selecionado_venda_id = None # Reseta seleção
         for prod in produtos:
@@ -558,8 +775,6 @@ def buscar_produto_venda(termo):
                 ))
     except tk.TclError:
         pass # Ignora erro se widget não existe mais
-    except Exception as e:
-        messagebox.showerror("Erro ao Buscar", f"Ocorreu um erro: {str(e)}")
 
 def selecionar_produto_venda(event):
     global produto_selecionado_venda_id
@@ -636,6 +851,52 @@ def adicionar_item_venda(qtd_str):
         pass # Ignora erro se widget não existe mais
     produto_selecionado_venda_id = None
 
+def adicionar_por_codigo_barras(event=None):
+    """Adiciona 1 unidade do produto lido pelo scanner, atualizando só a linha do carrinho."""
+    try:
+        codigo = entry_scanner_venda.get().strip()
+        entry_scanner_venda.delete(0, tk.END)
+    except tk.TclError:
+        return
+    if not codigo:
+        return
+
+    produto = db.buscar_produto_por_codigo_barras(codigo)
+    if not produto:
+        messagebox.showwarning("Produto Não Encontrado", f"Nenhum produto com o código de barras '{codigo}'.")
+        return
+
+    item = next((i for i in itens_venda_atual if i["produto_id"] == produto["id"]), None)
+    qtd_ja_no_carrinho = item["quantidade"] if item else 0
+    if qtd_ja_no_carrinho + 1 > produto["estoque"]:
+        messagebox.showwarning("Estoque Insuficiente", f"Estoque disponível para '{produto['nome']}': {produto['estoque']}. Você já tem {qtd_ja_no_carrinho} no carrinho.")
+        return
+
+    if item:
+        item["quantidade"] += 1
+    else:
+        item = {
+            "produto_id": produto["id"],
+            "nome": produto["nome"],
+            "quantidade": 1,
+            "preco": produto["preco_venda"]
+        }
+        itens_venda_atual.append(item)
+
+    try:
+        # Atualiza/insere apenas a linha do produto, sem reconstruir o carrinho
+        valores = (item["produto_id"], item["nome"], item["quantidade"], f"{item['preco']:.2f}", f"{item['quantidade'] * item['preco']:.2f}")
+        iid = str(item["produto_id"])
+        if tree_venda_carrinho.exists(iid):
+            tree_venda_carrinho.item(iid, values=valores)
+        else:
+            tree_venda_carrinho.insert("", tk.END, iid=iid, values=valores)
+        tree_venda_carrinho.see(iid)
+        total_venda = float(lbl_total_venda.cget("text")) + item["preco"]
+        lbl_total_venda.config(text=f"{total_venda:.2f}")
+    except (tk.TclError, ValueError):
+        atualizar_carrinho_e_total() # Em caso de inconsistência, reconstrói o carrinho
+
 def remover_item_venda():
     global itens_venda_atual
     try:
@@ -667,7 +928,7 @@ def atualizar_carrinho_e_total():
         # Preencher com itens da lista global
         for item in itens_venda_atual:
             subtotal = item["quantidade"] * item["preco"]
-            tree_venda_carrinho.insert("", tk.END, values=(
+            tree_venda_carrinho.insert("", tk.END, iid=str(item["produto_id"]), values=(
                 item["produto_id"],
                 item["nome"],
                 item["quantidade"],
@@ -750,61 +1011,167 @@ def finalizar_venda_interface():
         msg += f" ({parcelas}x)"
 
     if messagebox.askyesno("Confirmar Venda", msg):
-        venda_id = db.registrar_venda(usuario_logado["id"], forma_pagamento, parcelas, total_venda, itens_venda_atual)
+        if diario_vendas:
+            # Venda gravada no diário local; o banco recebe em segundo plano (não espera o banco)
+            venda_id = diario_vendas.registrar(usuario_logado["id"], forma_pagamento, parcelas, total_venda,
+                                               itens_venda_atual)
+            sincronizador.acordar()
+        else:
+            venda_id = db.registrar_venda(usuario_logado["id"], forma_pagamento, parcelas, total_venda, itens_venda_atual)
 
         if venda_id:
-            messagebox.showinfo("Sucesso", f"Venda #{venda_id} registrada com sucesso!")
-
-            # Gerar Recibo
+            # O recibo vai para a fila de recibos: o caixa já fica livre para a próxima venda
             dados_recibo = {
                 "data_hora": datetime.datetime.now(),
                 "usuario_nome": usuario_logado["nome"],
                 "forma_pagamento": forma_pagamento,
                 "parcelas": parcelas
             }
-            caminho_recibo = recibo.gerar_recibo(venda_id, dados_recibo, itens_venda_atual)
-
-            if caminho_recibo:
-                if messagebox.askyesno("Recibo Gerado", f"Recibo salvo em:\n{caminho_recibo}\n\nDeseja abrir o recibo agora?"):
-                    try:
-                        # Tenta abrir com o visualizador padrão do sistema
-                        if os.name == "nt": # Windows
-                            os.startfile(caminho_recibo)
-                        elif os.uname().sysname == "Darwin": # macOS
-                            os.system(f'open "{caminho_recibo}"')
-                        else: # Linux
-                            os.system(f'xdg-open "{caminho_recibo}"')
-                    except Exception as e:
-                        messagebox.showwarning("Erro ao Abrir", f"Não foi possível abrir o PDF automaticamente: {e}")
-            else:
-                messagebox.showerror("Erro Recibo", "Falha ao gerar o recibo em PDF.")
+            fila_recibos.enfileirar(venda_id, dados_recibo, itens_venda_atual)
+            lbl_status_venda.config(text=f"Venda #{venda_id} registrada. Gerando recibo...")
+            if recibos_agendado is None:
+                acompanhar_recibos()
 
             limpar_venda()
-            atualizar_lista_estoque() # Atualiza estoque visualmente
-            pesquisar_produto_interface("") # Atualiza lista cadastro (estoque mudou)
+            if not diario_vendas: # Com o diário, a atualização vem após a sincronização
+                atualizar_produtos_alterados() # Atualiza só as linhas dos produtos vendidos
+            entry_scanner_venda.focus_set() # Pronto para o próximo cliente
         else:
             messagebox.showerror("Erro", "Falha ao registrar a venda no banco de dados.")
 
-# --- Funções da Aba Estoque --- #
-def atualizar_lista_estoque():
+def acompanhar_recibos():
+    """Recolhe os recibos prontos da fila (na thread do Tk) enquanto houver pendentes."""
+    global ultimo_recibo, recibos_agendado
+    recibos_agendado = None
     try:
-        produtos = db.listar_produtos()
-        tree_estoque.delete(*tree_estoque.get_children())
-        for prod in produtos:
-            tag = "ok"
-            if prod["estoque"] <= prod["estoque_minimo"]:
-                tag = "baixo"
-            tree_estoque.insert("", tk.END, values=(
-                prod["id"],
-                prod["codigo_barras"],
-                prod["nome"],
-                prod["estoque"],
-                prod["estoque_minimo"]
-            ), tags=(tag,))
+        for venda_id, caminho_recibo in fila_recibos.recolher():
+            if caminho_recibo:
+                ultimo_recibo = caminho_recibo
+                lbl_status_venda.config(text=f"Venda #{venda_id} registrada. Recibo salvo.")
+                # Recibos ESC/POS já foram para a impressora; não há o que abrir
+                btn_abrir_recibo.config(state=tk.DISABLED if fila_recibos.formato == "escpos" else tk.NORMAL)
+            else:
+                lbl_status_venda.config(text=f"Venda #{venda_id} registrada. Falha ao gerar o recibo.")
+        if fila_recibos.pendentes:
+            recibos_agendado = lbl_status_venda.after(INTERVALO_RECIBOS_MS, acompanhar_recibos)
     except tk.TclError:
-        pass # Ignora erro se widget não existe mais
-    except Exception as e:
-        messagebox.showerror("Erro ao Atualizar Estoque", f"Ocorreu um erro: {str(e)}")
+        pass # Janela fechada
+
+def acompanhar_sincronizacao(sincronizadas=0):
+    """Mostra as vendas do diário ainda não enviadas ao banco e atualiza as listas após cada envio."""
+    try:
+        if sincronizador.estatisticas["sincronizadas"] != sincronizadas:
+            sincronizadas = sincronizador.estatisticas["sincronizadas"]
+            atualizar_produtos_alterados()
+        texto = f"Vendas a sincronizar: {diario_vendas.pendentes}"
+        if sincronizador.ultima_falha:
+            texto += " (banco inacessível, tentando de novo)"
+        lbl_sincronizacao.config(text=texto)
+        lbl_sincronizacao.after(INTERVALO_SINCRONIZACAO_MS, acompanhar_sincronizacao, sincronizadas)
+    except tk.TclError:
+        pass # Janela fechada
+
+def abrir_ultimo_recibo():
+    if ultimo_recibo:
+        abrir_arquivo(ultimo_recibo, "recibo")
+
+# --- Funções da Aba Estoque --- #
+def linha_estoque(prod):
+    tag = "ok"
+    if prod["estoque"] <= prod["estoque_minimo"]:
+        tag = "baixo"
+    return (prod["id"],
+            prod["codigo_barras"],
+            prod["nome"],
+            prod["estoque"],
+            prod["estoque_minimo"]), (tag,)
+
+def atualizar_lista_estoque():
+    def consultar(tarefa):
+        versao = db.versao_catalogo() # Lida antes da consulta: alterações concorrentes são reaplicadas depois
+        return versao, db.listar_produtos()
+
+    def exibir(resultado):
+        versao, produtos = resultado
+        tree_estoque.definir_fonte(FonteLista(produtos, linha_estoque, chave=lambda prod: prod["id"], versao=versao),
+                                   manter_posicao=True)
+        atualizar_linhas_alteradas(tree_estoque, atualizar_lista_estoque, lista_completa=True)
+
+    # Sem descrição: atualização silenciosa, fora do painel de tarefas
+    executor.executar(consultar, chave="estoque", ao_concluir=exibir,
+                      ao_falhar=lambda e: messagebox.showerror("Erro ao Atualizar Estoque", f"Ocorreu um erro: {str(e)}"))
+
+def atualizar_linhas_alteradas(tree, recarregar, lista_completa, ao_concluir=None):
+    """Troca na lista só os produtos alterados desde que ela foi carregada.
+
+    Recarrega a lista inteira quando não dá para corrigir no lugar: registro de
+    alterações insuficiente, produto excluído ou renomeado (muda a ordem) ou, numa
+    lista com todos os produtos, um produto novo. As consultas rodam no executor
+    (duas requisições no modo cliente, quantos forem os produtos alterados);
+    `ao_concluir(produtos alterados por id, versão)` é chamado depois, na thread do Tk.
+    """
+    fonte = tree.fonte
+    if fonte is None or fonte.versao is None:
+        recarregar()
+        return
+
+    def consultar(tarefa):
+        produto_ids, versao = db.produtos_alterados_desde(fonte.versao)
+        produtos = db.buscar_produtos_por_ids(list(produto_ids)) if produto_ids else []
+        return produto_ids, versao, {produto["id"]: produto for produto in produtos}
+
+    def aplicar(resultado):
+        produto_ids, versao, produtos = resultado
+        try:
+            if tree.fonte is fonte: # Senão a lista foi recarregada enquanto isso
+                corrigir(produto_ids, versao, produtos)
+            if ao_concluir:
+                ao_concluir(produtos, versao)
+        except tk.TclError:
+            pass # Ignora erro se widget não existe mais
+
+    def corrigir(produto_ids, versao, produtos):
+        if produto_ids is None:
+            recarregar()
+            return
+        indices = []
+        for produto_id in produto_ids:
+            indice = fonte.posicao(produto_id)
+            if indice is None:
+                if lista_completa:
+                    recarregar()
+                    return
+                continue # Fora do filtro da pesquisa
+            produto = produtos.get(produto_id)
+            if produto is None or produto["nome"] != fonte.registros[indice]["nome"]:
+                recarregar()
+                return
+            fonte.substituir(indice, produto)
+            indices.append(indice)
+        fonte.versao = versao
+        tree.atualizar_linhas(indices)
+
+    # Uma atualização por lista; uma mais nova cancela a anterior (parte da mesma versão)
+    executor.executar(consultar, chave=f"alteracoes_{tree}", ao_concluir=aplicar,
+                      ao_falhar=lambda e: print(f"Erro ao atualizar a lista de produtos: {e}"))
+
+def atualizar_produtos_alterados():
+    """Atualiza as listas de estoque e de cadastro após vendas/entradas, sem recarregá-las."""
+    def cadastro_atualizado(produtos, versao):
+        # As buscas incrementais deixam de reaproveitar resultados anteriores às alterações
+        busca_cadastro.atualizar_versao(versao)
+        busca_venda.atualizar_versao(versao)
+        # O estoque exibido no formulário de edição também pode ter mudado
+        produto = produtos.get(produto_selecionado_id)
+        if produto:
+            entry_estoque_cad.config(state=tk.NORMAL)
+            entry_estoque_cad.delete(0, tk.END)
+            entry_estoque_cad.insert(0, str(produto["estoque"]))
+            entry_estoque_cad.config(state=tk.DISABLED)
+
+    atualizar_linhas_alteradas(tree_estoque, atualizar_lista_estoque, lista_completa=True)
+    atualizar_linhas_alteradas(tree_produtos_cadastro, lambda: pesquisar_produto_interface(""),
+                               lista_completa=False, ao_concluir=cadastro_atualizado)
 
 def registrar_entrada_interface():
     try:
@@ -827,8 +1194,7 @@ def registrar_entrada_interface():
             entry_produto_id_est.delete(0, tk.END)
             entry_qtd_entrada.delete(0, tk.END)
             entry_motivo_entrada.delete(0, tk.END)
-            atualizar_lista_estoque() # Atualiza a lista visual
-            pesquisar_produto_interface("") # Atualiza lista cadastro (estoque mudou)
+            atualizar_produtos_alterados() # Atualiza só a linha do produto
         else:
             messagebox.showerror("Erro", "Falha ao registrar a entrada no banco de dados.")
 
@@ -840,13 +1206,57 @@ def registrar_entrada_interface():
         messagebox.showerror("Erro Inesperado", f"Ocorreu um erro: {str(e)}")
 
 # --- Funções da Aba Relatórios --- #
-relatorio_atual_dados = []
+relatorio_atual_dados = [] # Lista, ou função que gera as linhas de novo (relatórios paginados)
 relatorio_atual_colunas = []
 relatorio_atual_titulo = ""
 
-def gerar_relatorio_interface():
-    global relatorio_atual_dados, relatorio_atual_colunas, relatorio_atual_titulo
+def formatar_data_hora(data_hora):
+    """Formata data/hora (string ISO ou datetime) como DD/MM/AAAA HH:MM."""
+    if isinstance(data_hora, str):
+        try:
+            return datetime.datetime.fromisoformat(data_hora).strftime("%d/%m/%Y %H:%M")
+        except ValueError:
+            return data_hora # Mantém como string se não for formato ISO
+    elif isinstance(data_hora, datetime.datetime):
+        return data_hora.strftime("%d/%m/%Y %H:%M")
+    return data_hora
+
+# Linhas em tuplas, na ordem de db.COLUNAS_VENDAS / db.COLUNAS_VENDAS_ITENS / db.COLUNAS_MOVIMENTACOES
+def linha_relatorio_venda(venda):
+    id_venda, data_hora, usuario, forma_pagamento, parcelas, total = venda
+    return (id_venda, formatar_data_hora(data_hora), usuario, forma_pagamento, parcelas, f"R$ {total:.2f}"), ()
+
+def linha_relatorio_venda_itens(linha):
+    id_venda, data_hora, usuario, forma_pagamento, produto, quantidade, preco_unitario, subtotal = linha
+    if produto is None: # Venda sem itens
+        return (id_venda, formatar_data_hora(data_hora), usuario, forma_pagamento, "", "", "", ""), ()
+    return (id_venda, formatar_data_hora(data_hora), usuario, forma_pagamento, produto, quantidade,
+            f"R$ {preco_unitario:.2f}", f"R$ {subtotal:.2f}"), ()
+
+def linha_relatorio_movimentacao(mov):
+    data_hora, produto, tipo, quantidade, motivo, usuario, _id = mov
+    return (formatar_data_hora(data_hora), produto, tipo, quantidade, motivo, usuario if usuario else "Sistema"), ()
+
+# Relatórios longos são lidos por página (chave data_hora, id) conforme a lista rola
+RELATORIOS_PAGINADOS = {
+    "Vendas por Período": (db.pagina_vendas_por_periodo, linha_relatorio_venda),
+    # Vendas e itens de cada página vêm em duas consultas, não uma consulta de itens por venda
+    "Vendas Detalhadas (com Itens)": (db.pagina_vendas_itens_por_periodo, linha_relatorio_venda_itens),
+    "Movimentações de Estoque": (db.pagina_movimentacoes_estoque, linha_relatorio_movimentacao), # TODO: Adicionar opção de filtrar por produto?
+}
+
+def consultar_relatorio_paginado(tarefa, tipo, data_ini, data_fim):
+    """Lê a primeira página (no executor); as demais são lidas pela própria fonte."""
+    pagina, formatar = RELATORIOS_PAGINADOS[tipo]
+    fonte = FontePaginada(lambda apos: pagina(data_ini, data_fim, apos=apos), formatar)
+    if tipo in ("Vendas por Período", "Vendas Detalhadas (com Itens)"):
+        # O total geral vem dos resumos diários, sem precisar ler todas as vendas
+        total_geral_vendas = sum(t["total"] for t in db.obter_totais_periodo(data_ini, data_fim))
+        vazias = ("",) * (len(db.COLUNAS_VENDAS if tipo == "Vendas por Período" else db.COLUNAS_VENDAS_ITENS) - 2)
+        fonte.linhas_extras = [(vazias + ("TOTAL:", f"R$ {total_geral_vendas:.2f}"), ("total_row",))]
+    return fonte
 
+def gerar_relatorio_interface():
     try:
         tipo = combo_relatorio.get()
         data_ini_str = entry_data_ini.get()
@@ -860,181 +1270,222 @@ def gerar_relatorio_interface():
         messagebox.showerror("Erro Interface", "Erro ao ler opções de relatório.")
         return
 
+    consultas = {
+        "Produtos Mais Vendidos": db.obter_produtos_mais_vendidos,
+        "Totais por Forma de Pagamento": db.obter_totais_periodo,
+        # Estoque no fim do último dia: saldo fechado + movimentações recentes
+        "Posição de Estoque (Data Fim)": lambda data_ini, data_fim: db.obter_posicao_estoque(data_fim),
+        "Conflitos de Estoque (Vendas Offline)": db.obter_conflitos_estoque,
+        "Histórico de Preços": db.obter_historico_precos,
+    }
+    titulo = f"{tipo} ({data_ini_str} a {data_fim_str})"
+    if tipo in RELATORIOS_PAGINADOS:
+        consultar = lambda tarefa: consultar_relatorio_paginado(tarefa, tipo, data_ini, data_fim)
+        # A exportação percorre o período de novo, página a página, sem guardar tudo em memória
+        exportar = functools.partial(db.percorrer_paginas, RELATORIOS_PAGINADOS[tipo][0], data_ini, data_fim)
+    elif tipo in consultas:
+        consultar = lambda tarefa: consultas[tipo](data_ini, data_fim)
+        exportar = None
+    else:
+        return
+
+    # A consulta roda no executor; gerar de novo cancela a consulta anterior
+    executor.executar(consultar,
+                      descricao=f"Gerando relatório: {tipo}", chave="relatorio",
+                      ao_concluir=lambda dados: exibir_relatorio(tipo, titulo, dados, exportar),
+                      ao_falhar=lambda e: messagebox.showerror("Erro ao Gerar Relatório", f"Ocorreu um erro: {str(e)}"))
+
+def exibir_relatorio(tipo, titulo, dados, exportar=None):
+    """Mostra no tree_relatorio o resultado de uma consulta (na thread do Tk).
+
+    `dados` é uma lista de dicts ou, nos relatórios paginados, a FontePaginada;
+    `exportar()` gera de novo todas as linhas para a exportação.
+    """
+    global relatorio_atual_dados, relatorio_atual_colunas, relatorio_atual_titulo
+
     # Limpar treeview anterior
     try:
-        tree_relatorio.delete(*tree_relatorio.get_children())
+        tree_relatorio.limpar()
         # Remover colunas antigas
         for col in tree_relatorio["columns"]:
              tree_relatorio.heading(col, text="")
              tree_relatorio.column(col, width=0, minwidth=0, stretch=tk.NO)
         tree_relatorio["columns"] = ()
     except tk.TclError:
-        pass # Ignora erro se widget não existe mais
+        return # Widget não existe mais
 
     relatorio_atual_dados = []
     relatorio_atual_colunas = []
-    relatorio_atual_titulo = f"{tipo} ({data_ini_str} a {data_fim_str})"
-
+    relatorio_atual_titulo = titulo
+
+    if tipo == "Vendas por Período":
+        colunas = ("ID Venda", "Data/Hora", "Usuário", "Pagamento", "Parcelas", "Total")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+            tree_relatorio.column(col, anchor=tk.W, width=120)
+        tree_relatorio.column("Total", anchor=tk.E, width=100)
+        tree_relatorio.column("ID Venda", anchor=tk.CENTER, width=80)
+        tree_relatorio.column("Parcelas", anchor=tk.CENTER, width=60)
+
+        tree_relatorio.tag_configure("total_row", font=("Arial", 10, "bold"))
+        tree_relatorio.definir_fonte(dados) # FontePaginada, com a linha de total ao final
+
+    elif tipo == "Vendas Detalhadas (com Itens)":
+        colunas = ("ID Venda", "Data/Hora", "Usuário", "Pagamento", "Produto", "Qtd", "Preço Unit.", "Subtotal")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+            tree_relatorio.column(col, anchor=tk.W, width=100)
+        tree_relatorio.column("ID Venda", anchor=tk.CENTER, width=70)
+        tree_relatorio.column("Produto", anchor=tk.W, width=200)
+        tree_relatorio.column("Qtd", anchor=tk.CENTER, width=50)
+        tree_relatorio.column("Preço Unit.", anchor=tk.E, width=90)
+        tree_relatorio.column("Subtotal", anchor=tk.E, width=90)
+
+        tree_relatorio.tag_configure("total_row", font=("Arial", 10, "bold"))
+        tree_relatorio.definir_fonte(dados) # FontePaginada, com a linha de total ao final
+
+    elif tipo == "Produtos Mais Vendidos":
+        colunas = ("Produto", "Quantidade Vendida", "Receita")
+        tree_relatorio["columns"] = colunas
+        tree_relatorio.heading("Produto", text="Produto")
+        tree_relatorio.heading("Quantidade Vendida", text="Quantidade Vendida")
+        tree_relatorio.heading("Receita", text="Receita")
+        tree_relatorio.column("Produto", anchor=tk.W, width=300)
+        tree_relatorio.column("Quantidade Vendida", anchor=tk.CENTER, width=150)
+        tree_relatorio.column("Receita", anchor=tk.E, width=120)
+
+        tree_relatorio.definir_fonte(FonteLista(dados, lambda prod: ((prod["nome"], prod["total_vendido"],
+                                                                      f"R$ {prod['receita']:.2f}"), ())))
+
+    elif tipo == "Totais por Forma de Pagamento":
+        colunas = ("Forma de Pagamento", "Vendas", "Total")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+        tree_relatorio.column("Forma de Pagamento", anchor=tk.W, width=200)
+        tree_relatorio.column("Vendas", anchor=tk.CENTER, width=100)
+        tree_relatorio.column("Total", anchor=tk.E, width=120)
+
+        linha_total = (("TOTAL:", sum(t["quantidade_vendas"] for t in dados), f"R$ {sum(t['total'] for t in dados):.2f}"),
+                       ("total_row",))
+        tree_relatorio.tag_configure("total_row", font=("Arial", 10, "bold"))
+        tree_relatorio.definir_fonte(FonteLista(dados, lambda t: ((t["forma_pagamento"], t["quantidade_vendas"],
+                                                                   f"R$ {t['total']:.2f}"), ()), [linha_total]))
+
+    elif tipo == "Posição de Estoque (Data Fim)":
+        colunas = ("Produto", "Estoque", "Custo Unit.", "Valor")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+        tree_relatorio.column("Produto", anchor=tk.W, width=300)
+        tree_relatorio.column("Estoque", anchor=tk.CENTER, width=100)
+        tree_relatorio.column("Custo Unit.", anchor=tk.E, width=100)
+        tree_relatorio.column("Valor", anchor=tk.E, width=120)
+
+        linha_total = (("TOTAL:", sum(p["estoque"] for p in dados), "", f"R$ {sum(p['valor'] for p in dados):.2f}"),
+                       ("total_row",))
+        tree_relatorio.tag_configure("total_row", font=("Arial", 10, "bold"))
+        tree_relatorio.definir_fonte(FonteLista(dados, lambda p: ((p["nome"], p["estoque"], f"R$ {p['preco_custo'] or 0:.2f}",
+                                                                   f"R$ {p['valor']:.2f}"), ()), [linha_total]))
+
+    elif tipo == "Conflitos de Estoque (Vendas Offline)":
+        # Vendas dos caixas sincronizadas com mais quantidade do que havia em estoque
+        colunas = ("Data/Hora", "ID Venda", "Origem", "Produto", "Qtd sem Estoque")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+            tree_relatorio.column(col, anchor=tk.W, width=120)
+        tree_relatorio.column("ID Venda", anchor=tk.CENTER, width=80)
+        tree_relatorio.column("Produto", anchor=tk.W, width=250)
+        tree_relatorio.column("Qtd sem Estoque", anchor=tk.CENTER, width=110)
+
+        tree_relatorio.definir_fonte(FonteLista(dados, lambda c: ((c["data_hora"], c["venda_id"], c["origem"], c["produto"],
+                                                                   c["quantidade"]), ())))
+
+    elif tipo == "Histórico de Preços":
+        colunas = ("Data/Hora", "Produto", "Custo Anterior", "Custo Novo", "Venda Anterior", "Venda Nova", "Motivo", "Usuário")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+            tree_relatorio.column(col, anchor=tk.E, width=90)
+        tree_relatorio.column("Data/Hora", anchor=tk.W, width=130)
+        tree_relatorio.column("Produto", anchor=tk.W, width=200)
+        tree_relatorio.column("Motivo", anchor=tk.W, width=200)
+        tree_relatorio.column("Usuário", anchor=tk.W, width=100)
+
+        tree_relatorio.definir_fonte(FonteLista(dados, lambda h: ((h["data_hora"], h["produto"],
+                                                                   f"{h['preco_custo_anterior'] or 0:.2f}", f"{h['preco_custo_novo'] or 0:.2f}",
+                                                                   f"{h['preco_venda_anterior']:.2f}", f"{h['preco_venda_novo']:.2f}",
+                                                                   h["motivo"], h["usuario"] or ""), ())))
+
+    else: # Movimentações de Estoque
+        colunas = ("Data/Hora", "Produto", "Tipo", "Quantidade", "Motivo", "Usuário")
+        tree_relatorio["columns"] = colunas
+        for col in colunas:
+            tree_relatorio.heading(col, text=col)
+            tree_relatorio.column(col, anchor=tk.W, width=150)
+        tree_relatorio.column("Tipo", anchor=tk.CENTER, width=80)
+        tree_relatorio.column("Quantidade", anchor=tk.CENTER, width=80)
+
+        tree_relatorio.definir_fonte(dados) # FontePaginada
+
+    relatorio_atual_dados = exportar or dados # Salva dados brutos para exportação
+    relatorio_atual_colunas = list(colunas)
+
+def abrir_arquivo(caminho, tipo_arquivo):
+    """Abre o arquivo com o visualizador padrão do sistema."""
     try:
-        if tipo == "Vendas por Período":
-            dados = db.obter_vendas_por_periodo(data_ini, data_fim)
-            colunas = ("ID Venda", "Data/Hora", "Usuário", "Pagamento", "Parcelas", "Total")
-            tree_relatorio["columns"] = colunas
-            for col in colunas:
-                tree_relatorio.heading(col, text=col)
-                tree_relatorio.column(col, anchor=tk.W, width=120)
-            tree_relatorio.column("Total", anchor=tk.E, width=100)
-            tree_relatorio.column("ID Venda", anchor=tk.CENTER, width=80)
-            tree_relatorio.column("Parcelas", anchor=tk.CENTER, width=60)
-
-            total_geral_vendas = 0
-            for venda in dados:
-                # Formatar data/hora se for objeto datetime
-                data_hora_fmt = venda["data_hora"]
-                if isinstance(data_hora_fmt, str):
-                     try:
-                         data_hora_fmt = datetime.datetime.fromisoformat(data_hora_fmt).strftime("%d/%m/%Y %H:%M")
-                     except ValueError:
-                         pass # Mantém como string se não for formato ISO
-                elif isinstance(data_hora_fmt, datetime.datetime):
-                     data_hora_fmt = data_hora_fmt.strftime("%d/%m/%Y %H:%M")
-
-                tree_relatorio.insert("", tk.END, values=(
-                    venda["id"],
-                    data_hora_fmt,
-                    venda["usuario"],
-                    venda["forma_pagamento"],
-                    venda["parcelas"],
-                    f"R$ {venda['total']:.2f}"
-                ))
-                total_geral_vendas += venda["total"]
-            # Adicionar linha de total
-            tree_relatorio.insert("", tk.END, values=("", "", "", "", "TOTAL:", f"R$ {total_geral_vendas:.2f}"), tags=("total_row",))
-            tree_relatorio.tag_configure("total_row", font=("Arial", 10, "bold"))
-            relatorio_atual_dados = dados # Salva dados brutos para exportação
-            relatorio_atual_colunas = list(colunas)
-
-        elif tipo == "Produtos Mais Vendidos":
-            dados = db.obter_produtos_mais_vendidos(data_ini, data_fim)
-            colunas = ("Produto", "Quantidade Vendida")
-            tree_relatorio["columns"] = colunas
-            tree_relatorio.heading("Produto", text="Produto")
-            tree_relatorio.heading("Quantidade Vendida", text="Quantidade Vendida")
-            tree_relatorio.column("Produto", anchor=tk.W, width=300)
-            tree_relatorio.column("Quantidade Vendida", anchor=tk.CENTER, width=150)
-
-            for prod in dados:
-                tree_relatorio.insert("", tk.END, values=(
-                    prod["nome"],
-                    prod["total_vendido"]
-                ))
-            relatorio_atual_dados = dados
-            relatorio_atual_colunas = list(colunas)
-
-        elif tipo == "Movimentações de Estoque":
-            # TODO: Adicionar opção de filtrar por produto?
-            dados = db.obter_movimentacoes_estoque(data_ini, data_fim)
-            colunas = ("Data/Hora", "Produto", "Tipo", "Quantidade", "Motivo", "Usuário")
-            tree_relatorio["columns"] = colunas
-            for col in colunas:
-                tree_relatorio.heading(col, text=col)
-                tree_relatorio.column(col, anchor=tk.W, width=150)
-            tree_relatorio.column("Tipo", anchor=tk.CENTER, width=80)
-            tree_relatorio.column("Quantidade", anchor=tk.CENTER, width=80)
-
-            for mov in dados:
-                # Formatar data/hora
-                data_hora_fmt = mov["data_hora"]
-                if isinstance(data_hora_fmt, str):
-                     try:
-                         data_hora_fmt = datetime.datetime.fromisoformat(data_hora_fmt).strftime("%d/%m/%Y %H:%M")
-                     except ValueError:
-                         pass
-                elif isinstance(data_hora_fmt, datetime.datetime):
-                     data_hora_fmt = data_hora_fmt.strftime("%d/%m/%Y %H:%M")
-
-                tree_relatorio.insert("", tk.END, values=(
-                    data_hora_fmt,
-                    mov["produto"],
-                    mov["tipo"],
-                    mov["quantidade"],
-                    mov["motivo"],
-                    mov["usuario"] if mov["usuario"] else "Sistema"
-                ))
-            relatorio_atual_dados = dados
-            relatorio_atual_colunas = list(colunas)
-
-    except tk.TclError:
-         pass # Ignora erro se widget não existe mais
+        if os.name == "nt": # Windows
+            os.startfile(caminho)
+        elif os.uname().sysname == "Darwin": # macOS
+            os.system(f'open "{caminho}"')
+        else: # Linux
+            os.system(f'xdg-open "{caminho}"')
     except Exception as e:
-        messagebox.showerror("Erro ao Gerar Relatório", f"Ocorreu um erro: {str(e)}")
-        relatorio_atual_dados = []
-        relatorio_atual_colunas = []
-        relatorio_atual_titulo = ""
+        messagebox.showwarning("Erro ao Abrir", f"Não foi possível abrir o {tipo_arquivo} automaticamente: {e}")
 
-def exportar_pdf_interface():
-    if not relatorio_atual_dados:
+def exportar_relatorio(tipo_arquivo, extensao, funcao_exportar):
+    """Pede o arquivo de destino e exporta o relatório atual em segundo plano."""
+    fonte = tree_relatorio.fonte
+    if fonte is None or not fonte.registros:
         messagebox.showwarning("Sem Dados", "Gere um relatório antes de exportar.")
         return
 
     filepath = filedialog.asksaveasfilename(
-        defaultextension=".pdf",
-        filetypes=[("PDF Files", "*.pdf"), ("All Files", "*.*")],
-        title="Salvar Relatório PDF",
-        initialfile=f"relatorio_{combo_relatorio.get().lower().replace(' ', '_')}.pdf"
+        defaultextension=extensao,
+        filetypes=[(f"{tipo_arquivo} Files", f"*{extensao}"), ("All Files", "*.*")],
+        title=f"Salvar Relatório {tipo_arquivo}",
+        initialfile=f"relatorio_{combo_relatorio.get().lower().replace(' ', '_')}{extensao}"
     )
 
     if not filepath:
         return # Usuário cancelou
 
-    try:
-        # Passar os dados brutos para a função de exportação
-        if relatorios.exportar_para_pdf(relatorio_atual_titulo, relatorio_atual_colunas, relatorio_atual_dados, filepath):
+    def concluir(sucesso):
+        if sucesso:
             messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}")
             # Perguntar se quer abrir
-            if messagebox.askyesno("Abrir PDF", "Deseja abrir o arquivo PDF gerado?"):
-                 try:
-                     if os.name == "nt": os.startfile(filepath)
-                     elif os.uname().sysname == "Darwin": os.system(f'open "{filepath}"')
-                     else: os.system(f'xdg-open "{filepath}"')
-                 except Exception as e:
-                     messagebox.showwarning("Erro ao Abrir", f"Não foi possível abrir o PDF automaticamente: {e}")
+            if messagebox.askyesno(f"Abrir {tipo_arquivo}", f"Deseja abrir o arquivo {tipo_arquivo} gerado?"):
+                abrir_arquivo(filepath, tipo_arquivo)
         else:
-            messagebox.showerror("Erro", "Falha ao exportar relatório para PDF.")
-    except Exception as e:
-        messagebox.showerror("Erro Exportação PDF", f"Ocorreu um erro inesperado: {str(e)}")
-
-def exportar_excel_interface():
-    if not relatorio_atual_dados:
-        messagebox.showwarning("Sem Dados", "Gere um relatório antes de exportar.")
-        return
+            messagebox.showerror("Erro", f"Falha ao exportar relatório para {tipo_arquivo}.")
 
-    filepath = filedialog.asksaveasfilename(
-        defaultextension=".xlsx",
-        filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")],
-        title="Salvar Relatório Excel",
-        initialfile=f"relatorio_{combo_relatorio.get().lower().replace(' ', '_')}.xlsx"
-    )
+    # Passar os dados brutos (os atuais, mesmo que outro relatório seja gerado depois)
+    titulo, colunas, dados = relatorio_atual_titulo, relatorio_atual_colunas, relatorio_atual_dados
+    executor.executar(lambda tarefa: funcao_exportar(tarefa, titulo, colunas, dados() if callable(dados) else dados, filepath),
+                      descricao=f"Exportando {tipo_arquivo}",
+                      ao_concluir=concluir,
+                      ao_falhar=lambda e: messagebox.showerror(f"Erro Exportação {tipo_arquivo}", f"Ocorreu um erro inesperado: {str(e)}"))
 
-    if not filepath:
-        return # Usuário cancelou
+def exportar_pdf_interface():
+    exportar_relatorio("PDF", ".pdf",
+                       lambda tarefa, *args: relatorio.exportar_para_pdf(*args, progresso=tarefa.progresso))
 
-    try:
-        # Passar os dados brutos para a função de exportação
-        if relatorios.exportar_para_excel(relatorio_atual_titulo, relatorio_atual_colunas, relatorio_atual_dados, filepath):
-            messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}")
-            # Perguntar se quer abrir
-            if messagebox.askyesno("Abrir Excel", "Deseja abrir o arquivo Excel gerado?"):
-                 try:
-                     if os.name == "nt": os.startfile(filepath)
-                     elif os.uname().sysname == "Darwin": os.system(f'open "{filepath}"')
-                     else: os.system(f'xdg-open "{filepath}"')
-                 except Exception as e:
-                     messagebox.showwarning("Erro ao Abrir", f"Não foi possível abrir o Excel automaticamente: {e}")
-        else:
-            messagebox.showerror("Erro", "Falha ao exportar relatório para Excel.")
-    except Exception as e:
-        messagebox.showerror("Erro Exportação Excel", f"Ocorreu um erro inesperado: {str(e)}")
+def exportar_excel_interface():
+    exportar_relatorio("Excel", ".xlsx",
+                       lambda tarefa, *args: relatorio.exportar_para_excel(*args, progresso=tarefa.progresso))
 
 # --- Funções de Permissão --- #
 def aplicar_permissoes(notebook_abas, tipo_usuario):
@@ -1051,8 +1502,15 @@ def aplicar_permissoes(notebook_abas, tipo_usuario):
 
 # --- Inicialização --- #
 if __name__ == "__main__":
-    # Criar banco e tabelas se não existirem
-    db.criar_tabelas()
+    if cliente.SERVIDOR:
+        try:
+            db.saude() # O banco é criado e migrado pelo servidor
+        except cliente.ErroServidor as e:
+            print(f"Não foi possível conectar ao servidor da loja: {e}")
+            raise SystemExit(1)
+    else:
+        # Criar banco e tabelas se não existirem
+        db.criar_tabelas()
 
     # Janela de Login
     janela_login = tk.Tk()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Tarefas de manutenção do banco da loja, executadas pelo terminal. Uso:
+
+    python manutencao.py resumos
+    python manutencao.py resumos --inicio 2024-01-01 --fim 2024-12-31
+    python manutencao.py estoque
+    python manutencao.py estoque --desde 2024-03-01
+    python manutencao.py recibos --inicio 2024-01-01 --fim 2024-03-31 [--formato texto] [--processos 4]
+    python manutencao.py sincronizar --diario caixa2.jsonl
+    python manutencao.py importar --arquivo catalogo_fornecedor.xlsx
+    python manutencao.py exportar --arquivo produtos.csv
+    python manutencao.py precos --fornecedor "Distribuidora X" --regra custo+8% --regra markup=1.8 --regra final=0.90 [--aplicar]
+"""
+import argparse
+import re
+import time
+
+import database as db
+import diario
+import importacao
+import recibo
+
+def validar_data(texto):
+    try:
+        time.strptime(texto, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida: {texto} (use AAAA-MM-DD)")
+    return texto
+
+# --- Comandos ---
+
+def cmd_resumos(args):
+    """Reconstrói os resumos diários/mensais de vendas a partir das vendas gravadas."""
+    periodo = f"{args.inicio or 'início'} a {args.fim or 'hoje'}"
+    print(f"Reconstruindo resumos de vendas ({periodo})...")
+    inicio = time.perf_counter()
+    linhas = db.reconstruir_resumos_vendas(args.inicio, args.fim)
+    print(f"{linhas} linhas de resumo por produto/dia em {time.perf_counter() - inicio:.1f} s")
+
+def cmd_estoque(args):
+    """Fecha os saldos diários de estoque usados por estoque_em() e pela posição de estoque."""
+    refazer = f" (refazendo desde {args.desde})" if args.desde else ""
+    print(f"Fechando saldos de estoque até {args.ate or 'ontem'}{refazer}...")
+    inicio = time.perf_counter()
+    saldos = db.fechar_saldos_estoque(args.ate, args.desde)
+    print(f"{saldos} saldos diários gravados em {time.perf_counter() - inicio:.1f} s")
+
+def cmd_recibos(args):
+    """Gera de novo os recibos das vendas do período, pulando os que já existem."""
+    print(f"Gerando recibos ({args.formato}) das vendas de {args.inicio} a {args.fim}...")
+    inicio = time.perf_counter()
+    proximo_aviso = 1000
+
+    def progresso(gerados, pulados):
+        nonlocal proximo_aviso
+        if gerados + pulados >= proximo_aviso:
+            print(f"  {gerados} gerados, {pulados} já existiam")
+            proximo_aviso += 1000
+
+    vendas = db.iterar_vendas_com_itens(args.inicio, args.fim)
+    gerados, pulados, falhas = recibo.regerar_recibos(vendas, args.formato, args.diretorio, args.processos,
+                                                      args.substituir, progresso)
+    print(f"{gerados} recibos gerados, {pulados} já existiam, {len(falhas)} falhas "
+          f"em {time.perf_counter() - inicio:.1f} s")
+    for venda_id, erro in falhas[:20]:
+        print(f"  Venda #{venda_id}: {erro}")
+
+def cmd_sincronizar(args):
+    """Importa as vendas pendentes do diário de um caixa (ex.: copiado de um caixa que não volta a ligar).
+
+    O caixa dono do diário não pode estar aberto ao mesmo tempo. Vendas já
+    importadas são ignoradas, então rodar de novo é seguro.
+    """
+    vendas = diario.DiarioVendas(args.diario)
+    print(f"Sincronizando {vendas.pendentes} venda(s) do diário {args.diario}...")
+    inicio = time.perf_counter()
+    sincronizador = diario.SincronizadorVendas(vendas, db)
+    try:
+        sincronizador.sincronizar()
+    finally:
+        vendas.fechar()
+    estatisticas = sincronizador.estatisticas
+    print(f"{estatisticas['sincronizadas']} importadas, {estatisticas['duplicadas']} já estavam no banco, "
+          f"{estatisticas['conflitos']} conflitos de estoque, {estatisticas['rejeitadas']} rejeitadas "
+          f"em {time.perf_counter() - inicio:.1f} s")
+    if estatisticas["rejeitadas"]:
+        print(f"Vendas rejeitadas gravadas em {args.diario}.rejeitadas")
+
+def cmd_importar(args):
+    """Cadastra/atualiza produtos a partir de uma planilha CSV ou XLSX."""
+    print(f"Importando produtos de {args.arquivo} (lotes de {args.lote})...")
+    inicio = time.perf_counter()
+
+    def progresso(linhas, total, mensagem):
+        print(f"  {linhas} linhas")
+
+    resumo = importacao.importar_catalogo(args.arquivo, usuario_id=args.usuario, lote=args.lote,
+                                          progresso=progresso, codificacao=args.codificacao)
+    print(f"{resumo['linhas']} linhas: {resumo['novos']} novos, {resumo['atualizados']} atualizados, "
+          f"{resumo['inalterados']} sem alteração, {resumo['rejeitados']} rejeitadas "
+          f"em {time.perf_counter() - inicio:.1f} s")
+    if resumo["relatorio_rejeitados"]:
+        print(f"Linhas rejeitadas e motivos em {resumo['relatorio_rejeitados']}")
+
+def cmd_exportar(args):
+    """Grava o catálogo de produtos numa planilha CSV ou XLSX (reimportável com `importar`)."""
+    inicio = time.perf_counter()
+    total = importacao.exportar_catalogo(args.arquivo)
+    print(f"{total} produtos exportados para {args.arquivo} em {time.perf_counter() - inicio:.1f} s")
+
+def ler_regra(texto):
+    """Converte "custo+8%", "venda-5%", "markup=1.8" ou "final=0.90" numa regra de reajuste do database.py."""
+    formatos = ((r"custo([+-][\d.,]+)%", "percentual_custo"), (r"venda([+-][\d.,]+)%", "percentual_venda"),
+                (r"markup=([\d.,]+)", "markup"), (r"final=([\d.,]+)", "terminacao"))
+    for padrao, tipo in formatos:
+        encontrado = re.fullmatch(padrao, texto.replace(" ", "").lower())
+        if encontrado:
+            return {"tipo": tipo, "valor": float(encontrado.group(1).replace(",", "."))}
+    raise argparse.ArgumentTypeError(f"regra inválida: {texto} (use custo+8%, venda-5%, markup=1.8 ou final=0.90)")
+
+def cmd_precos(args):
+    """Mostra (ou, com --aplicar, grava) o reajuste de preços dos produtos de um fornecedor ou do catálogo."""
+    alvo = f"do fornecedor {args.fornecedor}" if args.fornecedor is not None else "de todos os produtos"
+    regras = db.descrever_regras(args.regra)
+    if not args.aplicar:
+        alteracoes = db.simular_reajuste(args.regra, args.fornecedor)
+        print(f"Reajuste {alvo} ({regras}): {len(alteracoes)} produto(s) mudariam de preço")
+        for produto in alteracoes[:20]:
+            print(f"  {produto['codigo_barras']:<15} {produto['nome'][:40]:<40} "
+                  f"custo {produto['preco_custo'] or 0:>9.2f} -> {produto['novo_preco_custo'] or 0:>9.2f}  "
+                  f"venda {produto['preco_venda']:>9.2f} -> {produto['novo_preco_venda']:>9.2f}")
+        if len(alteracoes) > 20:
+            print(f"  ... e mais {len(alteracoes) - 20}")
+        print("Nada foi gravado; use --aplicar para gravar os novos preços.")
+        return
+    inicio = time.perf_counter()
+    alterados = db.aplicar_reajuste(args.regra, args.fornecedor, usuario_id=args.usuario, motivo=args.motivo)
+    print(f"Reajuste {alvo} ({regras}): {alterados} produto(s) alterados em {time.perf_counter() - inicio:.2f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco da loja")
+    parser.add_argument("--banco", help="Arquivo do banco (padrão: o mesmo do sistema)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_resumos = sub.add_parser("resumos", help="Reconstrói os resumos de vendas (todo o histórico ou um período)")
+    p_resumos.add_argument("--inicio", type=validar_data, help="AAAA-MM-DD")
+    p_resumos.add_argument("--fim", type=validar_data, help="AAAA-MM-DD")
+    p_resumos.set_defaults(func=cmd_resumos)
+
+    p_estoque = sub.add_parser("estoque", help="Fecha os saldos diários de estoque (rodar diariamente)")
+    p_estoque.add_argument("--ate", type=validar_data, help="Último dia a fechar, AAAA-MM-DD (padrão: ontem)")
+    p_estoque.add_argument("--desde", type=validar_data,
+                           help="Refaz os fechamentos a partir deste dia (movimentações com data retroativa)")
+    p_estoque.set_defaults(func=cmd_estoque)
+
+    p_recibos = sub.add_parser("recibos", help="Gera de novo os recibos das vendas de um período")
+    p_recibos.add_argument("--inicio", type=validar_data, required=True, help="AAAA-MM-DD")
+    p_recibos.add_argument("--fim", type=validar_data, required=True, help="AAAA-MM-DD")
+    p_recibos.add_argument("--formato", choices=recibo.FORMATOS_RECIBO, default=recibo.FORMATO_RECIBO)
+    p_recibos.add_argument("--diretorio", help="Pasta de destino (padrão: recibos/)")
+    p_recibos.add_argument("--processos", type=int, help="Processos em paralelo (padrão: um por núcleo)")
+    p_recibos.add_argument("--substituir", action="store_true", help="Gera também os recibos que já existem")
+    p_recibos.set_defaults(func=cmd_recibos)
+
+    p_sincronizar = sub.add_parser("sincronizar", help="Importa as vendas pendentes do diário de um caixa")
+    p_sincronizar.add_argument("--diario", required=True, help="Arquivo do diário (LOJA_DIARIO do caixa)")
+    p_sincronizar.set_defaults(func=cmd_sincronizar)
+
+    p_importar = sub.add_parser("importar", help="Cadastra/atualiza produtos a partir de uma planilha (.csv ou .xlsx)")
+    p_importar.add_argument("--arquivo", required=True)
+    p_importar.add_argument("--lote", type=int, default=db.LOTE_IMPORTACAO, help="Produtos por transação")
+    p_importar.add_argument("--usuario", type=int, help="Id do usuário registrado nas movimentações de estoque inicial")
+    p_importar.add_argument("--codificacao", default=importacao.CODIFICACAO_CSV,
+                            help="Codificação do CSV (ex.: latin-1 para CSV antigo do Excel)")
+    p_importar.set_defaults(func=cmd_importar)
+
+    p_exportar = sub.add_parser("exportar", help="Exporta o catálogo de produtos para uma planilha (.csv ou .xlsx)")
+    p_exportar.add_argument("--arquivo", required=True)
+    p_exportar.set_defaults(func=cmd_exportar)
+
+    p_precos = sub.add_parser("precos", help="Reajusta preços por fornecedor (mostra a prévia sem --aplicar)")
+    p_precos.add_argument("--fornecedor", help="Só os produtos deste fornecedor (padrão: todos)")
+    p_precos.add_argument("--regra", type=ler_regra, action="append", required=True,
+                          help="custo+8%%, venda-5%%, markup=1.8 ou final=0.90; aplicadas na ordem em que aparecem")
+    p_precos.add_argument("--aplicar", action="store_true", help="Grava os novos preços")
+    p_precos.add_argument("--usuario", type=int, help="Id do usuário registrado no histórico de preços")
+    p_precos.add_argument("--motivo", help="Texto do histórico de preços (padrão: as regras aplicadas)")
+    p_precos.set_defaults(func=cmd_precos)
+
+    args = parser.parse_args()
+    if args.banco:
+        db.configurar_banco(args.banco)
+    db.criar_tabelas()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
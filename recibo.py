@@ -1,11 +1,41 @@
 # -*- coding: utf-8 -*-
+import fpdf
 from fpdf import FPDF
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import datetime
+import itertools
+import multiprocessing
 import os
+import queue
+import threading
+
+# Formato dos recibos: "pdf" (padrão), "texto" (.txt para impressora térmica comum) ou
+# "escpos" (comandos ESC/POS, sem passar pelo PDF). Ative com LOJA_RECIBO_FORMATO.
+FORMATOS_RECIBO = ("pdf", "texto", "escpos")
+FORMATO_RECIBO = os.environ.get("LOJA_RECIBO_FORMATO", "pdf")
+# Dispositivo da impressora térmica (ex.: /dev/usb/lp0); recibos ESC/POS também são enviados para ele
+IMPRESSORA_TERMICA = os.environ.get("LOJA_IMPRESSORA")
+LARGURA_TERMICA = 48 # Colunas de uma bobina de 80 mm (use 32 para 58 mm)
+EXTENSOES = {"pdf": ".pdf", "texto": ".txt", "escpos": ".bin"}
+RECIBOS_POR_LOTE = 200 # Recibos que cada processo gera por vez na regeneração em lote
+DIRETORIO_RECIBOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recibos") # Pasta recibos no mesmo nível do recibo.py
+
+# Larguras das colunas da tabela de itens do PDF (mm)
+W_PRODUTO = 100
+W_QTD = 25
+W_PRECO = 30
+W_SUBTOTAL = 35
+LINE_HEIGHT = 10
 
 class PDFRecibo(FPDF):
-    def __init__(self, orientation="P", unit="mm", format="A4"):
+    def __init__(self, orientation="P", unit="mm", format="A4", modelo=None):
         super().__init__(orientation, unit, format)
+        self.modelo = modelo # ModeloRecibo com os trechos fixos já desenhados (opcional)
+        # Registra as fontes sempre na mesma ordem: os trechos do modelo se referem
+        # a elas por número (/F1, /F2...)
+        self.set_font("Arial", "B")
+        self.set_font("Arial", "I")
         # Usar fonte padrão Arial
         self.set_font("Arial", size=10)
         # FPDF com fontes padrão geralmente lida melhor com Latin-1.
@@ -18,112 +48,389 @@ class PDFRecibo(FPDF):
         else:
             return str(text).encode("latin-1", "replace").decode("latin-1")
 
-    def header(self):
+    def _fonte(self, estilo, tamanho):
         if self.supports_utf8:
-            self.set_font(self.font_name, "B", 15)
+            self.set_font(self.font_name, estilo, tamanho)
+        else:
+            self.set_font("Arial", estilo, tamanho)
+
+    def header(self):
+        if self.modelo:
+            self.modelo.aplicar(self, "titulo", self._desenhar_titulo)
         else:
-            self.set_font("Arial", "B", 15)
-        self.cell(0, 10, self._encode_str("Recibo de Venda"), new_x="LMARGIN", new_y="NEXT", align="C")
+            self._desenhar_titulo()
+
+    def _desenhar_titulo(self):
+        self._fonte("B", 15)
+        self.cell(0, 10, self._encode_str("Recibo de Venda"), 0, 1, "C")
         self.ln(10)
 
     def footer(self):
-        self.set_y(-15)
-        if self.supports_utf8:
-            self.set_font(self.font_name, "I", 8)
+        if self.modelo:
+            self.modelo.aplicar(self, ("rodape", self.page_no()), self._desenhar_rodape)
         else:
-            self.set_font("Arial", "I", 8)
+            self._desenhar_rodape()
+
+    def _desenhar_rodape(self):
+        self.set_y(-15)
+        self._fonte("I", 8)
         pagina_str = f"Página {self.page_no()}/{{nb}}"
-        self.cell(0, 10, self._encode_str(pagina_str), align="C")
+        self.cell(0, 10, self._encode_str(pagina_str), 0, 0, "C")
+
+    def cabecalho_itens(self):
+        if self.modelo:
+            self.modelo.aplicar(self, ("itens", round(self.y, 2)), self._desenhar_cabecalho_itens)
+        else:
+            self._desenhar_cabecalho_itens()
+
+    def _desenhar_cabecalho_itens(self):
+        self._fonte("B", 12)
+        self.cell(W_PRODUTO, LINE_HEIGHT, self._encode_str("Produto"), 1, 0, "C")
+        self.cell(W_QTD, LINE_HEIGHT, self._encode_str("Qtd"), 1, 0, "C")
+        self.cell(W_PRECO, LINE_HEIGHT, self._encode_str("Preço Unit."), 1, 0, "C")
+        self.cell(W_SUBTOTAL, LINE_HEIGHT, self._encode_str("Subtotal"), 1, 1, "C")
+
+# --- Modelo pré-montado ---
+
+class ModeloRecibo:
+    """Trechos fixos do recibo (título, cabeçalho da tabela, rodapé) desenhados uma vez.
+
+    Na primeira vez que um trecho é pedido, ele é desenhado normalmente e o conteúdo
+    gerado na página (operadores PDF) é guardado junto com o estado do FPDF ao final
+    (posição, fonte, cores e espessura de linha). Nos recibos seguintes o trecho é só
+    copiado para a página. Cada trecho é guardado pela posição em que foi desenhado e
+    pelo estado gráfico no início (o FPDF só emite cor e espessura quando mudam), então
+    sai idêntico.
+
+    Usa atributos internos do FPDF 1.7.2, a versão fixada no requirements.txt; com
+    outra versão os trechos são sempre desenhados.
+    """
+
+    VERSAO_FPDF = "1.7.2"
+    ESTADO = ("x", "y", "lasth", "font_family", "font_style", "font_size_pt", "font_size", "underline")
+    GRAFICO = ("draw_color", "fill_color", "text_color", "color_flag", "line_width", "ws")
 
-def gerar_recibo(venda_id, dados_venda, itens_venda):
-    """Gera um recibo de venda em formato PDF."""
-    pdf = PDFRecibo()
+    def __init__(self):
+        self._trechos = {} # chave -> (conteúdo, estado ao final)
+        self._trava = threading.Lock()
+
+    def aplicar(self, pdf, chave, desenhar):
+        if fpdf.FPDF_VERSION != self.VERSAO_FPDF:
+            desenhar()
+            return
+        pdf.font_family = "" # O trecho sempre seleciona a própria fonte
+        chave = (chave, tuple(getattr(pdf, nome) for nome in self.GRAFICO))
+        trecho = self._trechos.get(chave)
+        if trecho is not None:
+            conteudo, estado = trecho
+            pdf.pages[pdf.page] += conteudo
+            pdf.__dict__.update(estado)
+            if pdf.font_family:
+                pdf.current_font = pdf.fonts[pdf.font_family + pdf.font_style]
+            return
+        pagina, inicio = pdf.page, len(pdf.pages[pdf.page])
+        desenhar()
+        if pdf.page == pagina: # Trechos que quebraram a página não são reaproveitáveis
+            estado = {nome: getattr(pdf, nome) for nome in self.ESTADO + self.GRAFICO}
+            with self._trava:
+                self._trechos.setdefault(chave, (pdf.pages[pagina][inicio:], estado))
+
+    def preparar(self):
+        """Monta os trechos de um recibo típico (chamado antes da primeira venda)."""
+        _montar_pdf(self, 0, {"forma_pagamento": "Dinheiro"}, [])
+        _montar_pdf(self, 0, {"forma_pagamento": "Crédito"}, [])
+
+_modelo = None
+_trava_modelo = threading.Lock()
+
+def modelo_recibo():
+    """ModeloRecibo compartilhado pelo processo, preparado na primeira chamada."""
+    global _modelo
+    with _trava_modelo:
+        if _modelo is None:
+            _modelo = ModeloRecibo()
+            _modelo.preparar()
+    return _modelo
+
+# --- Conteúdo do recibo ---
+
+def _linhas_info(venda_id, dados_venda):
+    data_hora = dados_venda.get("data_hora", "N/A")
+    data_hora_str = data_hora.strftime("%d/%m/%Y %H:%M:%S") if isinstance(data_hora, datetime.datetime) else data_hora
+    linhas = [f"Venda ID: {venda_id}",
+              f"Data e Hora: {data_hora_str}",
+              f"Vendedor: {dados_venda.get('usuario_nome', 'N/A')}",
+              f"Forma de Pagamento: {dados_venda.get('forma_pagamento', 'N/A')}"]
+    if dados_venda.get("forma_pagamento") == "Crédito":
+        linhas.append(f"Parcelas: {dados_venda.get('parcelas', 1)}")
+    return linhas
+
+def _itens(itens_venda):
+    """(nome, quantidade, preço unitário, subtotal) de cada item."""
+    for item in itens_venda:
+        quantidade = item.get("quantidade", 0)
+        preco_unitario = item.get("preco", 0.0)
+        yield item.get("nome", "Produto Desconhecido"), quantidade, preco_unitario, quantidade * preco_unitario
+
+def _montar_pdf(modelo, venda_id, dados_venda, itens_venda):
+    pdf = PDFRecibo(modelo=modelo)
     pdf.alias_nb_pages()
     pdf.add_page()
 
-    if pdf.supports_utf8:
-        pdf.set_font(pdf.font_name, "", 12)
-    else:
-        pdf.set_font("Arial", "", 12)
-
     # Informações da Venda
-    pdf.cell(0, 10, pdf._encode_str(f"Venda ID: {venda_id}"), new_x="LMARGIN", new_y="NEXT")
-    data_hora_str = dados_venda["data_hora"].strftime("%d/%m/%Y %H:%M:%S") if isinstance(dados_venda.get("data_hora"), datetime.datetime) else dados_venda.get("data_hora", "N/A")
-    pdf.cell(0, 10, pdf._encode_str(f"Data e Hora: {data_hora_str}"), new_x="LMARGIN", new_y="NEXT")
-    pdf.cell(0, 10, pdf._encode_str(f"Vendedor: {dados_venda.get('usuario_nome', 'N/A')}"), new_x="LMARGIN", new_y="NEXT")
-    pdf.cell(0, 10, pdf._encode_str(f"Forma de Pagamento: {dados_venda.get('forma_pagamento', 'N/A')}"), new_x="LMARGIN", new_y="NEXT")
-    if dados_venda.get("forma_pagamento") == "Crédito":
-        pdf.cell(0, 10, pdf._encode_str(f"Parcelas: {dados_venda.get('parcelas', 1)}"), new_x="LMARGIN", new_y="NEXT")
+    pdf._fonte("", 12)
+    for linha in _linhas_info(venda_id, dados_venda):
+        pdf.cell(0, 10, pdf._encode_str(linha), 0, 1)
     pdf.ln(5)
 
     # Itens da Venda
-    if pdf.supports_utf8:
-        pdf.set_font(pdf.font_name, "B", 12)
-    else:
-        pdf.set_font("Arial", "B", 12)
-
-    # Larguras das colunas (ajustar conforme necessário)
-    w_produto = 100
-    w_qtd = 25
-    w_preco = 30
-    w_subtotal = 35
-    line_height = 10
-
-    pdf.cell(w_produto, line_height, pdf._encode_str("Produto"), border=1, align="C")
-    pdf.cell(w_qtd, line_height, pdf._encode_str("Qtd"), border=1, align="C")
-    pdf.cell(w_preco, line_height, pdf._encode_str("Preço Unit."), border=1, align="C")
-    pdf.cell(w_subtotal, line_height, pdf._encode_str("Subtotal"), border=1, new_x="LMARGIN", new_y="NEXT", align="C")
-
-    if pdf.supports_utf8:
-        pdf.set_font(pdf.font_name, "", 10)
-    else:
-        pdf.set_font("Arial", "", 10)
-
+    pdf.cabecalho_itens()
+    pdf._fonte("", 10)
     total_geral = 0
-    for item in itens_venda:
-        nome_produto = item.get("nome", "Produto Desconhecido")
-        quantidade = item.get("quantidade", 0)
-        preco_unitario = item.get("preco", 0.0)
-        subtotal = quantidade * preco_unitario
+    for nome_produto, quantidade, preco_unitario, subtotal in _itens(itens_venda):
         total_geral += subtotal
-
-        # Tratar nomes longos (MultiCell pode ser melhor para quebra automática)
-        # Simplesmente truncar por enquanto
+        # Nomes longos são truncados (MultiCell quebraria a linha da tabela)
         nome_produto_str = pdf._encode_str(nome_produto)
-        if pdf.get_string_width(nome_produto_str) > w_produto - 2:
-             while pdf.get_string_width(nome_produto_str + '...') > w_produto - 2 and len(nome_produto_str) > 0:
-                 nome_produto_str = nome_produto_str[:-1]
-             nome_produto_str += '...'
+        if pdf.get_string_width(nome_produto_str) > W_PRODUTO - 2:
+            while pdf.get_string_width(nome_produto_str + '...') > W_PRODUTO - 2 and len(nome_produto_str) > 0:
+                nome_produto_str = nome_produto_str[:-1]
+            nome_produto_str += '...'
 
-        pdf.cell(w_produto, line_height, nome_produto_str, border=1)
-        pdf.cell(w_qtd, line_height, pdf._encode_str(str(quantidade)), border=1, align="C")
-        pdf.cell(w_preco, line_height, pdf._encode_str(f"R$ {preco_unitario:.2f}"), border=1, align="R")
-        pdf.cell(w_subtotal, line_height, pdf._encode_str(f"R$ {subtotal:.2f}"), border=1, new_x="LMARGIN", new_y="NEXT", align="R")
+        pdf.cell(W_PRODUTO, LINE_HEIGHT, nome_produto_str, 1)
+        pdf.cell(W_QTD, LINE_HEIGHT, pdf._encode_str(str(quantidade)), 1, 0, "C")
+        pdf.cell(W_PRECO, LINE_HEIGHT, pdf._encode_str(f"R$ {preco_unitario:.2f}"), 1, 0, "R")
+        pdf.cell(W_SUBTOTAL, LINE_HEIGHT, pdf._encode_str(f"R$ {subtotal:.2f}"), 1, 1, "R")
 
     # Total Geral
-    if pdf.supports_utf8:
-        pdf.set_font(pdf.font_name, "B", 12)
+    pdf._fonte("B", 12)
+    pdf.cell(W_PRODUTO + W_QTD + W_PRECO, LINE_HEIGHT, pdf._encode_str("Total Geral:"), 0, 0, "R")
+    pdf.cell(W_SUBTOTAL, LINE_HEIGHT, pdf._encode_str(f"R$ {total_geral:.2f}"), 1, 1, "R")
+    return pdf
+
+def gerar_recibo_texto(venda_id, dados_venda, itens_venda, largura=LARGURA_TERMICA):
+    """Recibo em texto puro com `largura` colunas, para impressoras térmicas."""
+    separador = "-" * largura
+    linhas = ["Recibo de Venda".upper().center(largura).rstrip(), separador]
+    linhas.extend(linha[:largura] for linha in _linhas_info(venda_id, dados_venda))
+    linhas.append(separador)
+    total_geral = 0
+    for nome_produto, quantidade, preco_unitario, subtotal in _itens(itens_venda):
+        total_geral += subtotal
+        nome_produto = str(nome_produto)
+        if len(nome_produto) > largura:
+            nome_produto = nome_produto[:largura - 3] + "..."
+        valor = f"R$ {subtotal:.2f}"
+        linhas.append(nome_produto)
+        linhas.append(f"  {quantidade} x R$ {preco_unitario:.2f}".ljust(largura - len(valor)) + valor)
+    linhas.append(separador)
+    total = f"R$ {total_geral:.2f}"
+    linhas.append("TOTAL GERAL".ljust(largura - len(total)) + total)
+    return "\n".join(linhas) + "\n"
+
+# Comandos ESC/POS
+ESC_INICIAR = b"\x1b@"
+ESC_PAGINA_CODIGO = b"\x1bt\x03" # Tabela PC860 (português)
+ESC_CENTRO, ESC_ESQUERDA = b"\x1ba\x01", b"\x1ba\x00"
+ESC_DESTAQUE, ESC_NORMAL = b"\x1b!\x30", b"\x1b!\x00" # Altura e largura duplas
+ESC_NEGRITO, ESC_SEM_NEGRITO = b"\x1bE\x01", b"\x1bE\x00"
+ESC_AVANCAR_E_CORTAR = b"\x1bd\x04\x1dV\x01" # Avança 4 linhas e faz corte parcial
+
+def gerar_recibo_escpos(venda_id, dados_venda, itens_venda, largura=LARGURA_TERMICA):
+    """Recibo em bytes ESC/POS, prontos para enviar à impressora térmica."""
+    texto = gerar_recibo_texto(venda_id, dados_venda, itens_venda, largura)
+    titulo, corpo = texto.split("\n", 1)
+    corpo, total = corpo.rstrip("\n").rsplit("\n", 1)
+    codificar = lambda s: s.encode("cp860", "replace")
+    return b"".join([
+        ESC_INICIAR, ESC_PAGINA_CODIGO,
+        ESC_CENTRO, ESC_DESTAQUE, codificar(titulo.strip()), b"\n", ESC_NORMAL, ESC_ESQUERDA,
+        codificar(corpo), b"\n",
+        ESC_NEGRITO, codificar(total), b"\n", ESC_SEM_NEGRITO,
+        ESC_AVANCAR_E_CORTAR,
+    ])
+
+def caminho_recibo(venda_id, formato=None, diretorio=None):
+    """Arquivo do recibo da venda no formato dado (dentro de recibos/ por padrão)."""
+    return os.path.join(diretorio or DIRETORIO_RECIBOS, f"recibo_venda_{venda_id}{EXTENSOES[formato or FORMATO_RECIBO]}")
+
+def _gravar_recibo(caminho, formato, venda_id, dados_venda, itens_venda, modelo=None):
+    """Grava o recibo em `caminho`; retorna os bytes ESC/POS (ou None nos outros formatos)."""
+    if formato == "pdf":
+        _montar_pdf(modelo or modelo_recibo(), venda_id, dados_venda, itens_venda).output(caminho, "F")
+    elif formato == "texto":
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            arquivo.write(gerar_recibo_texto(venda_id, dados_venda, itens_venda))
     else:
-        pdf.set_font("Arial", "B", 12)
-    pdf.cell(w_produto + w_qtd + w_preco, line_height, pdf._encode_str("Total Geral:"), border=0, align="R")
-    pdf.cell(w_subtotal, line_height, pdf._encode_str(f"R$ {total_geral:.2f}"), border=1, new_x="LMARGIN", new_y="NEXT", align="R")
+        dados = gerar_recibo_escpos(venda_id, dados_venda, itens_venda)
+        with open(caminho, "wb") as arquivo:
+            arquivo.write(dados)
+        return dados
+    return None
+
+def gerar_recibo(venda_id, dados_venda, itens_venda, formato=None, diretorio=None):
+    """Gera o recibo de venda em `formato` (padrão: FORMATO_RECIBO) e retorna o caminho do arquivo.
 
-    # Salvar PDF
+    Recibos ESC/POS também são enviados para IMPRESSORA_TERMICA, se configurada.
+    Retorna None em caso de erro.
+    """
+    formato = formato or FORMATO_RECIBO
+    if formato not in FORMATOS_RECIBO:
+        print(f"Formato de recibo desconhecido: {formato}")
+        return None
     try:
-        # Garante que o diretório de recibos exista (relativo ao script main.py)
-        # Idealmente, o caminho base seria passado como argumento ou obtido de forma mais robusta
-        script_dir = os.path.dirname(os.path.abspath(__file__)) # Diretório do recibo.py
-        diretorio_recibos = os.path.join(script_dir, "recibos") # Pasta recibos no mesmo nível
-        os.makedirs(diretorio_recibos, exist_ok=True)
-        caminho_completo = os.path.join(diretorio_recibos, f"recibo_venda_{venda_id}.pdf")
-
-        pdf.output(caminho_completo, "F")
+        os.makedirs(diretorio or DIRETORIO_RECIBOS, exist_ok=True)
+        caminho_completo = caminho_recibo(venda_id, formato, diretorio)
+        dados = _gravar_recibo(caminho_completo, formato, venda_id, dados_venda, itens_venda)
+        if dados and IMPRESSORA_TERMICA:
+            with open(IMPRESSORA_TERMICA, "wb") as impressora:
+                impressora.write(dados)
         print(f"Recibo gerado: {caminho_completo}")
         return caminho_completo
     except Exception as e:
-        print(f"Erro ao gerar PDF do recibo: {e}")
+        print(f"Erro ao gerar recibo ({formato}): {e}")
         return None
 
+# --- Fila de Recibos ---
+
+class FilaRecibos:
+    """Gera os recibos numa thread própria, um de cada vez e na ordem das vendas.
+
+    enfileirar() retorna na hora, então o caixa já pode atender o próximo cliente.
+    O modelo do PDF é preparado pela thread assim que ela inicia. Os recibos prontos
+    ficam em uma fila de saída lida com recolher() — a interface consulta essa fila
+    com raiz.after() enquanto `pendentes` > 0, como o ExecutorTarefas.
+    """
+
+    def __init__(self, formato=None):
+        self.formato = formato or FORMATO_RECIBO
+        self.pendentes = 0 # Alterado só por quem enfileira/recolhe (a thread da interface)
+        self._entrada = queue.Queue()
+        self._saida = queue.Queue()
+        self._thread = threading.Thread(target=self._trabalhar, name="recibos", daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, venda_id, dados_venda, itens_venda):
+        # Copia os itens: o carrinho é limpo logo depois
+        self._entrada.put((venda_id, dict(dados_venda), [dict(item) for item in itens_venda]))
+        self.pendentes += 1
+
+    def recolher(self):
+        """Lista de (venda_id, caminho ou None) dos recibos concluídos desde a última chamada."""
+        prontos = []
+        while True:
+            try:
+                prontos.append(self._saida.get_nowait())
+            except queue.Empty:
+                break
+        self.pendentes -= len(prontos)
+        return prontos
+
+    def encerrar(self, espera=10):
+        """Termina os recibos já enfileirados (até `espera` segundos) e para a thread."""
+        self._entrada.put(None)
+        self._thread.join(espera)
+
+    def _trabalhar(self):
+        if self.formato == "pdf":
+            try:
+                modelo_recibo()
+            except Exception as e:
+                print(f"Erro ao preparar o modelo do recibo: {e}")
+        while True:
+            pedido = self._entrada.get()
+            if pedido is None:
+                break
+            venda_id, dados_venda, itens_venda = pedido
+            self._saida.put((venda_id, gerar_recibo(venda_id, dados_venda, itens_venda, self.formato)))
+
+# --- Regeneração em Lote ---
+
+def _data_hora(valor):
+    """vendas.data_hora (UTC, do CURRENT_TIMESTAMP) na hora local, como no recibo impresso na venda."""
+    try:
+        utc = datetime.datetime.fromisoformat(valor).replace(tzinfo=datetime.timezone.utc)
+    except (TypeError, ValueError):
+        return valor
+    return utc.astimezone().replace(tzinfo=None)
+
+def _gerar_lote_recibos(pedidos, formato, diretorio):
+    """Gera, num processo do pool, os recibos de um lote de (venda, itens) do banco.
+
+    Cada arquivo é escrito com outro nome e renomeado no fim, então um recibo
+    interrompido no meio não é tomado como existente na próxima execução.
+    Retorna (gerados, [(venda_id, erro), ...]).
+    """
+    modelo = modelo_recibo() if formato == "pdf" else None
+    gerados, falhas = 0, []
+    for (venda_id, data_hora, usuario, forma_pagamento, parcelas, _total), itens in pedidos:
+        dados_venda = {"data_hora": _data_hora(data_hora), "usuario_nome": usuario,
+                       "forma_pagamento": forma_pagamento, "parcelas": parcelas}
+        itens_venda = [{"nome": nome, "quantidade": quantidade, "preco": preco} for nome, quantidade, preco in itens]
+        caminho = caminho_recibo(venda_id, formato, diretorio)
+        try:
+            _gravar_recibo(caminho + ".tmp", formato, venda_id, dados_venda, itens_venda, modelo)
+            os.replace(caminho + ".tmp", caminho)
+            gerados += 1
+        except Exception as e:
+            falhas.append((venda_id, str(e)))
+    return gerados, falhas
+
+def regerar_recibos(vendas_com_itens, formato=None, diretorio=None, processos=None, substituir=False, progresso=None):
+    """Gera os recibos de vendas já gravadas (ex.: database.iterar_vendas_com_itens).
+
+    Recibos que já existem no diretório são pulados, a não ser com substituir=True;
+    impressoras não são acionadas. Os recibos são divididos em lotes de
+    RECIBOS_POR_LOTE gerados em `processos` processos (padrão: um por núcleo; 1
+    gera no processo atual), com no máximo 2 lotes por processo em andamento, então
+    as vendas são lidas do banco conforme os lotes são gerados.
+    `progresso(gerados, pulados)` é chamado a cada lote concluído.
+    Retorna (gerados, pulados, falhas).
+    """
+    formato = formato or FORMATO_RECIBO
+    if formato not in FORMATOS_RECIBO:
+        raise ValueError(f"Formato de recibo desconhecido: {formato}")
+    diretorio = diretorio or DIRETORIO_RECIBOS
+    os.makedirs(diretorio, exist_ok=True)
+    if processos is None:
+        processos = os.cpu_count() or 1
+    existentes = set() if substituir else set(os.listdir(diretorio)) # Uma listagem, não um stat por venda
+    gerados, pulados, falhas = 0, 0, []
+
+    def a_gerar():
+        nonlocal pulados
+        for venda, itens in vendas_com_itens:
+            if os.path.basename(caminho_recibo(venda[0], formato, diretorio)) in existentes:
+                pulados += 1
+            else:
+                yield venda, itens
+
+    def receber(resultado):
+        nonlocal gerados
+        gerados += resultado[0]
+        falhas.extend(resultado[1])
+        if progresso:
+            progresso(gerados, pulados)
+
+    iterador = a_gerar()
+    lotes = iter(lambda: list(itertools.islice(iterador, RECIBOS_POR_LOTE)), [])
+    if processos <= 1:
+        for lote in lotes:
+            receber(_gerar_lote_recibos(lote, formato, diretorio))
+        return gerados, pulados, falhas
+    pendentes = deque()
+    # "spawn", como nos relatórios em PDF: fork a partir de um processo com threads não é seguro
+    pool = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for lote in lotes:
+            pendentes.append(pool.submit(_gerar_lote_recibos, lote, formato, diretorio))
+            while len(pendentes) >= 2 * processos:
+                receber(pendentes.popleft().result())
+        while pendentes:
+            receber(pendentes.popleft().result())
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return gerados, pulados, falhas
+
 # Exemplo de uso (para teste, executando recibo.py diretamente)
 if __name__ == '__main__':
     # Mock data
@@ -137,33 +444,14 @@ if __name__ == '__main__':
     }
     itens_venda_teste = [
         {"nome": "Produto A", "quantidade": 2, "preco": 25.00},
-        {"nome": "Produto B Com Nome Muito Longo Para Caber Na Célula", "quantidade": 1, "preco": 50.00},
+        {"nome": "Produto B Com Nome Muito Longo Para Caber Na Célula De Produto Do Recibo", "quantidade": 1, "preco": 50.00},
         {"nome": "Produto C", "quantidade": 5, "preco": 10.00}
     ]
 
     # Salvar na pasta 'recibos_teste' no mesmo diretório do script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    diretorio_teste = os.path.join(script_dir, "recibos_teste")
-    os.makedirs(diretorio_teste, exist_ok=True)
-    caminho_teste = os.path.join(diretorio_teste, f"recibo_teste_{venda_id_teste}.pdf")
-
-    print(f"Tentando salvar recibo de teste em: {caminho_teste}")
-
-    # Gerar o PDF de teste
-    pdf_teste = PDFRecibo()
-    pdf_teste.alias_nb_pages()
-    pdf_teste.add_page()
-    if pdf_teste.supports_utf8:
-        pdf_teste.set_font(pdf_teste.font_name, "", 12)
-    else:
-        pdf_teste.set_font("Arial", "", 12)
-    pdf_teste.cell(0, 10, pdf_teste._encode_str(f"Recibo de TESTE - Venda ID: {venda_id_teste}"), new_x="LMARGIN", new_y="NEXT")
-    # Adicionar mais detalhes se necessário para o teste...
-    pdf_teste.cell(0, 10, pdf_teste._encode_str("Este é um arquivo de teste gerado executando recibo.py diretamente."), new_x="LMARGIN", new_y="NEXT")
-
-    try:
-        pdf_teste.output(caminho_teste, "F")
-        print(f"Recibo de teste gerado com sucesso em: {caminho_teste}")
-    except Exception as e:
-        print(f"Falha ao gerar recibo de teste: {e}")
-
+    diretorio_teste = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recibos_teste")
+    print(f"Tentando salvar recibos de teste em: {diretorio_teste}")
+    for formato in FORMATOS_RECIBO:
+        caminho_teste = gerar_recibo(venda_id_teste, dados_venda_teste, itens_venda_teste, formato, diretorio_teste)
+        print(f"{formato}: {caminho_teste or 'falhou'}")
+    print(gerar_recibo_texto(venda_id_teste, dados_venda_teste, itens_venda_teste))
@@ -1,19 +1,183 @@
 # -*- coding: utf-8 -*-
 from fpdf import FPDF
+import bisect
 import openpyxl
-from openpyxl.styles import Font, Alignment
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, NamedStyle
 from openpyxl.utils import get_column_letter
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import datetime
+import itertools
+import multiprocessing
 import os # Importar os para verificar a fonte
 
+INTERVALO_PROGRESSO = 200 # Linhas entre duas chamadas do callback de progresso
+AMOSTRA_LARGURAS = 1000 # Linhas lidas antes de escrever, para calcular as larguras das colunas
+LARGURA_MAXIMA_COLUNA = 60 # Em caracteres
+ALTURA_LINHA_PDF = 6 # mm
+LINHAS_PDF_PARALELO = 20000 # A partir daqui o PDF é gerado em vários processos (se houver mais de um núcleo)
+PAGINAS_POR_BLOCO = 50 # Páginas que cada processo gera por vez
+
+# Estilo nomeado do Excel para cada tipo de valor (textos ficam com o estilo padrão)
+ESTILOS_POR_TIPO = {
+    float: "relatorio_decimal",
+    int: "relatorio_inteiro",
+    datetime.datetime: "relatorio_data_hora",
+    datetime.date: "relatorio_data",
+}
+
+def _preparar_linhas(dados):
+    """Retorna (linhas, total) para uma lista ou um gerador de linhas.
+
+    `total` é None quando não se sabe o tamanho (gerador), e `linhas` é None se não
+    houver nenhuma. Geradores são lidos uma única vez, à medida que o arquivo é escrito.
+    """
+    if hasattr(dados, "__len__"):
+        return (dados if len(dados) else None), len(dados)
+    iterador = iter(dados)
+    primeira = next(iterador, None)
+    if primeira is None:
+        return None, 0
+    return itertools.chain([primeira], iterador), None
+
+def _normalizar_chave(texto):
+    return str(texto).strip().lower().replace("_", "").replace(" ", "")
+
+def _extrator_valores(colunas, primeira_linha):
+    """Função linha -> tupla de valores na ordem de `colunas`, resolvida uma vez por relatório.
+
+    Tuplas são posicionais. Em dicts, cada coluna é ligada à chave de mesmo nome
+    (ignorando maiúsculas, espaços e "_") ou, se não houver, à chave na mesma
+    posição (a ordem do SELECT segue a ordem das colunas de tela).
+    """
+    num_cols = len(colunas)
+    if not isinstance(primeira_linha, dict):
+        return lambda linha: tuple(linha[:num_cols]) + (None,) * (num_cols - len(linha))
+    chaves_linha = list(primeira_linha)
+    por_nome = {_normalizar_chave(chave): chave for chave in chaves_linha}
+    chaves = [por_nome.get(_normalizar_chave(col), chaves_linha[i] if i < len(chaves_linha) else None)
+              for i, col in enumerate(colunas)]
+    return lambda linha: tuple(linha.get(chave) for chave in chaves)
+
+def _texto_pdf(valor):
+    """Texto de uma célula do PDF."""
+    if isinstance(valor, float):
+        return f"R$ {valor:.2f}"
+    elif isinstance(valor, datetime.datetime):
+        return valor.strftime("%d/%m/%Y %H:%M:%S")
+    elif isinstance(valor, datetime.date):
+        return valor.strftime("%d/%m/%Y")
+    return str(valor if valor is not None else "")
+
+class _LargurasFonte(dict):
+    """Largura (na unidade do PDF) de cada caractere numa fonte/tamanho, calculada uma vez por caractere."""
+
+    def __init__(self, fonte, tamanho, unicode):
+        super().__init__()
+        self.cw = fonte["cw"]
+        self.escala = tamanho / 1000.0
+        self.unicode = unicode
+        self.ausente = fonte.get("desc", {}).get("MissingWidth") or 500 # Como em FPDF.get_string_width
+
+    def __missing__(self, caractere):
+        if self.unicode:
+            codigo = ord(caractere)
+            largura = self.cw[codigo] if codigo < len(self.cw) else self.ausente
+        else:
+            largura = self.cw.get(caractere, 0)
+        self[caractere] = largura * self.escala
+        return self[caractere]
+
+class _BufferPDF:
+    """Substitui a string FPDF.buffer, onde o FPDF monta o arquivo final.
+
+    O FPDF faz `self.buffer += texto` a cada objeto gravado; como o buffer é um
+    atributo, cada concatenação copia o PDF inteiro (tempo quadrático em relatórios
+    com milhares de páginas). Aqui as partes vão para uma lista e são unidas só no fim.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.tamanho = 0
+
+    def __iadd__(self, texto):
+        self.partes.append(texto)
+        self.tamanho += len(texto)
+        return self
+
+    def __len__(self): # O FPDF usa len(buffer) como posição de cada objeto no arquivo
+        return self.tamanho
+
+    def __str__(self):
+        return "".join(self.partes)
+
+    def encode(self, *args):
+        return str(self).encode(*args)
+
 class PDFRelatorio(FPDF):
-    def __init__(self, orientation="P", unit="mm", format="A4", titulo="Relatório"):
+    def __init__(self, orientation="P", unit="mm", format="A4", titulo="Relatório", gerado_em=None, primeira_pagina=1):
         super().__init__(orientation, unit, format)
+        self.buffer = _BufferPDF()
         self.titulo_relatorio = titulo
+        self.gerado_em = gerado_em or datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        self.primeira_pagina = primeira_pagina # Número da primeira página (partes geradas em paralelo)
+        # Registra as fontes sempre na mesma ordem: o conteúdo das páginas se refere a
+        # elas por número (/F1, /F2...), e páginas de processos diferentes são juntadas
+        self.set_font("Arial", "B")
+        self.set_font("Arial", "I")
         # Usar fonte padrão Arial para maior portabilidade
         self.set_font("Arial", size=10)
         # Assumir que a fonte padrão pode não suportar UTF-8 completamente sem configuração adicional
         self.supports_utf8 = False
+        self._tabelas_largura = {} # (família, estilo, tamanho) -> _LargurasFonte
+        self._layout_tabela = None # (cabeçalhos, larguras): repetido no topo de cada página
+
+    def _larguras(self):
+        """Tabela de larguras de caracteres da fonte atual (em cache)."""
+        chave = (self.font_family, self.font_style, self.font_size)
+        tabela = self._tabelas_largura.get(chave)
+        if tabela is None:
+            tabela = self._tabelas_largura[chave] = _LargurasFonte(self.current_font, self.font_size,
+                                                                   bool(self.unifontsubset))
+        return tabela
+
+    def _truncar(self, texto, largura_max, larguras):
+        """Corta `texto` (com "...") para caber em `largura_max`; o ponto de corte é achado por busca binária."""
+        acumuladas = list(itertools.accumulate(map(larguras.__getitem__, texto)))
+        if not acumuladas or acumuladas[-1] <= largura_max:
+            return texto
+        corte = bisect.bisect_right(acumuladas, largura_max - 3 * larguras["."])
+        return texto[:corte] + "..."
+
+    def _linha_tabela(self, textos, larguras_col, altura, fill):
+        """Uma linha da tabela (bordas, fundo e texto à esquerda) gravada de uma vez.
+
+        Produz o mesmo conteúdo que uma chamada de cell(..., 1, 0, "L", fill) por
+        coluna, sem o custo de cell() por célula. Fontes Unicode usam cell().
+        """
+        if self.y + altura > self.page_break_trigger and not self.in_footer and self.accept_page_break():
+            self.add_page(self.cur_orientation)
+        if self.unifontsubset:
+            for texto, largura in zip(textos, larguras_col):
+                self.cell(largura, altura, texto, 1, 0, "L", fill)
+            self.ln()
+            return
+        k, x = self.k, self.x
+        topo = (self.h - self.y) * k
+        base_texto = (self.h - (self.y + .5 * altura + .3 * self.font_size)) * k
+        operacao = "B" if fill else "S"
+        partes = []
+        for texto, largura in zip(textos, larguras_col):
+            partes.append(f"{x * k:.2f} {topo:.2f} {largura * k:.2f} {-altura * k:.2f} re {operacao}")
+            if texto:
+                texto_pdf = f"BT {(x + self.c_margin) * k:.2f} {base_texto:.2f} Td ({self._escape(texto)}) Tj ET"
+                partes.append(f"q {self.text_color} {texto_pdf} Q" if self.color_flag else texto_pdf)
+            x += largura
+        self._out(" ".join(partes))
+        self.lasth = altura
+        self.x = self.l_margin
+        self.y += altura
 
     def _encode_str(self, text):
         """Codifica a string para Latin-1 se UTF-8 não for suportado."""
@@ -33,9 +197,11 @@ class PDFRelatorio(FPDF):
             self.set_font(self.font_name, "I", 8)
         else:
             self.set_font("Arial", "I", 8)
-        gerado_em = f"Gerado em: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+        gerado_em = f"Gerado em: {self.gerado_em}"
         self.cell(0, 5, self._encode_str(gerado_em), 0, 1, "C")
         self.ln(5)
+        if self._layout_tabela:
+            self._cabecalho_tabela()
 
     def footer(self):
         self.set_y(-15)
@@ -43,7 +209,7 @@ class PDFRelatorio(FPDF):
             self.set_font(self.font_name, "I", 8)
         else:
             self.set_font("Arial", "I", 8)
-        pagina_str = f"Página {self.page_no()}/{{nb}}"
+        pagina_str = f"Página {self.page_no() + self.primeira_pagina - 1}/{{nb}}"
         self.cell(0, 10, self._encode_str(pagina_str), 0, 0, "C")
 
     def chapter_title(self, title):
@@ -54,87 +220,206 @@ class PDFRelatorio(FPDF):
         self.cell(0, 6, self._encode_str(title), 0, 1, "L")
         self.ln(4)
 
-    def chapter_body(self, colunas, dados):
-        if not dados or not colunas:
-            if self.supports_utf8:
-                self.set_font(self.font_name, "I", 10)
-            else:
-                self.set_font("Arial", "I", 10)
-            self.cell(0, 10, self._encode_str("Nenhum dado encontrado para este relatório."), 0, 1)
-            return
+    def _fontes_tabela(self):
+        familia = self.font_name if self.supports_utf8 else "Arial"
+        return (familia, "B", 9), (familia, "", 8) # Cabeçalho, dados
+
+    def _textos(self, valores):
+        return [self._encode_str(_texto_pdf(valor)) for valor in valores]
 
-        # Calcular larguras das colunas (distribuição simples)
-        num_cols = len(colunas)
+    def layout_tabela(self, colunas, amostra):
+        """Cabeçalhos e larguras das colunas, proporcionais ao conteúdo de `amostra` (tuplas de valores).
+
+        Usa o percentil 90 de cada coluna, para um valor muito longo não roubar a
+        largura das outras.
+        """
+        fonte_cabecalho, fonte_dados = self._fontes_tabela()
+        cabecalhos = [self._encode_str(str(col)) for col in colunas]
+        self.set_font(*fonte_cabecalho)
+        larguras_cabecalho = self._larguras()
+        naturais = [sum(map(larguras_cabecalho.__getitem__, cab)) for cab in cabecalhos]
+        self.set_font(*fonte_dados)
+        larguras_dados = self._larguras()
+        textos_amostra = [self._textos(valores) for valores in amostra]
+        for i in range(len(colunas)):
+            medidas = sorted(sum(map(larguras_dados.__getitem__, textos[i])) for textos in textos_amostra)
+            if medidas:
+                naturais[i] = max(naturais[i], medidas[int(len(medidas) * 0.9)])
+            naturais[i] += 2 * self.c_margin
         largura_util = self.w - 2 * self.l_margin
-        largura_col = largura_util / num_cols
+        return cabecalhos, [largura_util * natural / sum(naturais) for natural in naturais]
 
-        # Cabeçalho da Tabela
-        if self.supports_utf8:
-            self.set_font(self.font_name, "B", 9)
-        else:
-            self.set_font("Arial", "B", 9)
+    def _cabecalho_tabela(self):
+        cabecalhos, larguras_col = self._layout_tabela
+        self.set_font(*self._fontes_tabela()[0])
         self.set_fill_color(200, 220, 255) # Azul claro
-        for i, col in enumerate(colunas):
-            self.cell(largura_col, 7, self._encode_str(str(col)), 1, 0, "C", 1)
+        larguras_cabecalho = self._larguras()
+        for largura, cab in zip(larguras_col, cabecalhos):
+            self.cell(largura, 7, self._truncar(cab, largura - 2, larguras_cabecalho), 1, 0, "C", 1)
         self.ln()
 
-        # Dados da Tabela
-        if self.supports_utf8:
-            self.set_font(self.font_name, "", 8)
-        else:
-            self.set_font("Arial", "", 8)
+    def iniciar_tabela(self, layout):
+        """Desenha o cabeçalho da tabela na página atual e o repete nas próximas.
+
+        Retorna quantas linhas de dados cabem em cada página: com o cabeçalho
+        repetido, todas as páginas têm o mesmo número de linhas.
+        """
+        self._layout_tabela = layout
+        self._cabecalho_tabela()
+        return int((self.page_break_trigger - self.y) / ALTURA_LINHA_PDF + 1e-6)
+
+    def linhas_tabela(self, linhas_valores, linhas_por_pagina, progresso=None, total_linhas=None):
+        """Desenha as linhas (tuplas de valores) a partir da página atual, quebrando a cada `linhas_por_pagina`."""
+        _, larguras_col = self._layout_tabela
+        self.set_font(*self._fontes_tabela()[1])
         self.set_fill_color(255, 255, 255)
+        larguras_dados = self._larguras()
+        limites = [largura - 2 for largura in larguras_col]
         fill = False
-        for linha in dados:
-            # Usar as colunas fornecidas para garantir a ordem e extrair valores
-            for i, col_key in enumerate(colunas):
-                valor = linha.get(col_key) # Tenta pegar pela chave exata
-                # Se a chave não existir (ex: 'Total Vendido' vs 'total_vendido'), tentar case-insensitive ou por índice?
-                # Por simplicidade, vamos assumir que as chaves em 'dados' correspondem a 'colunas'
-                if valor is None:
-                     # Tentar encontrar chave ignorando case/underline?
-                     found = False
-                     for k, v in linha.items():
-                         if str(k).strip().lower().replace("_","") == str(col_key).strip().lower().replace("_",""):
-                             valor = v
-                             found = True
-                             break
-                     if not found:
-                         valor = "N/A" # Valor padrão se não encontrar
-
-                # Formatar valores específicos
-                if isinstance(valor, float):
-                    texto_celula = f"R$ {valor:.2f}"
-                elif isinstance(valor, datetime.datetime):
-                    texto_celula = valor.strftime("%d/%m/%Y %H:%M:%S")
-                elif isinstance(valor, datetime.date):
-                    texto_celula = valor.strftime("%d/%m/%Y")
-                else:
-                    texto_celula = str(valor if valor is not None else "")
-
-                # Truncar texto se for muito longo
-                texto_encoded_para_largura = self._encode_str(texto_celula)
-                if self.get_string_width(texto_encoded_para_largura) > largura_col - 2:
-                    while self.get_string_width(self._encode_str(texto_celula + "...")) > largura_col - 2 and len(texto_celula) > 0:
-                        texto_celula = texto_celula[:-1]
-                    texto_celula += "..."
-
-                texto_final_encoded = self._encode_str(texto_celula)
-                self.cell(largura_col, 6, texto_final_encoded, 1, 0, "L", fill)
-            self.ln()
+        for num_linha, valores in enumerate(linhas_valores):
+            if progresso and num_linha % INTERVALO_PROGRESSO == 0:
+                progresso(num_linha, total_linhas, "Gerando PDF")
+            if num_linha and num_linha % linhas_por_pagina == 0:
+                self.add_page(self.cur_orientation)
+            textos = [self._truncar(texto, limite, larguras_dados) for texto, limite in zip(self._textos(valores), limites)]
+            self._linha_tabela(textos, larguras_col, ALTURA_LINHA_PDF, fill)
             fill = not fill
 
-def exportar_para_pdf(titulo, colunas, dados, nome_arquivo):
-    """Exporta os dados de um relatório para um arquivo PDF."""
+    def nenhum_dado(self):
+        if self.supports_utf8:
+            self.set_font(self.font_name, "I", 10)
+        else:
+            self.set_font("Arial", "I", 10)
+        self.cell(0, 10, self._encode_str("Nenhum dado encontrado para este relatório."), 0, 1)
+
+    def chapter_body(self, colunas, dados, progresso=None):
+        """Tabela com `dados`: lista ou gerador de dicts ou de tuplas na ordem de `colunas`.
+
+        O mapeamento coluna -> valor é resolvido uma vez por relatório e as larguras
+        das colunas são proporcionais ao conteúdo das primeiras AMOSTRA_LARGURAS linhas.
+        """
+        dados, total_linhas = _preparar_linhas(dados)
+        if not dados or not colunas:
+            self.nenhum_dado()
+            return
+        iterador = iter(dados)
+        amostra = list(itertools.islice(iterador, AMOSTRA_LARGURAS))
+        valores_da_linha = _extrator_valores(colunas, amostra[0])
+        amostra = [valores_da_linha(linha) for linha in amostra]
+        linhas_por_pagina = self.iniciar_tabela(self.layout_tabela(colunas, amostra))
+        self.linhas_tabela(itertools.chain(amostra, map(valores_da_linha, iterador)), linhas_por_pagina,
+                           progresso, total_linhas)
+
+    def paginas_prontas(self):
+        """Fecha a última página (rodapé) e retorna o conteúdo de todas, para juntar em outro documento."""
+        self.in_footer = 1
+        self.footer()
+        self.in_footer = 0
+        self._endpage()
+        return [self.pages[n] for n in range(1, self.page + 1)]
+
+    def juntar_paginas(self, paginas):
+        """Acrescenta páginas prontas (de paginas_prontas()) sem cabeçalho/rodapé novos."""
+        for conteudo in paginas:
+            self._beginpage("")
+            self.pages[self.page] = conteudo
+            self._endpage()
+
+    def gravar(self, nome_arquivo):
+        """Grava o documento montado com juntar_paginas() (não gera rodapé extra como output())."""
+        self._enddoc()
+        with open(nome_arquivo, "wb") as arquivo:
+            arquivo.write(self.buffer.encode("latin1"))
+
+def _gerar_bloco_pdf(titulo, gerado_em, layout, linhas_por_pagina, linhas_valores, primeira_pagina):
+    """Gera, num processo do pool, as páginas de um bloco de linhas do relatório."""
+    pdf = PDFRelatorio(titulo=titulo, gerado_em=gerado_em, primeira_pagina=primeira_pagina)
+    pdf.add_page()
+    pdf.iniciar_tabela(layout)
+    pdf.linhas_tabela(linhas_valores, linhas_por_pagina)
+    return pdf.paginas_prontas()
+
+def _exportar_pdf_paralelo(pdf, linhas_valores, layout, linhas_por_pagina, nome_arquivo, processos,
+                           progresso=None, total_linhas=None):
+    """Divide as linhas em blocos de PAGINAS_POR_BLOCO páginas, gera cada bloco num processo e junta tudo em `pdf`.
+
+    Como todas as páginas têm o mesmo número de linhas, cada bloco sabe de antemão
+    o número da sua primeira página; o total ("Página X/Y") é preenchido no fim
+    pelo alias {nb} do documento final. No máximo 2 blocos por processo ficam em
+    andamento, então um gerador de linhas é lido conforme os blocos são gerados.
+    """
+    linhas_bloco = PAGINAS_POR_BLOCO * linhas_por_pagina
+    iterador = iter(linhas_valores)
+    pendentes = deque()
+    linhas_prontas = 0
+    # "spawn": criar processos por fork a partir do programa com Tk e threads não é seguro
+    pool = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        def receber_bloco():
+            nonlocal linhas_prontas
+            futuro, tamanho = pendentes.popleft()
+            pdf.juntar_paginas(futuro.result())
+            linhas_prontas += tamanho
+            if progresso:
+                progresso(linhas_prontas, total_linhas, "Gerando PDF")
+
+        for indice in itertools.count():
+            bloco = list(itertools.islice(iterador, linhas_bloco))
+            if not bloco:
+                break
+            futuro = pool.submit(_gerar_bloco_pdf, pdf.titulo_relatorio, pdf.gerado_em, layout, linhas_por_pagina,
+                                 bloco, indice * PAGINAS_POR_BLOCO + 1)
+            pendentes.append((futuro, len(bloco)))
+            while len(pendentes) >= 2 * processos:
+                receber_bloco()
+        while pendentes:
+            receber_bloco()
+    finally:
+        pool.shutdown(cancel_futures=True)
+    pdf.gravar(nome_arquivo)
+
+def exportar_para_pdf(titulo, colunas, dados, nome_arquivo, progresso=None, processos=None):
+    """Exporta os dados de um relatório para um arquivo PDF.
+
+    `dados` pode ser uma lista ou um gerador (ex.: database.iterar_*), de dicts ou
+    de tuplas na ordem de `colunas`. `progresso(atual, total, mensagem)`, se
+    informado, é chamado periodicamente durante a geração (ex.: Tarefa.progresso,
+    que também interrompe se cancelada); com gerador, `total` é None.
+
+    Relatórios com mais de LINHAS_PDF_PARALELO linhas são gerados em `processos`
+    processos (padrão: um por núcleo) e juntados num só arquivo; processos=1 força
+    a geração num único processo.
+    """
+    if processos is None:
+        processos = os.cpu_count() or 1
     try:
         pdf = PDFRelatorio(titulo=titulo)
         pdf.alias_nb_pages()
+        dados_preparados, total_linhas = _preparar_linhas(dados)
+        if processos > 1 and dados_preparados and colunas:
+            iterador = iter(dados_preparados)
+            inicio = list(itertools.islice(iterador, LINHAS_PDF_PARALELO + 1))
+            if len(inicio) > LINHAS_PDF_PARALELO:
+                valores_da_linha = _extrator_valores(colunas, inicio[0])
+                amostra = [valores_da_linha(linha) for linha in inicio[:AMOSTRA_LARGURAS]]
+                pdf.add_page() # Só para medir: as páginas vêm dos processos
+                layout = pdf.layout_tabela(colunas, amostra)
+                linhas_por_pagina = pdf.iniciar_tabela(layout)
+                pdf = PDFRelatorio(titulo=titulo, gerado_em=pdf.gerado_em)
+                pdf.alias_nb_pages()
+                linhas = map(valores_da_linha, itertools.chain(inicio, iterador))
+                _exportar_pdf_paralelo(pdf, linhas, layout, linhas_por_pagina, nome_arquivo, processos,
+                                       progresso, total_linhas)
+                return True
+            dados = dados_preparados = inicio # Pequeno: segue no processo atual
         pdf.add_page()
-        pdf.chapter_body(colunas, dados)
+        pdf.chapter_body(colunas, dados_preparados or (), progresso)
         pdf.output(nome_arquivo, "F")
         return True
     except Exception as e:
         print(f"Erro ao gerar PDF: {e}")
+        if iter(dados) is dados:
+            return False # Gerador já consumido em parte: não há como refazer o PDF
         # Tentar gerar sem fonte UTF-8 como fallback?
         try:
             pdf = PDFRelatorio(titulo=titulo)
@@ -142,7 +427,7 @@ def exportar_para_pdf(titulo, colunas, dados, nome_arquivo):
             pdf.set_font("Arial", size=10)
             pdf.alias_nb_pages()
             pdf.add_page()
-            pdf.chapter_body(colunas, dados)
+            pdf.chapter_body(colunas, dados, progresso)
             pdf.output(nome_arquivo, "F")
             print("PDF gerado com fonte Arial (fallback).")
             return True
@@ -150,72 +435,90 @@ def exportar_para_pdf(titulo, colunas, dados, nome_arquivo):
             print(f"Erro ao gerar PDF (fallback Arial): {e2}")
             return False
 
-def exportar_para_excel(titulo, colunas, dados, nome_arquivo):
-    """Exporta os dados de um relatório para um arquivo Excel (.xlsx)."""
+def _estilos_excel():
+    """Estilos nomeados dos relatórios (compartilhados por todas as células do arquivo)."""
+    direita, centro = Alignment(horizontal="right"), Alignment(horizontal="center")
+    return [
+        NamedStyle("relatorio_titulo", font=Font(bold=True, size=14), alignment=centro),
+        NamedStyle("relatorio_cabecalho", font=Font(bold=True), alignment=centro),
+        NamedStyle("relatorio_decimal", number_format="#,##0.00", alignment=direita),
+        NamedStyle("relatorio_inteiro", number_format="0", alignment=direita),
+        NamedStyle("relatorio_data_hora", number_format="dd/mm/yyyy hh:mm", alignment=centro),
+        NamedStyle("relatorio_data", number_format="dd/mm/yyyy", alignment=centro),
+    ]
+
+def _largura_texto(valor):
+    if isinstance(valor, float):
+        return len(f"{valor:,.2f}")
+    if isinstance(valor, datetime.datetime):
+        return 16
+    if isinstance(valor, datetime.date):
+        return 10
+    return len(str(valor))
+
+def exportar_para_excel(titulo, colunas, dados, nome_arquivo, progresso=None):
+    """Exporta os dados de um relatório para um arquivo Excel (.xlsx).
+
+    `dados` e `progresso(atual, total, mensagem)` funcionam como em exportar_para_pdf().
+    A planilha é gravada em modo write-only: cada linha vai direto para o arquivo,
+    então a memória não cresce com o tamanho do relatório. Como as larguras das
+    colunas precisam ser gravadas antes das linhas, elas são calculadas sobre o
+    cabeçalho e as primeiras AMOSTRA_LARGURAS linhas.
+    """
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = titulo[:31] # Limita o nome da aba
-
-        # Título do Relatório (mesclado)
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(colunas))
-        cell_titulo = ws.cell(row=1, column=1, value=titulo)
-        cell_titulo.font = Font(bold=True, size=14)
-        cell_titulo.alignment = Alignment(horizontal="center")
+        wb = openpyxl.Workbook(write_only=True)
+        for estilo in _estilos_excel():
+            wb.add_named_style(estilo)
+        ws = wb.create_sheet(title=titulo[:31]) # Limita o nome da aba
+
+        dados, total_linhas = _preparar_linhas(dados)
+        iterador = iter(dados or ())
+        amostra = list(itertools.islice(iterador, AMOSTRA_LARGURAS))
+        valores_da_linha = _extrator_valores(colunas, amostra[0]) if amostra else None
+        amostra = [valores_da_linha(linha) for linha in amostra]
+
+        # Larguras: cabeçalho + amostra (antes da primeira linha gravada)
+        larguras = [len(str(col)) for col in colunas]
+        for valores in amostra:
+            for i, valor in enumerate(valores):
+                if valor is not None:
+                    larguras[i] = max(larguras[i], _largura_texto(valor))
+        for col_idx, largura in enumerate(larguras, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = min(largura, LARGURA_MAXIMA_COLUNA) + 2
+
+        # Título do Relatório (mesclado) e cabeçalhos das colunas
         ws.row_dimensions[1].height = 20
+        cell_titulo = WriteOnlyCell(ws, value=titulo)
+        cell_titulo.style = "relatorio_titulo"
+        ws.append([cell_titulo])
+        ws.merged_cells.add(f"A1:{get_column_letter(len(colunas))}1")
+        ws.append([])
+        cabecalhos = []
+        for header in colunas:
+            cell_header = WriteOnlyCell(ws, value=header)
+            cell_header.style = "relatorio_cabecalho"
+            cabecalhos.append(cell_header)
+        ws.append(cabecalhos)
+
+        # Dados: uma célula com estilo por (coluna, tipo), reaproveitada em todas as
+        # linhas (o write-only grava a linha no append, antes do próximo valor)
+        celulas = {}
+        def celula(indice, valor):
+            estilo = ESTILOS_POR_TIPO.get(type(valor))
+            if estilo is None:
+                return valor # Texto/vazio: sem estilo, o valor puro é mais barato
+            cell = celulas.get((indice, estilo))
+            if cell is None:
+                cell = celulas[(indice, estilo)] = WriteOnlyCell(ws)
+                cell.style = estilo
+            cell.value = valor
+            return cell
 
-        # Cabeçalhos das Colunas
-        for col_idx, header in enumerate(colunas, 1):
-            cell_header = ws.cell(row=3, column=col_idx, value=header)
-            cell_header.font = Font(bold=True)
-            cell_header.alignment = Alignment(horizontal="center")
-
-        # Dados
-        row_num = 4
-        for linha_dict in dados:
-            col_num = 1
-            # Garantir que os dados sejam escritos na ordem das colunas
-            for col_key in colunas:
-                 valor = None
-                 # Tentar encontrar a chave exata ou com variações comuns
-                 possible_keys = [col_key, str(col_key).lower(), str(col_key).replace(" ", "_").lower()]
-                 for pk in possible_keys:
-                     if pk in linha_dict:
-                         valor = linha_dict[pk]
-                         break
-                 # Se ainda não achou, tentar pelo nome da coluna no dict (case insensitive)
-                 if valor is None:
-                     for key_dict, val_dict in linha_dict.items():
-                         if str(key_dict).strip().lower() == str(col_key).strip().lower():
-                             valor = val_dict
-                             break
-
-                 cell = ws.cell(row=row_num, column=col_num, value=valor)
-                 # Formatação básica
-                 if isinstance(valor, (int, float)):
-                     cell.number_format = "#,##0.00" if isinstance(valor, float) else "0"
-                     cell.alignment = Alignment(horizontal="right")
-                 elif isinstance(valor, (datetime.datetime, datetime.date)):
-                     cell.number_format = "dd/mm/yyyy hh:mm" if isinstance(valor, datetime.datetime) else "dd/mm/yyyy"
-                     cell.alignment = Alignment(horizontal="center")
-                 else:
-                     cell.alignment = Alignment(horizontal="left")
-                 col_num += 1
-            row_num += 1
-
-        # Ajustar largura das colunas
-        for col_idx, _ in enumerate(colunas, 1):
-            column_letter = get_column_letter(col_idx)
-            max_length = 0
-            column = ws[column_letter]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        linhas = itertools.chain(amostra, map(valores_da_linha, iterador))
+        for num_linha, valores in enumerate(linhas):
+            if progresso and num_linha % INTERVALO_PROGRESSO == 0:
+                progresso(num_linha, total_linhas, "Gerando Excel")
+            ws.append([celula(i, valor) for i, valor in enumerate(valores)])
 
         wb.save(nome_arquivo)
         return True
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""Servidor HTTP/JSON local: vários caixas compartilhando o mesmo banco da loja.
+
+Só este processo abre o loja.db; os caixas rodam main.py com LOJA_SERVIDOR
+apontando para cá (veja cliente.py). Uso:
+
+    python servidor.py [--host 0.0.0.0] [--porta 8765] [--trabalhadores 4] [--wal] [--banco loja.db]
+                       [--lote-vendas 64] [--espera-lote-ms 0]
+
+As vendas (registrar_venda) de todos os caixas são gravadas em commits em grupo
+pela FilaVendas do database.py; --lote-vendas 0 volta a uma transação por venda.
+
+API (corpo e resposta em JSON; com LOJA_TOKEN definido, o cabeçalho X-Loja-Token é exigido):
+
+    GET  /api/saude                  -> {"versao_esquema": <versão das migrações>, "pendentes": 0}
+    POST /api/<funcao>               {"args": [...], "kwargs": {...}} -> {"resultado": ...}
+    POST /api/lote                   {"chamadas": [{"funcao": ..., "args": [...], "kwargs": {...}}, ...]}
+                                     -> {"resultados": [...], "erros": [null | "mensagem", ...]}
+
+`funcao` é uma das funções do database.py listadas em FUNCOES_API. Erros de
+validação (ValueError, ex.: estoque insuficiente) voltam com status 422 e
+"tipo": "ValueError", para o cliente relançar a mesma exceção.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8765
+TOKEN = os.environ.get("LOJA_TOKEN", "") # Vazio: sem autenticação (apenas para uso em localhost)
+TRABALHADORES = 4 # Threads (e conexões de leitura do pool) que executam as chamadas ao banco
+LIMITE_FILA = 64 # Chamadas aceitas além das em execução; acima disso o servidor responde 503
+TAMANHO_MAXIMO_CORPO = 8 * 2**20 # Bytes
+TEMPO_OCIOSO = 60.0 # Segundos sem requisição antes de fechar uma conexão keep-alive
+LIMITE_LOTE = 500 # Chamadas por requisição /api/lote
+
+# Funções do database.py expostas pela API: nome -> True se escreve no banco
+FUNCOES_API = {
+    "versao_esquema": False,
+    "autenticar_usuario": False,
+    "versao_catalogo": False,
+    "produtos_alterados_desde": False,
+    "buscar_produtos_por_ids": False,
+    "listar_produtos": False,
+    "buscar_produto_por_id": False,
+    "buscar_produto_por_codigo_barras": False,
+    "obter_estoque_atual": False,
+    "estoque_em": False,
+    "obter_posicao_estoque": False,
+    "obter_vendas_por_periodo": False,
+    "pagina_vendas_por_periodo": False,
+    "obter_itens_venda": False,
+    "obter_itens_vendas": False,
+    "obter_itens_vendas_por_periodo": False,
+    "pagina_vendas_itens_por_periodo": False,
+    "obter_produtos_mais_vendidos": False,
+    "obter_totais_periodo": False,
+    "obter_movimentacoes_estoque": False,
+    "pagina_movimentacoes_estoque": False,
+    "obter_conflitos_estoque": False,
+    "obter_historico_precos": False,
+    "listar_fornecedores": False,
+    "simular_reajuste": False,
+    "adicionar_produto": True,
+    "atualizar_produto": True,
+    "excluir_produto": True,
+    "registrar_venda": True,
+    "registrar_movimentacao_estoque": True,
+    "importar_vendas": True, # Diários dos caixas (diario.py)
+    "importar_produtos": True, # Planilhas de produtos (importacao.py)
+    "aplicar_reajuste": True,
+}
+
+STATUS_HTTP = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+class ErroRequisicao(Exception):
+    """Requisição inválida: vira uma resposta com o `status` dado."""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+def _json_padrao(valor):
+    # produtos_alterados_desde() retorna um set de ids
+    if isinstance(valor, (set, frozenset)):
+        return sorted(valor)
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def codificar(dados):
+    return json.dumps(dados, ensure_ascii=False, default=_json_padrao).encode("utf-8")
+
+def _validar_chamada(chamada):
+    """Confere uma chamada {"funcao", "args", "kwargs"} e retorna (funcao, args, kwargs, escrita)."""
+    if not isinstance(chamada, dict):
+        raise ErroRequisicao(400, "Chamada deve ser um objeto JSON")
+    nome = chamada.get("funcao")
+    if nome not in FUNCOES_API:
+        raise ErroRequisicao(404, f"Função desconhecida: {nome}")
+    args = chamada.get("args") or []
+    kwargs = chamada.get("kwargs") or {}
+    if not isinstance(args, list) or not isinstance(kwargs, dict):
+        raise ErroRequisicao(400, "'args' deve ser uma lista e 'kwargs' um objeto")
+    return nome, args, kwargs, FUNCOES_API[nome]
+
+def executar_chamada(nome, args, kwargs):
+    """Roda uma função do database.py numa thread de trabalho. Retorna (status, corpo em JSON)."""
+    try:
+        return 200, codificar({"resultado": getattr(db, nome)(*args, **kwargs)})
+    except ValueError as e:
+        return 422, codificar({"erro": str(e), "tipo": "ValueError"})
+    except TypeError as e: # Argumentos que não batem com a assinatura
+        return 400, codificar({"erro": f"{nome}: {e}"})
+    except Exception as e:
+        print(f"Erro ao executar {nome}: {e}")
+        return 500, codificar({"erro": f"{nome}: {e}"})
+
+def executar_lote(chamadas):
+    """Roda várias chamadas em sequência, na mesma thread de trabalho (uma ida ao pool).
+
+    Cada chamada continua com sua própria transação: uma falha não desfaz as anteriores.
+    """
+    resultados, erros = [], []
+    for nome, args, kwargs, _ in chamadas:
+        try:
+            resultados.append(getattr(db, nome)(*args, **kwargs))
+            erros.append(None)
+        except Exception as e:
+            print(f"Erro ao executar {nome} (lote): {e}")
+            resultados.append(None)
+            erros.append(f"{nome}: {e}")
+    return 200, codificar({"resultados": resultados, "erros": erros})
+
+class ServidorLoja:
+    """Servidor asyncio que atende a API e executa as chamadas num pool limitado de threads.
+
+    O loop só lê e escreve HTTP; cada chamada ao banco (e a codificação do JSON da
+    resposta) vai para um ThreadPoolExecutor de `trabalhadores` threads, então o
+    número de conexões SQLite é fixo. Até `limite_fila` chamadas esperam por uma
+    thread; além disso a resposta é 503 e o cliente tenta de novo.
+
+    Leituras idênticas que chegam enquanto uma igual ainda está em execução não
+    vão ao banco: esperam e recebem a mesma resposta (ex.: vários caixas pedindo
+    versao_catalogo() ou o mesmo relatório). Para não devolver um dado anterior a
+    uma gravação já confirmada, só se juntam leituras admitidas depois do mesmo
+    número de gravações concluídas.
+    """
+
+    def __init__(self, host=HOST_PADRAO, porta=PORTA_PADRAO, trabalhadores=TRABALHADORES,
+                 limite_fila=LIMITE_FILA, token=TOKEN):
+        self.host = host
+        self.porta = porta
+        self.trabalhadores = trabalhadores
+        self.limite_fila = limite_fila
+        self.token = token
+        self._pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="banco")
+        self._pendentes = 0 # Chamadas ao pool em execução ou na fila
+        self._em_andamento = {} # Leituras em execução: chave -> Future com (status, corpo)
+        self._gravacoes = 0 # Gravações concluídas (geração usada na chave das leituras)
+        self._servidor = None
+        self.estatisticas = {"requisicoes": 0, "chamadas": 0, "lotes": 0, "leituras_agrupadas": 0, "recusadas": 0}
+
+    async def iniciar(self):
+        """Abre a porta (com porta=0, o sistema escolhe uma livre e self.porta é atualizado)."""
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        return self._servidor
+
+    async def servir(self):
+        if self._servidor is None:
+            await self.iniciar()
+        loop = asyncio.get_running_loop()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sinal, self.encerrar)
+            except (NotImplementedError, RuntimeError): # Windows: Ctrl+C chega como KeyboardInterrupt
+                pass
+        print(f"Servidor da loja em http://{self.host}:{self.porta} ({self.trabalhadores} trabalhadores, banco {db.DATABASE})")
+        try:
+            async with self._servidor:
+                await self._servidor.serve_forever()
+        except asyncio.CancelledError:
+            pass # encerrar()
+        finally:
+            self._pool.shutdown(wait=True) # Chamadas em execução (ex.: uma venda) terminam antes de sair
+
+    def encerrar(self):
+        """Para de aceitar conexões; servir() retorna depois que as chamadas em execução terminam."""
+        if self._servidor is not None:
+            self._servidor.close()
+
+    # --- HTTP ---
+
+    async def _atender(self, reader, writer):
+        try:
+            while True:
+                try:
+                    linha = await asyncio.wait_for(reader.readline(), TEMPO_OCIOSO)
+                except asyncio.TimeoutError:
+                    break
+                if not linha:
+                    break
+                manter = True
+                try:
+                    metodo, caminho, versao = linha.decode("latin-1").split()
+                    cabecalhos = await self._ler_cabecalhos(reader)
+                    manter = versao == "HTTP/1.1" and cabecalhos.get("connection", "").lower() != "close"
+                    tamanho = int(cabecalhos.get("content-length") or 0)
+                    if tamanho > TAMANHO_MAXIMO_CORPO:
+                        manter = False # O corpo não será lido: a conexão não pode ser reaproveitada
+                        raise ErroRequisicao(413, "Requisição grande demais")
+                    corpo = await reader.readexactly(tamanho) if tamanho else b""
+                    status, resposta = await self._despachar(metodo, caminho, cabecalhos, corpo)
+                except ErroRequisicao as e:
+                    status, resposta = e.status, codificar({"erro": str(e)})
+                except ValueError:
+                    status, resposta, manter = 400, codificar({"erro": "Requisição HTTP inválida"}), False
+                self.estatisticas["requisicoes"] += 1
+                writer.write(self._resposta_http(status, resposta, manter))
+                await writer.drain()
+                if not manter:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # Cliente desconectou no meio da requisição
+        finally:
+            writer.close()
+
+    async def _ler_cabecalhos(self, reader):
+        cabecalhos = {}
+        while True:
+            linha = await reader.readline()
+            if linha in (b"\r\n", b"\n", b""):
+                return cabecalhos
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip()
+
+    def _resposta_http(self, status, corpo, manter):
+        cabecalho = (f"HTTP/1.1 {status} {STATUS_HTTP.get(status, '')}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(corpo)}\r\n"
+                     f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n")
+        return cabecalho.encode("latin-1") + corpo
+
+    # --- Despacho ---
+
+    async def _despachar(self, metodo, caminho, cabecalhos, corpo):
+        if self.token and not hmac.compare_digest(cabecalhos.get("x-loja-token", ""), self.token):
+            raise ErroRequisicao(401, "Token inválido")
+        caminho = caminho.split("?", 1)[0].rstrip("/")
+        if caminho == "/api/saude":
+            return 200, codificar({"versao_esquema": await self._no_pool(db.versao_esquema),
+                                   "pendentes": self._pendentes})
+        if metodo != "POST":
+            raise ErroRequisicao(405, "Use POST")
+        if not caminho.startswith("/api/"):
+            raise ErroRequisicao(404, f"Caminho desconhecido: {caminho}")
+        try:
+            dados = json.loads(corpo or b"{}")
+        except ValueError:
+            raise ErroRequisicao(400, "Corpo JSON inválido")
+        if not isinstance(dados, dict):
+            raise ErroRequisicao(400, "Corpo deve ser um objeto JSON")
+
+        nome = caminho[len("/api/"):]
+        if nome == "lote":
+            chamadas = dados.get("chamadas")
+            if not isinstance(chamadas, list) or len(chamadas) > LIMITE_LOTE:
+                raise ErroRequisicao(400, f"'chamadas' deve ser uma lista de até {LIMITE_LOTE} chamadas")
+            chamadas = [_validar_chamada(chamada) for chamada in chamadas]
+            self.estatisticas["lotes"] += 1
+            self.estatisticas["chamadas"] += len(chamadas)
+            return await self._no_pool(executar_lote, chamadas,
+                                       escrita=any(escrita for *_, escrita in chamadas))
+
+        _, args, kwargs, escrita = _validar_chamada({**dados, "funcao": nome})
+        self.estatisticas["chamadas"] += 1
+        if nome == "registrar_venda" and db.fila_vendas() is not None:
+            return await self._venda_em_grupo(args, kwargs)
+        if escrita:
+            return await self._no_pool(executar_chamada, nome, args, kwargs, escrita=True)
+        return await self._leitura(nome, args, kwargs)
+
+    async def _leitura(self, nome, args, kwargs):
+        chave = (self._gravacoes, nome, json.dumps([args, kwargs], sort_keys=True))
+        futuro = self._em_andamento.get(chave)
+        if futuro is not None:
+            self.estatisticas["leituras_agrupadas"] += 1
+            return await asyncio.shield(futuro)
+        futuro = asyncio.get_running_loop().create_future()
+        self._em_andamento[chave] = futuro
+        try:
+            resultado = await self._no_pool(executar_chamada, nome, args, kwargs)
+            futuro.set_result(resultado)
+            return resultado
+        except BaseException as e:
+            futuro.set_exception(e)
+            futuro.exception() # Marca como lida: nem sempre há outra leitura esperando
+            raise
+        finally:
+            del self._em_andamento[chave]
+
+    async def _venda_em_grupo(self, args, kwargs):
+        """Venda pela FilaVendas: espera o commit em grupo sem ocupar uma thread do pool.
+
+        Assim o tamanho dos lotes não fica limitado ao número de trabalhadores.
+        """
+        self._admitir()
+        try:
+            try:
+                futuro = db.fila_vendas().enviar(*args, **kwargs)
+            except TypeError as e:
+                raise ErroRequisicao(400, f"registrar_venda: {e}")
+            try:
+                return 200, codificar({"resultado": await asyncio.wrap_future(futuro)})
+            except ValueError as e:
+                return 422, codificar({"erro": str(e), "tipo": "ValueError"})
+        finally:
+            self._pendentes -= 1
+            self._gravacoes += 1
+
+    def _admitir(self):
+        if self._pendentes >= self.trabalhadores + self.limite_fila:
+            self.estatisticas["recusadas"] += 1
+            raise ErroRequisicao(503, "Servidor ocupado, tente novamente")
+        self._pendentes += 1
+
+    async def _no_pool(self, funcao, *args, escrita=False):
+        self._admitir()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, funcao, *args)
+        finally:
+            self._pendentes -= 1
+            if escrita:
+                self._gravacoes += 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON do banco da loja")
+    parser.add_argument("--host", default=HOST_PADRAO, help="Use 0.0.0.0 para aceitar os caixas da rede")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--trabalhadores", type=int, default=TRABALHADORES)
+    parser.add_argument("--fila", type=int, default=LIMITE_FILA, help="Chamadas em espera antes de responder 503")
+    parser.add_argument("--wal", action="store_true", help="Abre o banco em modo WAL (leituras não esperam gravações)")
+    parser.add_argument("--lote-vendas", type=int, default=db.LOTE_VENDAS,
+                        help="Máximo de vendas por commit em grupo (0: uma transação por venda)")
+    parser.add_argument("--espera-lote-ms", type=float, default=db.ESPERA_LOTE_VENDAS * 1000,
+                        help="Quanto a primeira venda de um lote espera pelas seguintes")
+    parser.add_argument("--banco", help="Arquivo do banco (padrão: loja.db ao lado do programa)")
+    args = parser.parse_args()
+
+    if args.host not in ("127.0.0.1", "localhost") and not TOKEN:
+        print("Aviso: servidor aberto na rede sem LOJA_TOKEN; qualquer máquina da rede poderá usar a API.")
+    if args.banco or args.wal:
+        db.configurar_banco(args.banco, modo_wal=args.wal or None)
+    db.criar_tabelas()
+    if args.lote_vendas > 0:
+        db.iniciar_fila_vendas(args.lote_vendas, args.espera_lote_ms / 1000)
+    servidor = ServidorLoja(args.host, args.porta, args.trabalhadores, args.fila)
+    inicio = time.perf_counter()
+    try:
+        asyncio.run(servidor.servir())
+    except KeyboardInterrupt:
+        pass
+    fila = db.fila_vendas()
+    db.encerrar_fila_vendas() # Grava as vendas que ainda estavam na fila
+    print(f"Servidor encerrado após {time.perf_counter() - inicio:.0f} s: {servidor.estatisticas}"
+          + (f", vendas em grupo: {fila.estatisticas}" if fila else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+import tkinter as tk
+from tkinter import ttk
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+import sqlite3
+from collections import OrderedDict
+import cliente
+
+db = cliente.banco()
+
+INTERVALO_FILA_MS = 20 # Frequência com que a thread do Tk recolhe resultados das tarefas
+INTERVALO_PROGRESSO = 0.1 # Segundos mínimos entre duas notificações de progresso da mesma tarefa
+ATRASO_BUSCA_MS = 120 # Pausa na digitação antes de consultar o banco
+BUSCAS_LEMBRADAS = 8 # Resultados de buscas recentes reaproveitados por BuscaIncremental
+
+class TarefaCancelada(BaseException):
+    """Levantada dentro da tarefa quando ela é cancelada.
+
+    Deriva de BaseException para não ser engolida pelos `except Exception` das
+    funções de banco e de exportação chamadas pela tarefa.
+    """
+
+# --- Tarefas ---
+
+class Tarefa:
+    """Trabalho executado fora da thread do Tk.
+
+    A função da tarefa recebe a própria Tarefa como primeiro argumento e pode chamar
+    progresso() (que também verifica o cancelamento) durante laços demorados.
+    """
+
+    def __init__(self, executor, descricao, chave, ao_concluir, ao_falhar, ao_progredir, ao_finalizar):
+        self.executor = executor
+        self.descricao = descricao
+        self.chave = chave
+        self.ao_concluir = ao_concluir
+        self.ao_falhar = ao_falhar
+        self.ao_progredir = ao_progredir
+        self.ao_finalizar = ao_finalizar
+        self.atual = 0
+        self.total = None # None: progresso indeterminado
+        self.mensagem = ""
+        self._cancelada = threading.Event()
+        self._ultimo_progresso = 0.0
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def cancelar(self):
+        """Pede o cancelamento. Consultas SQLite em andamento são interrompidas."""
+        self._cancelada.set()
+
+    def verificar(self):
+        """Levanta TarefaCancelada se a tarefa foi cancelada (chamado na thread de trabalho)."""
+        if self._cancelada.is_set():
+            raise TarefaCancelada(self.descricao)
+
+    def progresso(self, atual, total=None, mensagem=""):
+        """Informa o progresso à interface (chamado na thread de trabalho)."""
+        self.verificar()
+        agora = time.monotonic()
+        if agora - self._ultimo_progresso < INTERVALO_PROGRESSO and atual != total:
+            return
+        self._ultimo_progresso = agora
+        self.executor._fila.put((self, "progresso", (atual, total, mensagem)))
+
+# --- Executor ---
+
+class ExecutorTarefas:
+    """Pool de threads para chamadas de banco e exportações fora do loop do Tk.
+
+    Os resultados voltam para a thread do Tk por uma fila lida com raiz.after(), então
+    os callbacks (ao_concluir, ao_falhar, ao_progredir, ao_finalizar) podem mexer nos
+    widgets livremente. Uma nova tarefa com a mesma `chave` cancela a anterior, cujo
+    resultado é descartado.
+    """
+
+    def __init__(self, raiz, max_threads=2):
+        self.raiz = raiz
+        self._pool = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="tarefa")
+        self._fila = queue.Queue()
+        self._ativas = []
+        self._por_chave = {}
+        self._agendado = None
+        self._ouvintes = []
+
+    def executar(self, funcao, *args, descricao="", chave=None, ao_concluir=None, ao_falhar=None,
+                 ao_progredir=None, ao_finalizar=None, **kwargs):
+        """Agenda funcao(tarefa, *args, **kwargs) no pool e retorna a Tarefa (chamar na thread do Tk)."""
+        if chave is not None and chave in self._por_chave:
+            self._por_chave[chave].cancelar()
+        tarefa = Tarefa(self, descricao, chave, ao_concluir, ao_falhar, ao_progredir, ao_finalizar)
+        self._ativas.append(tarefa)
+        if chave is not None:
+            self._por_chave[chave] = tarefa
+        self._pool.submit(self._rodar, tarefa, funcao, args, kwargs)
+        self._agendar()
+        self._notificar()
+        return tarefa
+
+    def tarefas_ativas(self):
+        return [tarefa for tarefa in self._ativas if not tarefa.cancelada]
+
+    def cancelar(self, chave):
+        """Cancela a tarefa em andamento com a `chave` dada, se houver."""
+        tarefa = self._por_chave.get(chave)
+        if tarefa is not None:
+            tarefa.cancelar()
+
+    def cancelar_todas(self):
+        for tarefa in self._ativas:
+            tarefa.cancelar()
+
+    def adicionar_ouvinte(self, ouvinte):
+        """`ouvinte()` é chamado na thread do Tk sempre que as tarefas ativas mudam."""
+        self._ouvintes.append(ouvinte)
+
+    def encerrar(self):
+        """Cancela as tarefas e libera as threads (ao fechar a janela)."""
+        self.cancelar_todas()
+        if self._agendado is not None:
+            try:
+                self.raiz.after_cancel(self._agendado)
+            except tk.TclError:
+                pass
+            self._agendado = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Internos ---
+
+    def _rodar(self, tarefa, funcao, args, kwargs):
+        # Thread de trabalho: nunca toca nos widgets, só publica na fila
+        if tarefa.cancelada:
+            self._fila.put((tarefa, "cancelada", None))
+            return
+        try:
+            with db.interrompivel(lambda: tarefa.cancelada):
+                resultado = funcao(tarefa, *args, **kwargs)
+            tarefa.verificar()
+            self._fila.put((tarefa, "concluida", resultado))
+        except TarefaCancelada:
+            self._fila.put((tarefa, "cancelada", None))
+        except sqlite3.OperationalError as e:
+            # Consulta interrompida pelo cancelamento
+            self._fila.put((tarefa, "cancelada" if tarefa.cancelada else "falhou", e))
+        except Exception as e:
+            self._fila.put((tarefa, "falhou", e))
+
+    def _agendar(self):
+        if self._agendado is None:
+            self._agendado = self.raiz.after(INTERVALO_FILA_MS, self._processar_fila)
+
+    def _processar_fila(self):
+        self._agendado = None
+        mudou = False
+        while True:
+            try:
+                tarefa, evento, valor = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if evento == "progresso":
+                tarefa.atual, tarefa.total, tarefa.mensagem = valor
+                if tarefa.ao_progredir and not tarefa.cancelada:
+                    self._chamar(tarefa.ao_progredir, *valor)
+                mudou = True
+                continue
+            self._finalizar(tarefa, evento, valor)
+            mudou = True
+        if mudou:
+            self._notificar()
+        if self._ativas:
+            self._agendar()
+
+    def _finalizar(self, tarefa, evento, valor):
+        self._ativas.remove(tarefa)
+        if self._por_chave.get(tarefa.chave) is tarefa:
+            del self._por_chave[tarefa.chave]
+        if tarefa.cancelada or evento == "cancelada":
+            if tarefa.descricao: # Buscas e atualizações silenciosas são canceladas o tempo todo
+                print(f"Tarefa cancelada: {tarefa.descricao}")
+        elif evento == "concluida":
+            if tarefa.ao_concluir:
+                self._chamar(tarefa.ao_concluir, valor)
+        elif tarefa.ao_falhar:
+            self._chamar(tarefa.ao_falhar, valor)
+        else:
+            print(f"Erro na tarefa '{tarefa.descricao}': {valor}")
+        if tarefa.ao_finalizar:
+            self._chamar(tarefa.ao_finalizar)
+
+    def _chamar(self, callback, *args):
+        # Um callback com erro não pode interromper o processamento da fila
+        try:
+            callback(*args)
+        except tk.TclError:
+            pass # Widget destruído enquanto a tarefa rodava
+        except Exception as e:
+            print(f"Erro no retorno da tarefa: {e}")
+
+    def _notificar(self):
+        for ouvinte in self._ouvintes:
+            self._chamar(ouvinte)
+
+# --- Painel de Progresso ---
+
+class PainelTarefas(ttk.Frame):
+    """Barra de status com a tarefa em andamento, progresso e botão Cancelar."""
+
+    def __init__(self, master, executor, **kw):
+        super().__init__(master, **kw)
+        self.executor = executor
+        self.lbl_status = ttk.Label(self, text="", anchor="w")
+        self.lbl_status.pack(side=tk.LEFT, fill="x", expand=True, padx=5)
+        self.btn_cancelar = ttk.Button(self, text="Cancelar", command=self.cancelar, state=tk.DISABLED)
+        self.btn_cancelar.pack(side=tk.RIGHT, padx=5)
+        self.barra = ttk.Progressbar(self, length=200, mode="determinate")
+        self.barra.pack(side=tk.RIGHT, padx=5)
+        self._indeterminada = False
+        executor.adicionar_ouvinte(self.atualizar)
+
+    def cancelar(self):
+        """Cancela as tarefas exibidas (as disparadas pelo usuário, com descrição)."""
+        for tarefa in self.executor.tarefas_ativas():
+            if tarefa.descricao:
+                tarefa.cancelar()
+        self.atualizar()
+
+    def atualizar(self):
+        tarefas = [tarefa for tarefa in self.executor.tarefas_ativas() if tarefa.descricao]
+        if not tarefas:
+            self._parar_animacao()
+            self.barra.configure(value=0)
+            self.lbl_status.configure(text="")
+            self.btn_cancelar.configure(state=tk.DISABLED)
+            return
+
+        tarefa = tarefas[-1] # Mostra a mais recente
+        texto = tarefa.descricao + (f" - {tarefa.mensagem}" if tarefa.mensagem else "")
+        if len(tarefas) > 1:
+            texto += f" (+{len(tarefas) - 1} em andamento)"
+        self.lbl_status.configure(text=texto)
+        self.btn_cancelar.configure(state=tk.NORMAL)
+        if tarefa.total:
+            self._parar_animacao()
+            self.barra.configure(maximum=tarefa.total, value=tarefa.atual)
+        elif not self._indeterminada:
+            self.barra.configure(mode="indeterminate")
+            self.barra.start(15)
+            self._indeterminada = True
+
+    def _parar_animacao(self):
+        if self._indeterminada:
+            self.barra.stop()
+            self.barra.configure(mode="determinate")
+            self._indeterminada = False
+
+# --- Busca Incremental ---
+
+class BuscaIncremental:
+    """Busca de produtos enquanto o usuário digita em um Entry.
+
+    Refinamentos de um termo recente (ex.: "arr" -> "arroz") são filtrados em memória
+    a partir do resultado anterior e exibidos na hora. Os demais termos vão ao banco
+    pelo executor depois de `atraso_ms` sem digitação; cada nova consulta cancela a
+    anterior. `exibir(produtos, versao)` recebe o resultado na thread do Tk.
+
+    A versão do catálogo que valida os resultados lembrados é a da última consulta
+    (ou a informada em atualizar_versao()): digitar não faz nenhuma chamada ao banco
+    na thread do Tk, o que no modo cliente seria uma requisição por tecla.
+    """
+
+    def __init__(self, entry, executor, exibir, chave, atraso_ms=ATRASO_BUSCA_MS, buscar_vazio=True):
+        self.entry = entry
+        self.executor = executor
+        self.exibir = exibir
+        self.chave = chave
+        self.atraso_ms = atraso_ms
+        self.buscar_vazio = buscar_vazio # False: apagar o texto só limpa a lista
+        self._agendado = None
+        self._termo_pedido = None
+        self._resultados = OrderedDict() # termo -> (versão do catálogo, produtos)
+        self._versao = None # Versão do catálogo mais recente conhecida
+        entry.bind("<KeyRelease>", lambda e: self._digitado(), add="+")
+
+    def atualizar_versao(self, versao):
+        """Informa uma versão mais nova do catálogo; resultados lembrados de antes dela deixam de valer."""
+        if versao is not None and (self._versao is None or versao > self._versao):
+            self._versao = versao
+
+    def buscar_agora(self):
+        """Busca o texto atual sem esperar (botão Buscar/Pesquisar)."""
+        self._cancelar_agendamento()
+        self._termo_pedido = self.entry.get().strip()
+        if not self._do_cache(self._termo_pedido):
+            self._consultar(self._termo_pedido)
+
+    def _digitado(self):
+        termo = self.entry.get().strip()
+        if termo == self._termo_pedido:
+            return # Tecla que não mudou o texto (setas, Shift...)
+        self._termo_pedido = termo
+        self._cancelar_agendamento()
+        if not termo and not self.buscar_vazio:
+            self.executor.cancelar(self.chave)
+            self._mostrar([], self._versao)
+            return
+        if not self._do_cache(termo):
+            self._agendado = self.entry.after(self.atraso_ms, self._consultar, termo)
+
+    def _cancelar_agendamento(self):
+        if self._agendado is not None:
+            self.entry.after_cancel(self._agendado)
+            self._agendado = None
+
+    def _do_cache(self, termo):
+        """Responde com um resultado lembrado (exato ou refinado). Retorna False se precisar do banco."""
+        versao = self._versao
+        if versao is None:
+            return False # Nenhuma consulta ainda
+        base = None
+        for anterior, (versao_anterior, produtos) in self._resultados.items():
+            if versao_anterior != versao or not termo.startswith(anterior):
+                continue
+            # Só um resultado completo (abaixo do limite da busca) contém todos os refinamentos
+            if anterior != termo and len(produtos) >= db.LIMITE_BUSCA:
+                continue
+            if base is None or len(anterior) > len(base[0]):
+                base = (anterior, produtos)
+        if base is None:
+            return False
+        produtos = base[1] if base[0] == termo else db.filtrar_produtos(base[1], termo)
+        self._lembrar(termo, versao, produtos)
+        self._mostrar(produtos, versao)
+        return True
+
+    def _consultar(self, termo):
+        self._agendado = None
+
+        def buscar(tarefa):
+            versao = db.versao_catalogo() # Lida antes da consulta
+            return versao, db.listar_produtos(termo)
+
+        def concluir(resultado):
+            versao, produtos = resultado
+            self._versao = versao # Lida pela consulta: vale mesmo se menor (servidor reiniciado)
+            self._lembrar(termo, versao, produtos)
+            if termo == self._termo_pedido: # Senão, um termo mais novo já foi respondido
+                self._mostrar(produtos, versao)
+
+        self.executor.executar(buscar, chave=self.chave, ao_concluir=concluir,
+                               ao_falhar=lambda e: print(f"Erro na busca '{termo}': {e}"))
+
+    def _lembrar(self, termo, versao, produtos):
+        self._resultados[termo] = (versao, produtos)
+        self._resultados.move_to_end(termo)
+        while len(self._resultados) > BUSCAS_LEMBRADAS:
+            self._resultados.popitem(last=False)
+
+    def _mostrar(self, produtos, versao):
+        try:
+            self.exibir(produtos, versao)
+        except tk.TclError:
+            pass # Widget destruído